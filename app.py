@@ -1,13 +1,19 @@
-﻿from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, Response, session, abort
+﻿from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, Response, make_response, session, abort, g, stream_with_context
 import json
+import re
 import hmac
 import hashlib
+import inspect
 import mysql.connector
+from mysql.connector import pooling as mysql_pooling
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import csv
-from io import StringIO
+from io import StringIO, TextIOWrapper
 from urllib.parse import urlparse
 import os
+import threading
+import time
 from config import Config
 from routes.reminder_routes import reminder_bp
 from routes.admin_routes import admin_bp
@@ -34,6 +40,7 @@ try:
     from utils.gmail_api import (
         send_email as gmail_send_email,
         send_email_html as gmail_send_email_html,
+        has_valid_token as gmail_has_valid_token,
     )
 except Exception:  # pragma: no cover - optional dependency not installed
     def gmail_send_email(*args, **kwargs):  # type: ignore
@@ -41,13 +48,31 @@ except Exception:  # pragma: no cover - optional dependency not installed
 
     def gmail_send_email_html(*args, **kwargs):  # type: ignore
         return False
+
+    def gmail_has_valid_token():  # type: ignore
+        return False
+# orjson is optional: faster serialization for the large JSON payloads
+try:
+    import orjson
+except Exception:  # pragma: no cover - optional dependency not installed
+    orjson = None
 from routes.mpesa_routes import mpesa_bp
 from routes.gmail_oauth_routes import gmail_oauth_bp
 from routes.student_auth import student_auth_bp
 from routes.student_portal import student_portal_bp
 from routes.student_auth import ensure_student_portal_columns
 from utils.security import hash_password
+from utils.schema import student_columns, clear_columns_cache, balance_column
 from utils.document_qr import build_document_qr
+# ReportLab for the receipt PDF hot path (loaded once, not per request)
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A5
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas as rl_canvas
+from reportlab.graphics import renderPDF as rl_renderPDF
+from reportlab.graphics.barcode import qr as rl_qr
+from reportlab.graphics.shapes import Drawing
 from routes.guardian_routes import guardian_bp
 from routes.newsletter_routes import newsletter_bp, ensure_newsletters_table
 from routes.insights_routes import insights_bp
@@ -58,7 +83,7 @@ from routes.defaulter_routes import recovery_bp
 from utils.settings import get_setting, set_school_setting
 from utils.users import ensure_user_tables
 from routes.ai_routes import ai_bp
-from utils.audit import log_event
+from utils.audit import log_event, ensure_audit_table
 from utils.ledger import ensure_ledger_table, add_entry
 from utils.db_helpers import ensure_guardian_receipts_table
 from utils.payment_proofs import format_status_label, notify_parent_about_proof
@@ -71,6 +96,8 @@ from utils.tenant import (
     slugify_code,
     bootstrap_new_school,
     ensure_unique_indices_per_school,
+    ensure_fulltext_students,
+    has_students_admission_unique,
 )
 from werkzeug.utils import secure_filename
 from werkzeug.exceptions import RequestEntityTooLarge
@@ -234,7 +261,6 @@ app.secret_key = app.config.get("SECRET_KEY", os.environ.get("SECRET_KEY", "secr
 # Assign a per-request correlation id for tracing
 try:
     import uuid
-    from flask import g
 
     @app.before_request
     def _assign_request_id():
@@ -303,6 +329,27 @@ def _shade_hex_color(hex_color: str, amount: float) -> str:
     return "#{:02x}{:02x}{:02x}".format(clamp(r + change), clamp(g + change), clamp(b + change))
 
 
+def _current_term(db):
+    """Return (year, term) for the active school, resolved once per request.
+
+    The context processor, dashboard, student and payment views all need the
+    current term, some of them more than once; caching on ``flask.g`` avoids
+    re-running the term resolution queries.
+    """
+    sid = session.get("school_id") if session else None
+    key = ("cur_term", sid)
+    cache = getattr(g, "_cache", None)
+    if cache is None:
+        cache = {}
+        g._cache = cache
+    value = cache.get(key)
+    if value is not None:
+        return value
+    value = get_or_seed_current_term(db)
+    cache[key] = value
+    return value
+
+
 @app.context_processor
 def inject_branding():
     # Resolve brand/app names with DB settings taking precedence over config defaults
@@ -336,40 +383,39 @@ def inject_branding():
         brand = default_brand_name
         portal_title = default_portal
     app_title = ((school_name or brand) + f" {portal_title}").strip()
-    # Resolve current academic term/year (best effort)
+    # Resolve current academic term/year and the per-school first login marker
+    # (welcome banner, only when authenticated) over a single connection.
     cy, ct = None, None
+    first_login_at = None
     try:
         _conn = get_db_connection()
         try:
-            cy, ct = get_or_seed_current_term(_conn)
+            try:
+                cy, ct = _current_term(_conn)
+            except Exception:
+                cy, ct = None, None
+            if show_school_profile:
+                try:
+                    cur = _conn.cursor()
+                    cur.execute("SELECT first_login_at, name FROM schools WHERE id=%s", (school_id,))
+                    row = cur.fetchone()
+                    if row is not None:
+                        try:
+                            first_login_at = row[0] if not isinstance(row, dict) else row.get("first_login_at")
+                        except Exception:
+                            first_login_at = None
+                        try:
+                            db_school_name = row[1] if not isinstance(row, dict) else row.get("name")
+                            if db_school_name:
+                                school_name = db_school_name
+                        except Exception:
+                            pass
+                except Exception:
+                    pass
         finally:
             _conn.close()
     except Exception:
         pass
-    # Per-school first login marker for welcome banner (only when authenticated)
-    first_login_at = None
-    if show_school_profile:
-        try:
-            _conn = get_db_connection()
-            try:
-                cur = _conn.cursor()
-                cur.execute("SELECT first_login_at, name FROM schools WHERE id=%s", (school_id,))
-                row = cur.fetchone()
-                if row is not None:
-                    try:
-                        first_login_at = row[0] if not isinstance(row, dict) else row.get("first_login_at")
-                    except Exception:
-                        first_login_at = None
-                    try:
-                        db_school_name = row[1] if not isinstance(row, dict) else row.get("name")
-                        if db_school_name:
-                            school_name = db_school_name
-                    except Exception:
-                        pass
-            finally:
-                _conn.close()
-        except Exception:
-            pass
     # Resolve per-school logo if uploaded
     school_logo_url = get_setting("SCHOOL_LOGO_URL") if show_school_profile else ""
     logo_primary = school_logo_url or app.config.get("LOGO_PRIMARY", "css/lovato_logo.jpg")
@@ -431,6 +477,27 @@ def inject_branding():
         "balance_class": _balance_class,
     }
 
+
+# Compiled templates for the payment hot path (receipt page and receipt email),
+# resolved once instead of going through the loader on every render. Skipped
+# when Jinja auto-reload is on so template edits still show up in development.
+_HOT_TEMPLATES: dict = {}
+
+
+def render_hot_template(name: str, **context) -> str:
+    """``render_template`` for frequently rendered templates, with the lookup cached.
+
+    Context processors still apply (``update_template_context``), so branding
+    variables such as ``SCHOOL_PHONE`` and ``LOGO_PRIMARY`` remain available.
+    """
+    if app.jinja_env.auto_reload:
+        return render_template(name, **context)
+    tmpl = _HOT_TEMPLATES.get(name)
+    if tmpl is None:
+        tmpl = _HOT_TEMPLATES[name] = app.jinja_env.get_template(name)
+    app.update_template_context(context)
+    return tmpl.render(context)
+
 # ---------- AUTH GUARD ----------
 @app.before_request
 def require_login_for_app():
@@ -579,8 +646,47 @@ def make_payment_alias():
 
 
 # ---------- DATABASE CONNECTION ----------
-def get_db_connection():
-    """Establish a connection to the MySQL database."""
+# Connections are borrowed from a process-wide pool (one per distinct set of
+# connection arguments, autocommit included); close() hands them back instead
+# of disconnecting.
+# DB_POOL_SIZE=0 disables pooling.
+_DB_POOLS = {}
+_DB_POOLS_LOCK = threading.Lock()
+
+
+def _db_pool_size() -> int:
+    try:
+        return int(os.environ.get("DB_POOL_SIZE", "16"))
+    except ValueError:
+        return 16
+
+
+def _db_pool(kwargs):
+    size = _db_pool_size()
+    if size <= 0:
+        return None
+    key = tuple(sorted(kwargs.items()))
+    pool = _DB_POOLS.get(key)
+    if pool is None:
+        with _DB_POOLS_LOCK:
+            pool = _DB_POOLS.get(key)
+            if pool is None:
+                pool = mysql_pooling.MySQLConnectionPool(
+                    pool_name=f"sfm{len(_DB_POOLS)}",
+                    pool_size=min(size, mysql_pooling.CNX_POOL_MAXSIZE),
+                    pool_reset_session=True,
+                    **kwargs,
+                )
+                _DB_POOLS[key] = pool
+    return pool
+
+
+def get_db_connection(autocommit: bool = False):
+    """Establish a connection to the MySQL database.
+
+    Pass ``autocommit=True`` for read-mostly views so plain SELECTs do not open
+    implicit transactions that have to be rolled back when the connection closes.
+    """
     # Prefer credentials from SQLALCHEMY_DATABASE_URI to avoid hardcoding
     uri = app.config.get("SQLALCHEMY_DATABASE_URI", "")
     host = os.environ.get("DB_HOST", "localhost")
@@ -631,6 +737,17 @@ def get_db_connection():
         # Fall back to non-TLS if env parsing fails
         pass
 
+    # autocommit is part of the pool key, so autocommit and transactional
+    # connections come from separate pools; the connector re-applies the mode
+    # after each session reset, so checkouts need no SET autocommit round trip.
+    kwargs["autocommit"] = autocommit  # type: ignore[assignment]
+    try:
+        pool = _db_pool(kwargs)
+        if pool is not None:
+            return pool.get_connection()
+    except mysql.connector.errors.PoolError:
+        # Pool exhausted (or could not be created): fall back to a direct connection
+        pass
     return mysql.connector.connect(**kwargs)
 
 
@@ -641,12 +758,8 @@ def get_db_connection_readonly():
     - isolation lowered to READ COMMITTED to avoid unnecessary locks
     - marks session READ ONLY where supported
     """
-    conn = get_db_connection()
+    conn = get_db_connection(autocommit=True)
     try:
-        try:
-            conn.autocommit = True  # type: ignore[attr-defined]
-        except Exception:
-            pass
         try:
             cur = conn.cursor()
             try:
@@ -674,9 +787,7 @@ def apply_credit_to_balance_for_school(db, school_id):
         return
     try:
         cur = db.cursor()
-        cur.execute("SHOW COLUMNS FROM students LIKE 'balance'")
-        has_balance = bool(cur.fetchone())
-        bal_col = "balance" if has_balance else "fee_balance"
+        bal_col = balance_column(cur)
         cur.execute(
             f"""
             UPDATE students
@@ -709,9 +820,7 @@ def apply_credit_to_balance_for_student(db, school_id, student_id):
         return 0.0
     try:
         cur = db.cursor(dictionary=True)
-        cur.execute("SHOW COLUMNS FROM students LIKE 'balance'")
-        has_balance = bool(cur.fetchone())
-        bal_col = "balance" if has_balance else "fee_balance"
+        bal_col = balance_column(cur)
         cur.execute(
             f"SELECT COALESCE({bal_col},0) AS bal, COALESCE(credit,0) AS credit FROM students WHERE id=%s AND school_id=%s",
             (student_id, school_id),
@@ -722,13 +831,13 @@ def apply_credit_to_balance_for_student(db, school_id, student_id):
         if bal <= 0 or credit <= 0:
             return 0.0
         apply_amt = min(bal, credit)
-        cur2 = db.cursor()
-        cur2.execute(
+        cur.execute(
             f"UPDATE students SET {bal_col} = {bal_col} - %s, credit = credit - %s WHERE id=%s AND school_id=%s",
             (apply_amt, apply_amt, student_id, school_id),
         )
+        # Ledger row joins the same transaction (ledger_entries is ensured at
+        # bootstrap), so the settlement is committed once below.
         try:
-            ensure_ledger_table(db)
             add_entry(
                 db,
                 school_id=int(school_id),
@@ -739,6 +848,7 @@ def apply_credit_to_balance_for_student(db, school_id, student_id):
                 description="Auto-applied credit to clear outstanding balance",
                 link_type="auto_settle",
                 link_id=None,
+                commit=False,
             )
         except Exception:
             pass
@@ -751,17 +861,41 @@ def apply_credit_to_balance_for_student(db, school_id, student_id):
         return 0.0
 
 
-def _bootstrap_db_safely():
-    """Attempt DB schema bootstrap without blocking app startup."""
+# Whether students has the ft_students FULLTEXT index (set during bootstrap)
+_STUDENTS_FULLTEXT = False
+# Whether the UNIQUE (school_id, admission_no) key exists, so inserts can rely
+# on it to reject duplicates (set during bootstrap; False keeps the lookups)
+_STUDENTS_ADMISSION_UNIQUE = False
+
+
+def _bootstrap_db_safely() -> bool:
+    """Attempt DB schema bootstrap without blocking app startup.
+
+    Each step runs on its own so one failing ``ensure_*`` does not skip the
+    rest. Returns True once the connection worked and every required table
+    step succeeded; optional steps (indexes, newsletters) may fail for good.
+    """
+    global _STUDENTS_FULLTEXT, _STUDENTS_ADMISSION_UNIQUE
     try:
         db = get_db_connection()
     except Exception:
-        return
+        return False
+    ok = True
+
+    def step(fn, *args, required=True):
+        nonlocal ok
+        try:
+            return fn(db, *args)
+        except Exception:
+            if required:
+                ok = False
+            return None
+
     try:
         # Ensure multi-tenant scaffolding exists
-        ensure_schools_table(db)
-        ensure_school_id_columns(
-            db,
+        step(ensure_schools_table)
+        step(
+            ensure_school_id_columns,
             (
                 "students",
                 "payments",
@@ -772,47 +906,65 @@ def _bootstrap_db_safely():
                 "term_fees",
             ),
         )
-        ensure_students_credit_column(db)
-        ensure_credit_ops_table(db)
-        ensure_credit_transfers_table(db)
+        step(ensure_students_credit_column)
+        step(ensure_credit_ops_table)
+        step(ensure_credit_transfers_table)
         # Academic term scaffolding
-        ensure_academic_terms_table(db)
-        ensure_payments_term_columns(db)
+        step(ensure_academic_terms_table)
+        step(ensure_payments_term_columns)
         # User tables for multi-user (premium-ready)
-        try:
-            ensure_user_tables(db)
-        except Exception:
-            pass
-        ensure_student_enrollments_table(db)
-        ensure_term_fees_table(db)
-        # Strengthen per-school uniqueness where safe
-        try:
-            ensure_unique_indices_per_school(db)
-        except Exception:
-            pass
+        step(ensure_user_tables)
+        step(ensure_student_enrollments_table)
+        step(ensure_term_fees_table)
+        # Ledger/audit tables used inside request transactions (DDL would
+        # implicitly commit, so it must not run mid-request)
+        step(ensure_ledger_table)
+        step(ensure_audit_table)
+        # Tables/columns otherwise probed by student, payment and proof views
+        step(ensure_student_portal_columns)
+        step(ensure_guardian_receipts_table)
+        # Strengthen per-school uniqueness where safe (fails on existing duplicates)
+        step(ensure_unique_indices_per_school, required=False)
+        _STUDENTS_ADMISSION_UNIQUE = bool(step(has_students_admission_unique, required=False))
+        # FULLTEXT index backing the typeahead search (optional per engine)
+        _STUDENTS_FULLTEXT = bool(step(ensure_fulltext_students, required=False))
         # Ensure newsletters storage
-        try:
-            ensure_newsletters_table(db)
-        except Exception:
-            pass
-        # Audit feature removed: no audit table initialization
-    except Exception:
-        pass
+        step(ensure_newsletters_table, required=False)
     finally:
+        # DDL above may have added columns; drop any schema probed before bootstrap
+        clear_columns_cache()
         try:
             db.close()
         except Exception:
             pass
+    return ok
 
 
+# Bootstrap runs before the first request and is retried (at most every
+# _BOOTSTRAP_RETRY_S seconds) until it succeeds, e.g. when MySQL was not yet
+# reachable on the first request.
 _BOOTSTRAP_DONE = False
+_BOOTSTRAP_LOCK = threading.Lock()
+_BOOTSTRAP_NEXT_TRY = 0.0
+_BOOTSTRAP_RETRY_S = 30.0
+
+
+def _ensure_bootstrapped() -> None:
+    global _BOOTSTRAP_DONE, _BOOTSTRAP_NEXT_TRY
+    if _BOOTSTRAP_DONE:
+        return
+    with _BOOTSTRAP_LOCK:
+        if _BOOTSTRAP_DONE or time.monotonic() < _BOOTSTRAP_NEXT_TRY:
+            return
+        if _bootstrap_db_safely():
+            _BOOTSTRAP_DONE = True
+        else:
+            _BOOTSTRAP_NEXT_TRY = time.monotonic() + _BOOTSTRAP_RETRY_S
+
 
 @app.before_request
 def _run_bootstrap_once():
-    global _BOOTSTRAP_DONE
-    if not _BOOTSTRAP_DONE:
-        _BOOTSTRAP_DONE = True
-        _bootstrap_db_safely()
+    _ensure_bootstrapped()
 
 # ---------- SCHOOL SELECTION ----------
 @app.route("/choose_school", methods=["GET", "POST"])
@@ -857,15 +1009,56 @@ def choose_school():
         return redirect(next_url)
     return render_template("choose_school.html", next_url=request.args.get("next", ""))
 # ---------- DASHBOARD ----------
+# Rendered dashboard numbers keyed by (school_id, MAX(payments.id), MAX(students.id),
+# year, term, version). Entries expire after the TTL; writes that do not change the
+# MAX(id) probes (edits/deletes) bump the per-school version instead.
+_DASHBOARD_CACHE_TTL = 60.0
+_DASHBOARD_CACHE_MAX = 256
+_DASHBOARD_CACHE: dict = {}
+_DASHBOARD_VERSIONS: dict = {}
+
+
+def bump_dashboard_version(school_id) -> None:
+    """Invalidate cached dashboard numbers for a school after a write."""
+    if school_id:
+        _DASHBOARD_VERSIONS[school_id] = _DASHBOARD_VERSIONS.get(school_id, 0) + 1
+
+
+def _dashboard_cache_get(key):
+    if key is None:
+        return None
+    hit = _DASHBOARD_CACHE.get(key)
+    if not hit:
+        return None
+    expires_at, context = hit
+    if expires_at < time.monotonic():
+        _DASHBOARD_CACHE.pop(key, None)
+        return None
+    return context
+
+
+def _dashboard_cache_set(key, context) -> None:
+    if key is None:
+        return
+    now = time.monotonic()
+    if len(_DASHBOARD_CACHE) >= _DASHBOARD_CACHE_MAX:
+        for k, (exp, _ctx) in list(_DASHBOARD_CACHE.items()):
+            if exp < now:
+                _DASHBOARD_CACHE.pop(k, None)
+        if len(_DASHBOARD_CACHE) >= _DASHBOARD_CACHE_MAX:
+            _DASHBOARD_CACHE.clear()
+    _DASHBOARD_CACHE[key] = (now + _DASHBOARD_CACHE_TTL, context)
+
+
 @app.route("/")
 def dashboard():
     """Main dashboard with summary cards and recent payments."""
-    db = get_db_connection()
+    db = get_db_connection(autocommit=True)
     cursor = db.cursor(dictionary=True)
 
     # Resolve current academic context
     try:
-        current_year, current_term = get_or_seed_current_term(db)
+        current_year, current_term = _current_term(db)
     except Exception:
         current_year, current_term = None, None
     try:
@@ -873,6 +1066,29 @@ def dashboard():
     except Exception:
         pass
 
+    # Index-only MAX(id) probes: when nothing changed, reuse the cached numbers
+    cache_key = None
+    try:
+        school_id = session.get("school_id")
+        cursor.execute("SELECT COALESCE(MAX(id), 0) AS m FROM payments WHERE school_id=%s", (school_id,))
+        max_payment_id = cursor.fetchone()["m"]
+        cursor.execute("SELECT COALESCE(MAX(id), 0) AS m FROM students WHERE school_id=%s", (school_id,))
+        max_student_id = cursor.fetchone()["m"]
+        cache_key = (
+            school_id,
+            max_payment_id,
+            max_student_id,
+            current_year,
+            current_term,
+            _DASHBOARD_VERSIONS.get(school_id, 0),
+        )
+    except Exception:
+        cache_key = None
+    cached = _dashboard_cache_get(cache_key)
+    if cached is not None:
+        db.close()
+        return render_template("dashboard.html", **cached)
+
     # Totals
     cursor.execute("SELECT COUNT(*) AS total FROM students WHERE school_id=%s", (session.get("school_id"),))
     total_students = cursor.fetchone()["total"]
@@ -891,9 +1107,7 @@ def dashboard():
     total_collected = cursor.fetchone()["total_collected"]
 
     # Detect correct balance column
-    cursor.execute("SHOW COLUMNS FROM students LIKE 'balance'")
-    has_balance = bool(cursor.fetchone())
-    column = "balance" if has_balance else "fee_balance"
+    column = balance_column(cursor)
 
     cursor.execute(f"SELECT COALESCE(SUM({column}), 0) AS total_balance FROM students WHERE school_id=%s", (session.get("school_id"),))
     total_balance = cursor.fetchone()["total_balance"]
@@ -976,8 +1190,7 @@ def dashboard():
         term_outstanding = 0.0
 
     db.close()
-    return render_template(
-        "dashboard.html",
+    context = dict(
         total_students=total_students,
         total_fees_collected=total_collected,
         pending_balance=total_balance,
@@ -986,29 +1199,29 @@ def dashboard():
         recent_students=recent_students,
         term_outstanding=term_outstanding
     )
+    _dashboard_cache_set(cache_key, context)
+    return render_template("dashboard.html", **context)
 
 
 # ---------- REAL-TIME DASHBOARD API ----------
 @app.route("/api/dashboard_data")
 def dashboard_data():
     """Return real-time dashboard totals."""
-    db = get_db_connection()
+    db = get_db_connection(autocommit=True)
     cursor = db.cursor(dictionary=True)
     try:
         apply_credit_to_balance_for_school(db, session.get("school_id"))
     except Exception:
         pass
 
-    cursor.execute("SHOW COLUMNS FROM students LIKE 'balance'")
-    has_balance = bool(cursor.fetchone())
-    column = "balance" if has_balance else "fee_balance"
+    column = balance_column(cursor)
 
     cursor.execute("SELECT COUNT(*) AS total_students FROM students WHERE school_id=%s", (session.get("school_id"),))
     total_students = cursor.fetchone()["total_students"]
 
     # Use current term for totals where applicable
     try:
-        cy, ct = get_or_seed_current_term(db)
+        cy, ct = _current_term(db)
     except Exception:
         cy, ct = None, None
     if cy and ct in (1, 2, 3):
@@ -1109,7 +1322,6 @@ def dashboard_data():
 def student_ledger(student_id: int):
     db = get_db_connection()
     try:
-        ensure_ledger_table(db)
         cur = db.cursor(dictionary=True)
         cur.execute(
             "SELECT * FROM ledger_entries WHERE school_id=%s AND student_id=%s ORDER BY ts DESC, id DESC",
@@ -1124,7 +1336,7 @@ def student_ledger(student_id: int):
 # ---------- FORECAST API ----------
 @app.route("/api/forecast_collections")
 def forecast_collections():
-    db = get_db_connection()
+    db = get_db_connection(autocommit=True)
     cur = db.cursor(dictionary=True)
     try:
         cur.execute(
@@ -1150,7 +1362,7 @@ def forecast_collections():
 # ---------- STUDENTS ----------
 @app.route("/students")
 def students():
-    db = get_db_connection()
+    db = get_db_connection(autocommit=True)
     cursor = db.cursor(dictionary=True)
     try:
         apply_credit_to_balance_for_school(db, session.get("school_id"))
@@ -1163,31 +1375,64 @@ def students():
 
 
 # ---------- GLOBAL SEARCH API ----------
+_FULLTEXT_TOKEN_RE = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def _like_prefix(q: str) -> str:
+    """Leading-anchored LIKE pattern with wildcards in ``q`` escaped."""
+    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"{escaped}%"
+
+
+def _fulltext_prefix_query(q: str) -> str:
+    """Build a BOOLEAN MODE query requiring every word as a prefix (``+word*``).
+
+    Returns an empty string when no token is long enough for the FULLTEXT
+    parser (InnoDB ignores tokens shorter than 3 characters by default).
+    """
+    tokens = [t for t in _FULLTEXT_TOKEN_RE.split(q) if t]
+    if not tokens or any(len(t) < 3 for t in tokens):
+        return ""
+    return " ".join(f"+{t}*" for t in tokens)
+
+
 @app.route("/api/search")
 def global_search():
     q = (request.args.get("q") or "").strip()
-    if not q:
+    if len(q) < 2:
         return jsonify({"students": [], "payments": []})
     db = get_db_connection_readonly()
     cur = db.cursor(dictionary=True)
     try:
         # Determine balance column
-        cur.execute("SHOW COLUMNS FROM students LIKE 'balance'")
-        has_balance = bool(cur.fetchone())
-        bal_col = "balance" if has_balance else "fee_balance"
+        bal_col = balance_column(cur)
 
-        like = f"%{q}%"
-        # Students by name/admission/class
-        cur.execute(
-            f"""
-            SELECT id, name, class_name, admission_no, COALESCE({bal_col},0) AS balance, COALESCE(credit,0) AS credit
-            FROM students
-            WHERE school_id=%s AND (name LIKE %s OR admission_no LIKE %s OR class_name LIKE %s)
-            ORDER BY name ASC
-            LIMIT 15
-            """,
-            (session.get("school_id"), like, like, like),
-        )
+        prefix = _like_prefix(q)
+        # Students by name/admission/class: FULLTEXT when available, otherwise
+        # leading-anchored LIKE so the (school_id, column) btree indexes apply.
+        ft_query = _fulltext_prefix_query(q) if _STUDENTS_FULLTEXT else ""
+        if ft_query:
+            cur.execute(
+                f"""
+                SELECT id, name, class_name, admission_no, COALESCE({bal_col},0) AS balance, COALESCE(credit,0) AS credit
+                FROM students
+                WHERE school_id=%s AND MATCH(name, admission_no, class_name) AGAINST(%s IN BOOLEAN MODE)
+                ORDER BY name ASC
+                LIMIT 15
+                """,
+                (session.get("school_id"), ft_query),
+            )
+        else:
+            cur.execute(
+                f"""
+                SELECT id, name, class_name, admission_no, COALESCE({bal_col},0) AS balance, COALESCE(credit,0) AS credit
+                FROM students
+                WHERE school_id=%s AND (name LIKE %s OR admission_no LIKE %s OR class_name LIKE %s)
+                ORDER BY name ASC
+                LIMIT 15
+                """,
+                (session.get("school_id"), prefix, prefix, prefix),
+            )
         students = cur.fetchall() or []
 
         # Payments: search by reference, student name, and optionally by exact amount if q is numeric
@@ -1208,7 +1453,7 @@ def global_search():
                 ORDER BY p.date DESC
                 LIMIT 10
                 """,
-                (session.get("school_id"), like, like, amt),
+                (session.get("school_id"), prefix, prefix, amt),
             )
         else:
             cur.execute(
@@ -1222,7 +1467,7 @@ def global_search():
                 ORDER BY p.date DESC
                 LIMIT 10
                 """,
-                (session.get("school_id"), like, like),
+                (session.get("school_id"), prefix, prefix),
             )
         payments = cur.fetchall() or []
     finally:
@@ -1233,6 +1478,7 @@ def global_search():
 @app.route("/add_student", methods=["GET", "POST"])
 def add_student():
     """Add a new student (reject duplicates by admission number only)."""
+    school_id = session.get("school_id")
     if request.method == "POST":
         name = request.form["name"].strip()
         admission_no = request.form.get("admission_no", "").strip()
@@ -1245,28 +1491,24 @@ def add_student():
         db = get_db_connection()
         cursor = db.cursor(dictionary=True)
 
-        # Detect correct column
-        cursor.execute("SHOW COLUMNS FROM students LIKE 'balance'")
-        has_balance = bool(cursor.fetchone())
-        cursor.execute("SHOW COLUMNS FROM students LIKE 'fee_balance'")
-        has_fee_balance = bool(cursor.fetchone())
-        # Detect optional phone column
-        cursor.execute("SHOW COLUMNS FROM students LIKE 'phone'")
-        has_phone_col = bool(cursor.fetchone())
-        # Detect possible email columns
-        cursor.execute("SHOW COLUMNS FROM students LIKE 'email'")
-        has_email_col = bool(cursor.fetchone())
-        cursor.execute("SHOW COLUMNS FROM students LIKE 'parent_email'")
-        has_parent_email_col = bool(cursor.fetchone())
+        # Detect correct balance column and optional phone/email columns
+        student_cols = student_columns(cursor)
+        has_balance = "balance" in student_cols
+        has_fee_balance = "fee_balance" in student_cols
+        has_phone_col = "phone" in student_cols
+        has_email_col = "email" in student_cols
+        has_parent_email_col = "parent_email" in student_cols
 
         # --- DUPLICATE CHECK (Admission No only) ---
-        if admission_no:
+        # Without the UNIQUE key (e.g. legacy duplicates blocked its creation)
+        # the INSERT below would not reject duplicates, so look first.
+        if admission_no and not _STUDENTS_ADMISSION_UNIQUE:
             cursor.execute(
                 """
                 SELECT id FROM students
-                WHERE LOWER(admission_no) = LOWER(%s) AND school_id=%s
+                WHERE school_id=%s AND admission_no = %s
                 """,
-                (admission_no, session.get("school_id")),
+                (session.get("school_id"), admission_no),
             )
             existing = cursor.fetchone()
             if existing:
@@ -1304,35 +1546,38 @@ def add_student():
         cols.append("credit")
         cols.append("school_id")
         params_list.append(0)
-        params_list.append(session.get("school_id"))
+        params_list.append(school_id)
 
         placeholders = ", ".join(["%s"] * len(params_list))
-        sql = f"INSERT INTO students ({', '.join(cols)}) VALUES ({placeholders})"
+        # The UNIQUE (school_id, admission_no) key rejects duplicates; the no-op
+        # update reports 0 affected rows instead of raising.
+        sql = f"INSERT INTO students ({', '.join(cols)}) VALUES ({placeholders}) ON DUPLICATE KEY UPDATE id=id"
         params = tuple(params_list)
 
         try:
             cursor.execute(sql, params)
+            if cursor.rowcount == 0:
+                flash(f"Admission Number '{admission_no}' already exists in the system.", "warning")
+                return redirect(url_for("students"))
             student_id = cursor.lastrowid
             try:
-                ensure_student_enrollments_table(db)
-                cy, _ct = get_or_seed_current_term(db)
-                cur2 = db.cursor()
-                cur2.execute(
+                cy, _ct = _current_term(db)
+                cursor.execute(
                     "INSERT IGNORE INTO student_enrollments (student_id, year, class_name, opening_balance, status, school_id) VALUES (%s,%s,%s,%s,%s,%s)",
-                    (student_id, cy, class_name, total_fees, "active", session.get("school_id")),
+                    (student_id, cy, class_name, total_fees, "active", school_id),
                 )
             except Exception:
                 pass
             # Seed default student portal password as the admission number
             try:
                 if admission_no:
-                    ensure_student_portal_columns(db)
                     hp = hash_password(admission_no)
-                    cur3 = db.cursor()
-                    cur3.execute("UPDATE students SET portal_password_hash=%s WHERE id=%s", (hp, student_id))
+                    cursor.execute("UPDATE students SET portal_password_hash=%s WHERE id=%s", (hp, student_id))
             except Exception:
                 pass
             db.commit()
+            if admission_no:
+                _admission_cache_add(school_id, admission_no)
             # audit removed
             flash(f"Student '{name}' added successfully!", "success")
         except Exception as e:
@@ -1347,6 +1592,28 @@ def add_student():
 
 
 # ---------- IMPORT STUDENTS (CSV) ----------
+# Rows per executemany() flush during CSV imports
+_IMPORT_BATCH_SIZE = 500
+
+
+def _open_csv_text(stream):
+    """Wrap an uploaded binary stream for incremental CSV parsing.
+
+    Sniffs the first block to pick UTF-8 (BOM-aware) or Latin-1, then rewinds so
+    the upload is decoded as rows are read instead of being buffered in memory.
+    """
+    head = stream.read(64 * 1024)
+    encoding = "utf-8-sig"
+    try:
+        head.decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut at the block boundary is still valid UTF-8
+        if e.start < len(head) - 3:
+            encoding = "latin-1"
+    stream.seek(0)
+    return TextIOWrapper(stream, encoding=encoding, errors="replace", newline="")
+
+
 @app.route("/import_students", methods=["GET", "POST"])
 def import_students():
     """Bulk import students from a CSV file.
@@ -1367,41 +1634,55 @@ def import_students():
         flash("Please choose a CSV file to upload.", "warning")
         return redirect(url_for("import_students"))
 
-    filename = secure_filename(file.filename)
     try:
-        raw = file.stream.read().decode("utf-8-sig")
+        f = _open_csv_text(file.stream)
     except Exception:
-        try:
-            raw = file.stream.read().decode("latin-1")
-        except Exception:
-            flash("Could not read CSV file. Ensure it is UTF-8 encoded.", "error")
-            return redirect(url_for("import_students"))
-
-    # Parse CSV
-    f = StringIO(raw)
-    reader = csv.DictReader(f)
+        flash("Could not read CSV file. Ensure it is UTF-8 encoded.", "error")
+        return redirect(url_for("import_students"))
 
-    # If no header present, fall back to simple reader and map columns by index
-    used_dict_reader = True
-    if not reader.fieldnames or len([c for c in reader.fieldnames if c]) <= 1:
-        used_dict_reader = False
+    # Parse CSV incrementally (rows are decoded as they are read). Columns are
+    # resolved to indexes once from the header so rows stay plain lists.
+    reader = csv.reader(f)
+    header = next(reader, None) or []
+    if len([c for c in header if c.strip()]) > 1:
+        idx = {}
+        for i, h in enumerate(header):
+            idx.setdefault(h.strip().lower(), i)
+
+        def _cols(*names):
+            return tuple(idx[n] for n in names if n in idx)
+
+        name_i = _cols("name")
+        adm_i = _cols("admission_no", "admission")
+        class_i = _cols("class_name", "class")
+        phone_i = _cols("phone")
+        email_i = _cols("email", "parent_email")
+        fees_i = _cols("total_fees", "fees", "balance")
+    else:
+        # No header present: positional [name, admission_no, class_name, phone, email, total_fees]
+        name_i, adm_i, class_i, phone_i, email_i, fees_i = (0,), (1,), (2,), (3,), (4,), (5,)
         f.seek(0)
         reader = csv.reader(f)
 
+    def _cell(row, indexes):
+        """First non-blank value among ``indexes`` (header aliases)."""
+        for i in indexes:
+            if i < len(row):
+                v = row[i].strip()
+                if v:
+                    return v
+        return ""
+
     db = get_db_connection()
     cur = db.cursor(dictionary=True)
 
     # Detect schema columns
-    cur.execute("SHOW COLUMNS FROM students LIKE 'balance'")
-    has_balance = bool(cur.fetchone())
-    cur.execute("SHOW COLUMNS FROM students LIKE 'fee_balance'")
-    has_fee_balance = bool(cur.fetchone())
-    cur.execute("SHOW COLUMNS FROM students LIKE 'phone'")
-    has_phone_col = bool(cur.fetchone())
-    cur.execute("SHOW COLUMNS FROM students LIKE 'email'")
-    has_email_col = bool(cur.fetchone())
-    cur.execute("SHOW COLUMNS FROM students LIKE 'parent_email'")
-    has_parent_email_col = bool(cur.fetchone())
+    student_cols = student_columns(cur)
+    has_balance = "balance" in student_cols
+    has_fee_balance = "fee_balance" in student_cols
+    has_phone_col = "phone" in student_cols
+    has_email_col = "email" in student_cols
+    has_parent_email_col = "parent_email" in student_cols
 
     if not (has_balance or has_fee_balance):
         db.close()
@@ -1410,32 +1691,135 @@ def import_students():
 
     imported, duplicates, errors = 0, 0, 0
     detail_errors = []
+    school_id = session.get("school_id")
+    country_code = app.config.get("DEFAULT_COUNTRY_CODE", "+254")
 
     try:
-        ensure_student_enrollments_table(db)
-        cy, _ct = get_or_seed_current_term(db)
+        cy, _ct = _current_term(db)
     except Exception:
         cy = None
 
+    # Schema is fixed for the whole import: build the INSERT statements once
+    insert_cols = ["name", "admission_no", "class_name"]
+    if has_phone_col:
+        insert_cols.append("phone")
+    email_col = None
+    if has_email_col:
+        email_col = "email"
+    elif has_parent_email_col:
+        email_col = "parent_email"
+    if email_col:
+        insert_cols.append(email_col)
+    insert_cols += ["balance" if has_balance else "fee_balance", "credit", "school_id"]
+    insert_sql = (
+        f"INSERT INTO students ({', '.join(insert_cols)}) VALUES ({', '.join(['%s'] * len(insert_cols))}) "
+        "ON DUPLICATE KEY UPDATE id=id"
+    )
+    enroll_sql = (
+        "INSERT IGNORE INTO student_enrollments (student_id, year, class_name, opening_balance, status, school_id) "
+        "VALUES "
+    )
+
+    # Pending rows: (insert params, admission_no, class_name, total_fees)
+    pending = []
+    seen_admissions = set()
+
+    def _flush(batch):
+        """Insert a batch of students with executemany, then their enrollments."""
+        nonlocal imported, duplicates, errors
+        if not batch:
+            return
+        if not _STUDENTS_ADMISSION_UNIQUE:
+            # No UNIQUE key to reject existing admission numbers: one lookup per
+            # batch instead of one SELECT per CSV row.
+            admissions = [b[1] for b in batch if b[1]]
+            if admissions:
+                placeholders = ",".join(["%s"] * len(admissions))
+                cur.execute(
+                    f"SELECT LOWER(admission_no) AS adm FROM students WHERE school_id=%s AND admission_no IN ({placeholders})",
+                    (school_id, *admissions),
+                )
+                dupe_set = {r["adm"] for r in (cur.fetchall() or [])}
+                if dupe_set:
+                    kept = [b for b in batch if not (b[1] and b[1].lower() in dupe_set)]
+                    duplicates += len(batch) - len(kept)
+                    batch = kept
+        inserted = []  # (student_id, class_name, total_fees)
+        keyed = [b for b in batch if b[1]]
+        unkeyed = [b for b in batch if not b[1]]
+        added, first_id = 0, None
+        try:
+            if keyed:
+                # Existing admission numbers hit the UNIQUE (school_id, admission_no)
+                # key and report 0 affected rows (without the key they were
+                # filtered out above).
+                cur.executemany(insert_sql, [b[0] for b in keyed])
+                added = max(cur.rowcount or 0, 0)
+                first_id = cur.lastrowid
+                duplicates += len(keyed) - added
+        except Exception:
+            # A failed multi-row INSERT is rolled back as a whole; retry row by row
+            # so one bad row only costs itself.
+            keyed, unkeyed = [], batch
+        if keyed and added:
+            imported += added
+            # Resolve the new ids by admission number (auto-increment values of a
+            # multi-row INSERT are not guaranteed to be consecutive, only >= the
+            # first generated id).
+            id_by_adm = {}
+            try:
+                placeholders = ",".join(["%s"] * len(keyed))
+                cur.execute(
+                    f"SELECT id, admission_no FROM students WHERE school_id=%s AND id >= %s AND admission_no IN ({placeholders})",
+                    (school_id, first_id or 0, *[b[1] for b in keyed]),
+                )
+                id_by_adm = {str(r["admission_no"]).lower(): r["id"] for r in (cur.fetchall() or [])}
+            except Exception:
+                pass
+            for b in keyed:
+                student_id = id_by_adm.get(b[1].lower())
+                if student_id:
+                    inserted.append((student_id, b[2], b[3]))
+        for b in unkeyed:
+            try:
+                cur.execute(insert_sql, b[0])
+                if cur.rowcount == 0:
+                    duplicates += 1
+                    continue
+                imported += 1
+                inserted.append((cur.lastrowid, b[2], b[3]))
+            except Exception as e:
+                errors += 1
+                detail_errors.append(str(e))
+
+        # Enrollment with opening balance
+        if cy is not None:
+            enroll_rows = [
+                (student_id, cy, class_name, total_fees, "active", school_id)
+                for student_id, class_name, total_fees in inserted
+                if student_id
+            ]
+            try:
+                if enroll_rows:
+                    # One explicit multi-row INSERT per batch
+                    cur.execute(
+                        enroll_sql + ",".join(["(%s,%s,%s,%s,%s,%s)"] * len(enroll_rows)),
+                        tuple(v for r in enroll_rows for v in r),
+                    )
+            except Exception:
+                pass
+
     try:
         for row in reader:
+            if not row:
+                continue
             try:
-                if used_dict_reader:
-                    name = (row.get("name") or "").strip()
-                    admission_no = (row.get("admission_no") or row.get("admission") or "").strip()
-                    class_name = (row.get("class_name") or row.get("class") or "").strip()
-                    phone = (row.get("phone") or "").strip()
-                    email_val = (row.get("email") or row.get("parent_email") or "").strip()
-                    tf_raw = (row.get("total_fees") or row.get("fees") or row.get("balance") or "0").strip()
-                else:
-                    # Positional mapping: [name, admission_no, class_name, phone, email, total_fees]
-                    cols = list(row)
-                    name = (cols[0] if len(cols) > 0 else "").strip()
-                    admission_no = (cols[1] if len(cols) > 1 else "").strip()
-                    class_name = (cols[2] if len(cols) > 2 else "").strip()
-                    phone = (cols[3] if len(cols) > 3 else "").strip()
-                    email_val = (cols[4] if len(cols) > 4 else "").strip()
-                    tf_raw = (cols[5] if len(cols) > 5 else "0").strip()
+                name = _cell(row, name_i)
+                admission_no = _cell(row, adm_i)
+                class_name = _cell(row, class_i)
+                phone = _cell(row, phone_i)
+                email_val = _cell(row, email_i)
+                tf_raw = _cell(row, fees_i)
 
                 if not name or not class_name:
                     errors += 1
@@ -1447,63 +1831,31 @@ def import_students():
                 except Exception:
                     total_fees = 0.0
 
-                # Normalize phone if util available
-                try:
-                    phone = normalize_phone(phone) if phone else phone
-                except Exception:
-                    pass
+                if phone:
+                    phone = normalize_phone(phone, country_code)
 
-                # Duplicate check by admission_no (if provided)
+                # Duplicate check by admission_no (if provided) within this file;
+                # rows already in the database are skipped in _flush()
                 if admission_no:
-                    cur.execute(
-                        "SELECT id FROM students WHERE LOWER(admission_no)=LOWER(%s) AND school_id=%s",
-                        (admission_no, session.get("school_id")),
-                    )
-                    if cur.fetchone():
+                    if admission_no.lower() in seen_admissions:
                         duplicates += 1
                         continue
+                    seen_admissions.add(admission_no.lower())
 
-                # Build insert
-                cols = ["name", "admission_no", "class_name"]
                 params = [name, admission_no or None, class_name]
                 if has_phone_col:
-                    cols.append("phone")
                     params.append(phone or None)
-                email_col = None
-                if has_email_col:
-                    email_col = "email"
-                elif has_parent_email_col:
-                    email_col = "parent_email"
                 if email_col:
-                    cols.append(email_col)
                     params.append(email_val or None)
-                # Balance column
-                cols.append("balance" if has_balance else "fee_balance")
-                params.append(total_fees)
-                # Credit and school id
-                cols += ["credit", "school_id"]
-                params += [0, session.get("school_id")]
-
-                placeholders = ", ".join(["%s"] * len(params))
-                sql = f"INSERT INTO students ({', '.join(cols)}) VALUES ({placeholders})"
-                cur.execute(sql, tuple(params))
-                sid = cur.lastrowid
-
-                # Enrollment with opening balance
-                try:
-                    if cy is not None:
-                        cur2 = db.cursor()
-                        cur2.execute(
-                            "INSERT IGNORE INTO student_enrollments (student_id, year, class_name, opening_balance, status, school_id) VALUES (%s,%s,%s,%s,%s,%s)",
-                            (sid, cy, class_name, total_fees, "active", session.get("school_id")),
-                        )
-                except Exception:
-                    pass
-
-                imported += 1
+                params += [total_fees, 0, school_id]
+                pending.append((tuple(params), admission_no, class_name, total_fees))
+                if len(pending) >= _IMPORT_BATCH_SIZE:
+                    _flush(pending)
+                    pending = []
             except Exception as e:
                 errors += 1
                 detail_errors.append(str(e))
+        _flush(pending)
 
         db.commit()
     except Exception as e:
@@ -1516,6 +1868,7 @@ def import_students():
             db.close()
         except Exception:
             pass
+    invalidate_admission_cache(school_id)
 
     # Summary
     msg = f"Imported {imported} student(s)."
@@ -1531,24 +1884,19 @@ def import_students():
 @app.route("/student/<int:student_id>/edit", methods=["GET", "POST"])
 def edit_student(student_id):
     """Edit existing student details and update balance/fee_balance accordingly."""
+    school_id = session.get("school_id")
     db = get_db_connection()
     cursor = db.cursor(dictionary=True)
 
     # Detect schema
-    cursor.execute("SHOW COLUMNS FROM students LIKE 'balance'")
-    has_balance = bool(cursor.fetchone())
-    cursor.execute("SHOW COLUMNS FROM students LIKE 'fee_balance'")
-    has_fee_balance = bool(cursor.fetchone())
-    cursor.execute("SHOW COLUMNS FROM students LIKE 'phone'")
-    has_phone_col = bool(cursor.fetchone())
+    student_cols = student_columns(cursor)
+    has_balance = "balance" in student_cols
+    has_fee_balance = "fee_balance" in student_cols
+    has_phone_col = "phone" in student_cols
     # Optional: one-time retention flag
-    try:
-        cursor.execute("SHOW COLUMNS FROM students LIKE 'retain_next_year'")
-        has_retain = bool(cursor.fetchone())
-    except Exception:
-        has_retain = False
+    has_retain = "retain_next_year" in student_cols
 
-    cursor.execute("SELECT * FROM students WHERE id = %s AND school_id=%s", (student_id, session.get("school_id")))
+    cursor.execute("SELECT * FROM students WHERE id = %s AND school_id=%s", (student_id, school_id))
     student = cursor.fetchone()
 
     if not student:
@@ -1567,8 +1915,8 @@ def edit_student(student_id):
         # Enforce unique admission_no if changed and provided
         if admission_no and admission_no.lower() != (student.get("admission_no") or "").lower():
             cursor.execute(
-                "SELECT id FROM students WHERE LOWER(admission_no) = LOWER(%s) AND school_id=%s",
-                (admission_no, session.get("school_id"))
+                "SELECT id FROM students WHERE school_id=%s AND admission_no = %s",
+                (school_id, admission_no)
             )
             exists = cursor.fetchone()
             if exists:
@@ -1577,10 +1925,8 @@ def edit_student(student_id):
                 return redirect(url_for("edit_student", student_id=student_id))
 
         # Detect optional email columns for update
-        cursor.execute("SHOW COLUMNS FROM students LIKE 'email'")
-        has_email_col = bool(cursor.fetchone())
-        cursor.execute("SHOW COLUMNS FROM students LIKE 'parent_email'")
-        has_parent_email_col = bool(cursor.fetchone())
+        has_email_col = "email" in student_cols
+        has_parent_email_col = "parent_email" in student_cols
 
         # Build dynamic update
         sets = ["name = %s", "admission_no = %s", "class_name = %s"]
@@ -1607,11 +1953,13 @@ def edit_student(student_id):
             sets.append("retain_next_year = %s")
             params.append(retain_flag)
         params.append(student_id)
-        params.append(session.get("school_id"))
+        params.append(school_id)
 
         try:
             cursor.execute(f"UPDATE students SET {', '.join(sets)} WHERE id = %s AND school_id=%s", tuple(params))
             db.commit()
+            bump_dashboard_version(school_id)
+            invalidate_admission_cache(school_id)
             # audit removed
             flash("Student updated successfully!", "success")
         except Exception as e:
@@ -1632,11 +1980,14 @@ def edit_student(student_id):
 @app.route("/delete_student/<int:student_id>", methods=["POST"])
 def delete_student(student_id):
     """Delete student and related payments."""
+    school_id = session.get("school_id")
     db = get_db_connection()
     cursor = db.cursor()
-    cursor.execute("DELETE FROM payments WHERE student_id = %s AND school_id=%s", (student_id, session.get("school_id")))
-    cursor.execute("DELETE FROM students WHERE id = %s AND school_id=%s", (student_id, session.get("school_id")))
+    cursor.execute("DELETE FROM payments WHERE student_id = %s AND school_id=%s", (student_id, school_id))
+    cursor.execute("DELETE FROM students WHERE id = %s AND school_id=%s", (student_id, school_id))
     db.commit()
+    bump_dashboard_version(school_id)
+    invalidate_admission_cache(school_id)
     # audit removed
     db.close()
     flash("Student deleted successfully!", "success")
@@ -1644,30 +1995,82 @@ def delete_student(student_id):
 
 
 # ---------- SEARCH ----------
+_SEARCH_PAGE_SIZE = 50
+_SEARCH_PAGE_MAX = 200
+
+
 @app.route("/search_student")
 def search_student():
     """Search students for the current school.
 
     Works across different profile schemas by coalescing balance columns
     and searching common fields (name, class, admission, phone/email when present).
+    Results are paged: ``page`` (1-based) and ``size`` (default 50, max 200); the
+    ``X-Has-More`` response header is ``1`` when a further page exists.
+    Queries shorter than 2 characters list the most recent students instead.
+    An optional ``class_name`` narrows results to a single class; listing a
+    class without a query returns the whole class unpaged.
     """
     query = (request.args.get("query") or "").strip()
-    db = get_db_connection_readonly()
-    cursor = db.cursor(dictionary=True)
-
     sid = session.get("school_id")
     if not sid:
         return jsonify([])
 
-    if query:
+    page = max(request.args.get("page", 1, type=int) or 1, 1)
+    size = min(max(request.args.get("size", _SEARCH_PAGE_SIZE, type=int) or _SEARCH_PAGE_SIZE, 1), _SEARCH_PAGE_MAX)
+    offset = (page - 1) * size
+    class_name = (request.args.get("class_name") or "").strip()
+    class_sql = " AND class_name=%s" if class_name else ""
+    class_params = (class_name,) if class_name else ()
+    # One extra row tells us whether another page exists
+    paged = not (class_name and len(query) < 2)
+    limit_sql = " LIMIT %s OFFSET %s" if paged else ""
+    limit_params = (size + 1, offset) if paged else ()
+
+    db = get_db_connection_readonly()
+    cursor = db.cursor(dictionary=True)
+
+    select_sql = (
+        "SELECT id, name, class_name, admission_no, "
+        "COALESCE(balance, fee_balance, 0) AS balance, "
+        "COALESCE(credit, 0) AS credit "
+        "FROM students "
+    )
+    # Phone numbers and e-mail addresses are not in the FULLTEXT index
+    ft_query = ""
+    if _STUDENTS_FULLTEXT and "@" not in query and not query.replace("+", "").isdigit():
+        ft_query = _fulltext_prefix_query(query)
+
+    students = None
+    if len(query) >= 2 and ft_query:
+        cursor.execute(
+            select_sql
+            + "WHERE school_id=%s AND MATCH(name, admission_no, class_name) AGAINST(%s IN BOOLEAN MODE)"
+            + class_sql
+            + " ORDER BY name ASC"
+            + limit_sql,
+            (sid, ft_query, *class_params, *limit_params),
+        )
+        students = cursor.fetchall()
+        # FULLTEXT only matches word prefixes; when it finds nothing at all, fall
+        # back to a substring LIKE scan so partial matches inside a name are
+        # still found. Later pages re-check for any FULLTEXT hit so a result set
+        # is paged through on the same path it started on.
+        if not students:
+            ft_any = False
+            if page > 1:
+                cursor.execute(
+                    "SELECT 1 FROM students WHERE school_id=%s "
+                    "AND MATCH(name, admission_no, class_name) AGAINST(%s IN BOOLEAN MODE)" + class_sql + " LIMIT 1",
+                    (sid, ft_query, *class_params),
+                )
+                ft_any = bool(cursor.fetchall())
+            if not ft_any:
+                students = None
+    if students is None and len(query) >= 2:
         like = f"%{query}%"
         # Detect optional columns so we don't reference missing fields
-        cursor.execute("SHOW COLUMNS FROM students LIKE 'phone'")
-        has_phone = bool(cursor.fetchone())
-        cursor.execute("SHOW COLUMNS FROM students LIKE 'email'")
-        has_email = bool(cursor.fetchone())
-        cursor.execute("SHOW COLUMNS FROM students LIKE 'parent_email'")
-        has_parent_email = bool(cursor.fetchone())
+        student_cols = student_columns(cursor)
 
         where_parts = [
             "name LIKE %s",
@@ -1675,48 +2078,80 @@ def search_student():
             "admission_no LIKE %s",
         ]
         params = [sid, like, like, like]
-        if has_phone:
+        if "phone" in student_cols:
             where_parts.append("COALESCE(phone,'') LIKE %s")
             params.append(like)
-        if has_email or has_parent_email:
-            email_expr = []
-            if has_email:
-                email_expr.append("COALESCE(email,'') LIKE %s")
-                params.append(like)
-            if has_parent_email:
-                email_expr.append("COALESCE(parent_email,'') LIKE %s")
-                params.append(like)
+        email_expr = []
+        if "email" in student_cols:
+            email_expr.append("COALESCE(email,'') LIKE %s")
+            params.append(like)
+        if "parent_email" in student_cols:
+            email_expr.append("COALESCE(parent_email,'') LIKE %s")
+            params.append(like)
+        if email_expr:
             where_parts.append("(" + " OR ".join(email_expr) + ")")
 
         where_clause = " OR ".join(where_parts)
-        sql = (
-            f"SELECT id, name, class_name, admission_no, "
-            f"COALESCE(balance, fee_balance, 0) AS balance, "
-            f"COALESCE(credit, 0) AS credit "
-            f"FROM students "
-            f"WHERE school_id=%s AND ({where_clause}) "
-            f"ORDER BY name ASC"
+        cursor.execute(
+            select_sql + f"WHERE school_id=%s AND ({where_clause}){class_sql} ORDER BY name ASC" + limit_sql,
+            (*params, *class_params, *limit_params),
         )
-        cursor.execute(sql, tuple(params))
-    else:
+        students = cursor.fetchall()
+    elif students is None:
         cursor.execute(
-            """
-            SELECT id, name, class_name, admission_no,
-                   COALESCE(balance, fee_balance, 0) AS balance,
-                   COALESCE(credit, 0) AS credit
-            FROM students
-            WHERE school_id=%s
-            ORDER BY id DESC
-            """,
-            (sid,),
+            select_sql + "WHERE school_id=%s" + class_sql + " ORDER BY id DESC" + limit_sql,
+            (sid, *class_params, *limit_params),
         )
+        students = cursor.fetchall()
 
-    students = cursor.fetchall()
     db.close()
-    return jsonify(students)
+    has_more = paged and len(students) > size
+    resp = jsonify(students[:size] if paged else students)
+    resp.headers["X-Has-More"] = "1" if has_more else "0"
+    return resp
 
 
 # ---------- DUPLICATE CHECK API ----------
+# Lower-cased admission numbers per school, so the as-you-type duplicate check
+# is answered from memory. Writes in this process update or drop the entry; the
+# TTL bounds staleness from other workers (add_student still relies on the
+# UNIQUE key, so a stale answer only affects the form hint).
+_ADMISSION_CACHE_TTL = 120.0
+_ADMISSION_CACHE: dict = {}
+
+
+def invalidate_admission_cache(school_id=None) -> None:
+    """Drop cached admission numbers for a school (or all schools)."""
+    if school_id is None:
+        _ADMISSION_CACHE.clear()
+    else:
+        _ADMISSION_CACHE.pop(school_id, None)
+
+
+def _admission_cache_add(school_id, admission_no) -> None:
+    hit = _ADMISSION_CACHE.get(school_id)
+    if hit:
+        hit[1].add(admission_no.lower())
+
+
+def _admission_numbers(school_id):
+    hit = _ADMISSION_CACHE.get(school_id)
+    if hit and hit[0] >= time.monotonic():
+        return hit[1]
+    db = get_db_connection(autocommit=True)
+    try:
+        cursor = db.cursor(buffered=False)
+        cursor.execute(
+            "SELECT admission_no FROM students WHERE school_id=%s AND admission_no IS NOT NULL",
+            (school_id,),
+        )
+        numbers = {str(r[0]).lower() for r in cursor}
+    finally:
+        db.close()
+    _ADMISSION_CACHE[school_id] = (time.monotonic() + _ADMISSION_CACHE_TTL, numbers)
+    return numbers
+
+
 @app.route("/check_student_exists")
 def check_student_exists():
     """AJAX check if Admission Number already exists."""
@@ -1724,22 +2159,53 @@ def check_student_exists():
     if not admission_no:
         return jsonify({"exists": False})
 
-    db = get_db_connection()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute(
-        """
-        SELECT id FROM students
-        WHERE LOWER(admission_no) = %s AND school_id=%s
-        """,
-        (admission_no, session.get("school_id")),
-    )
-    exists = bool(cursor.fetchone())
-    db.close()
-
+    exists = admission_no in _admission_numbers(session.get("school_id"))
     return jsonify({"exists": exists})
 
 
 # ---------- EXPORT REPORTS ----------
+_CSV_STREAM_CHUNK = 8192
+
+
+def _stream_csv(db, sql, params, header):
+    """Yield CSV text for ``sql`` while rows are still arriving from MySQL.
+
+    Uses an unbuffered cursor so the result set is never materialized; output is
+    flushed in ~8 KB chunks. Drains any unread rows and closes ``db`` when the
+    stream ends or is aborted.
+    """
+    buf = StringIO()
+    writer = csv.writer(buf)
+    cur = None
+    try:
+        writer.writerow(header)
+        cur = db.cursor(buffered=False)
+        cur.execute(sql, params)
+        for row in cur:
+            writer.writerow(row)
+            if buf.tell() >= _CSV_STREAM_CHUNK:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+    finally:
+        # A client disconnect leaves rows unread; drain them so the pooled
+        # connection is not handed back with a pending result set.
+        try:
+            db.consume_results()
+        except Exception:
+            pass
+        try:
+            if cur is not None:
+                cur.close()
+        except Exception:
+            pass
+        try:
+            db.close()
+        except Exception:
+            pass
+
+
 @app.route("/export_students")
 def export_students():
     """Export all student records as CSV."""
@@ -1747,9 +2213,7 @@ def export_students():
     if not school_id:
         return Response("School selection required.", status=403)
     db = get_db_connection()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute(
-        """
+    sql = """
         SELECT 
             name AS 'Name', 
             admission_no AS 'Admission No', 
@@ -1759,22 +2223,10 @@ def export_students():
         FROM students
         WHERE school_id=%s
         ORDER BY class_name, name
-        """,
-        (school_id,),
-    )
-    students = cursor.fetchall()
-    db.close()
-
+        """
     fieldnames = ["Name", "Admission No", "Class", "Balance (KES)", "Credit (KES)"]
-    output = StringIO()
-    writer = csv.DictWriter(output, fieldnames=fieldnames)
-    writer.writeheader()
-    if students:
-        writer.writerows(students)
-    output.seek(0)
-
     return Response(
-        output.getvalue(),
+        stream_with_context(_stream_csv(db, sql, (school_id,), fieldnames)),
         mimetype="text/csv",
         headers={"Content-Disposition": "attachment; filename=students_report.csv"}
     )
@@ -1791,7 +2243,6 @@ def export_payments():
     If both year and term are provided, they take precedence over date range.
     """
     db = get_db_connection()
-    cur = db.cursor(dictionary=True)
     sid = session.get("school_id")
 
     year = request.args.get("year")
@@ -1824,18 +2275,9 @@ def export_payments():
         if end_date:
             sql += " AND p.date <= %s"; params.append(end_date)
     sql += " ORDER BY p.date DESC"
-    cur.execute(sql, tuple(params))
-    payments = cur.fetchall()
-    db.close()
-    output = StringIO()
-    fieldnames = payments[0].keys() if payments else ["Student Name", "Admission No", "Class", "Year", "Term", "Amount (KES)", "Method", "Reference", "Date"]
-    writer = csv.DictWriter(output, fieldnames=fieldnames)
-    writer.writeheader()
-    writer.writerows(payments)
-    output.seek(0)
-
+    fieldnames = ["Student Name", "Admission No", "Class", "Year", "Term", "Amount (KES)", "Method", "Reference", "Date"]
     return Response(
-        output.getvalue(),
+        stream_with_context(_stream_csv(db, sql, tuple(params), fieldnames)),
         mimetype="text/csv",
         headers={"Content-Disposition": "attachment; filename=payments_report.csv"}
     )
@@ -1856,7 +2298,7 @@ def export_analytics_csv():
 
     # Helper to get current term
     try:
-        cy, ct = get_or_seed_current_term(db)
+        cy, ct = _current_term(db)
     except Exception:
         cy, ct = None, None
 
@@ -1908,13 +2350,7 @@ def export_analytics_csv():
 
         elif ds == "aging":
             # Aging by last payment (students with positive balance)
-            bal_col = "balance"
-            try:
-                cur.execute("SHOW COLUMNS FROM students LIKE 'balance'")
-                if not cur.fetchone():
-                    bal_col = "fee_balance"
-            except Exception:
-                bal_col = "fee_balance"
+            bal_col = balance_column(cur)
             cur.execute(
                 f"""
                 SELECT s.id, s.name, s.class_name, COALESCE({bal_col},0) AS bal,
@@ -2010,7 +2446,7 @@ def export_analytics_csv():
         elif ds == "due_aging":
             # Aggregate outstanding by due date buckets for current term invoices
             try:
-                cy, ct = get_or_seed_current_term(db)
+                cy, ct = _current_term(db)
             except Exception:
                 cy, ct = None, None
             if not (cy and ct in (1, 2, 3)):
@@ -2068,7 +2504,7 @@ def export_analytics_csv():
         elif ds == "timeliness":
             # Per-student on-time vs late paid for current term
             try:
-                cy, ct = get_or_seed_current_term(db)
+                cy, ct = _current_term(db)
             except Exception:
                 cy, ct = None, None
             if not (cy and ct in (1, 2, 3)):
@@ -2124,6 +2560,79 @@ def export_analytics_csv():
 
 
 # ---------- STUDENT DETAIL ----------
+# History lists shown on the student profile, all parameterized by
+# (student_id, school_id).
+_DETAIL_PAYMENTS_SQL = """
+    SELECT * FROM payments
+    WHERE student_id = %s AND school_id=%s
+    ORDER BY date DESC
+"""
+_DETAIL_OVERPAYS_SQL = """
+    SELECT ts, amount, reference, method
+    FROM credit_operations
+    WHERE student_id = %s AND op_type = 'overpay' AND school_id=%s
+    ORDER BY ts DESC
+"""
+_DETAIL_TRANSFERS_OUT_SQL = """
+    SELECT ct.*, s.name AS to_name
+    FROM credit_transfers ct
+    JOIN students s ON s.id = ct.to_student_id
+    WHERE ct.from_student_id = %s AND ct.school_id=%s
+    ORDER BY ct.ts DESC
+"""
+_DETAIL_TRANSFERS_IN_SQL = """
+    SELECT ct.*, s.name AS from_name
+    FROM credit_transfers ct
+    JOIN students s ON s.id = ct.from_student_id
+    WHERE ct.to_student_id = %s AND ct.school_id=%s
+    ORDER BY ct.ts DESC
+"""
+_DETAIL_PROOFS_SQL = """
+    SELECT id, guardian_name, guardian_email, guardian_phone,
+           description, notes, amount, payment_date, status,
+           file_path, rejection_reason, created_at
+    FROM guardian_receipts
+    WHERE student_id=%s AND school_id=%s
+    ORDER BY created_at DESC
+"""
+_DETAIL_QUERY_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="detail-query")
+
+
+class _DoneFuture:
+    """Already-resolved stand-in for a Future (sequential fallback)."""
+
+    def __init__(self, fn, *args):
+        try:
+            self._value, self._error = fn(*args), None
+        except Exception as e:
+            self._value, self._error = None, e
+
+    def result(self):
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+def _fetch_rows(sql, params, db=None):
+    """Run a SELECT and return all rows as dicts (on a fresh connection if no ``db``)."""
+    conn = db if db is not None else get_db_connection(autocommit=True)
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(sql, params)
+        return cur.fetchall() or []
+    finally:
+        if db is None:
+            conn.close()
+
+
+def _submit_detail_query(db, sql, params):
+    # Fanning out only pays off when connections come from the pool; without
+    # it every query would pay a fresh handshake, so run inline on ``db``.
+    if _db_pool_size() > 0:
+        return _DETAIL_QUERY_EXECUTOR.submit(_fetch_rows, sql, params)
+    return _DoneFuture(_fetch_rows, sql, params, db)
+
+
 @app.route("/student/<int:student_id>")
 def student_detail(student_id):
     """View student profile and payments."""
@@ -2144,71 +2653,29 @@ def student_detail(student_id):
     except Exception:
         credit_applied_amount = 0.0
 
-    cursor.execute("SELECT * FROM students WHERE id = %s AND school_id=%s", (student_id, session.get("school_id")))
+    sid = session.get("school_id")
+    # Independent history lists are read concurrently on their own pooled
+    # connections while this connection loads the student row.
+    futures = [
+        _submit_detail_query(db, sql, (student_id, sid))
+        for sql in (
+            _DETAIL_PAYMENTS_SQL,
+            _DETAIL_OVERPAYS_SQL,
+            _DETAIL_TRANSFERS_OUT_SQL,
+            _DETAIL_TRANSFERS_IN_SQL,
+            _DETAIL_PROOFS_SQL,
+        )
+    ]
+    cursor.execute("SELECT * FROM students WHERE id = %s AND school_id=%s", (student_id, sid))
     student = cursor.fetchone()
 
-    cursor.execute(
-        """
-        SELECT * FROM payments
-        WHERE student_id = %s AND school_id=%s
-        ORDER BY date DESC
-        """,
-        (student_id, session.get("school_id"))
-    )
-    payments = cursor.fetchall()
-    # Overpay records from credit operations (if table exists)
+    payments = futures[0].result()
+    # Overpays, credit transfers and guardian proofs are optional extras
     try:
-        ensure_credit_ops_table(db)
-        cursor.execute(
-            """
-            SELECT ts, amount, reference, method
-            FROM credit_operations
-            WHERE student_id = %s AND op_type = 'overpay' AND school_id=%s
-            ORDER BY ts DESC
-            """,
-            (student_id, session.get("school_id"))
-        )
-        overpays = cursor.fetchall()
-        # Credit transfer records (both directions) if table exists
-        ensure_credit_transfers_table(db)
-        # Outgoing transfers with destination name
-        cursor.execute(
-            """
-            SELECT ct.*, s.name AS to_name
-            FROM credit_transfers ct
-            JOIN students s ON s.id = ct.to_student_id
-            WHERE ct.from_student_id = %s AND ct.school_id=%s
-            ORDER BY ct.ts DESC
-            """,
-            (student_id, session.get("school_id"))
-        )
-        transfers_out = cursor.fetchall()
-        # Incoming transfers with source name
-        cursor.execute(
-            """
-            SELECT ct.*, s.name AS from_name
-            FROM credit_transfers ct
-            JOIN students s ON s.id = ct.from_student_id
-            WHERE ct.to_student_id = %s AND ct.school_id=%s
-            ORDER BY ct.ts DESC
-            """,
-            (student_id, session.get("school_id"))
-        )
-        transfers_in = cursor.fetchall()
-        proofs = []
-        ensure_guardian_receipts_table(db)
-        cursor.execute(
-            """
-            SELECT id, guardian_name, guardian_email, guardian_phone,
-                   description, notes, amount, payment_date, status,
-                   file_path, rejection_reason, created_at
-            FROM guardian_receipts
-            WHERE student_id=%s AND school_id=%s
-            ORDER BY created_at DESC
-            """,
-            (student_id, session.get("school_id")),
-        )
-        proofs = cursor.fetchall() or []
+        overpays = futures[1].result()
+        transfers_out = futures[2].result()
+        transfers_in = futures[3].result()
+        proofs = futures[4].result()
         for proof in proofs:
             proof["status_label"] = format_status_label(proof.get("status"))
             proof["analysis"] = (proof.get("analysis") or "").strip()
@@ -2221,8 +2688,7 @@ def student_detail(student_id):
     auto_credit_notice = None
     try:
         if student:
-            ensure_academic_terms_table(db)
-            cy, ct = get_or_seed_current_term(db)
+            cy, ct = _current_term(db)
             auto_credit_notice = auto_apply_credit_if_new_term(
                 db,
                 student,
@@ -2277,7 +2743,6 @@ def guardian_proof_review(receipt_id):
 
     db = get_db_connection()
     try:
-        ensure_guardian_receipts_table(db)
         cur = db.cursor(dictionary=True)
         cur.execute(
             "SELECT * FROM guardian_receipts WHERE id=%s AND school_id=%s",
@@ -2314,20 +2779,13 @@ def guardian_proof_review(receipt_id):
                 return redirect(redirect_target)
 
             try:
-                ensure_payments_term_columns(db)
-            except Exception:
-                pass
-            try:
-                cy, ct = get_or_seed_current_term(db)
+                cy, ct = _current_term(db)
             except Exception:
                 cy, ct = now.year, 1
             if ct not in (1, 2, 3):
                 ct = 1
 
-            balance_col = "balance"
-            cur.execute("SHOW COLUMNS FROM students LIKE 'balance'")
-            if not cur.fetchone():
-                balance_col = "fee_balance"
+            balance_col = balance_column(cur)
 
             cur.execute(
                 f"SELECT name, {balance_col}, credit FROM students WHERE id=%s AND school_id=%s",
@@ -2408,10 +2866,7 @@ def guardian_proof_review(receipt_id):
                 )
             except Exception:
                 pass
-            db.commit()
-
             try:
-                ensure_ledger_table(db)
                 add_entry(
                     db,
                     school_id=int(school_id),
@@ -2422,9 +2877,11 @@ def guardian_proof_review(receipt_id):
                     description="Guardian proof recorded",
                     link_type="payment",
                     link_id=int(payment_id),
+                    commit=False,
                 )
             except Exception:
                 pass
+            db.commit()
 
             student_name = student_row.get("name") or f"Student #{student_id}"
             proof_payload = dict(proof)
@@ -2503,9 +2960,73 @@ def guardian_proof_review(receipt_id):
 
 
 # ---------- PAYMENTS ----------
+_PAYMENTS_PAGE_SIZE = 50
+
+# Receipt emails are sent off the request thread: the payment POST redirects as
+# soon as the transaction commits instead of waiting on Gmail/SMTP round trips.
+_RECEIPT_EMAIL_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="receipt-mail")
+_RECEIPT_EMAIL_ATTEMPTS = 3
+
+
+def _smtp_configured() -> bool:
+    return all((app.config.get(k) or '').strip() for k in ('MAIL_SERVER', 'MAIL_USERNAME', 'MAIL_PASSWORD'))
+
+
+def _send_receipt_email(to: str, subject: str, html: str | None, text: str, sender: str | None) -> bool:
+    """Send one receipt via the Gmail API, falling back to Flask-Mail (SMTP) if configured."""
+    try:
+        if html:
+            if gmail_send_email_html(to, subject, html):
+                return True
+        elif gmail_send_email(to, subject, text):
+            return True
+    except Exception:
+        pass
+    if not _smtp_configured():
+        return False
+    from flask_mail import Message
+    from extensions import mail
+    if html:
+        m = Message(subject=subject, sender=sender, recipients=[to], html=html)
+    else:
+        m = Message(subject=subject, sender=sender, recipients=[to], body=text)
+    mail.send(m)
+    return True
+
+
+def _queue_receipt_email(to: str, subject: str, html: str | None, text: str, sender: str | None) -> bool:
+    """Send a receipt email in the background, retrying with a short backoff.
+
+    Returns False without queueing when neither Gmail nor SMTP is configured, so
+    a worker is not tied up retrying a send that cannot succeed.
+    """
+    try:
+        gmail_ready = gmail_has_valid_token()
+    except Exception:
+        gmail_ready = False
+    if not (gmail_ready or _smtp_configured()):
+        return False
+
+    def _job():
+        with app.app_context():
+            for attempt in range(_RECEIPT_EMAIL_ATTEMPTS):
+                try:
+                    if _send_receipt_email(to, subject, html, text, sender):
+                        return
+                except Exception:
+                    pass
+                if attempt + 1 < _RECEIPT_EMAIL_ATTEMPTS:
+                    time.sleep(2 ** attempt)
+            app.logger.warning("Receipt email to %s could not be sent", to)
+
+    _RECEIPT_EMAIL_EXECUTOR.submit(_job)
+    return True
+
+
 @app.route("/payments", methods=["GET", "POST"])
 def payments():
     """Add or list payments."""
+    school_id = session.get("school_id")
     db = get_db_connection()
     cursor = db.cursor(dictionary=True)
 
@@ -2523,63 +3044,35 @@ def payments():
         except Exception:
             form_year, form_term = None, None
 
-        # Enforce term state: only allow payments in OPEN term
+        # Term state: payments are only allowed while the current term is OPEN.
+        # Checked by the payment INSERT itself (see below), not a separate query.
         try:
-            cy_check, ct_check = get_or_seed_current_term(db)
-            cur_gate = db.cursor()
-            sid_gate = session.get("school_id")
-            cur_gate.execute(
-                "SELECT status FROM academic_terms WHERE year=%s AND term=%s AND school_id=%s",
-                (cy_check, ct_check, sid_gate),
-            )
-            trow = cur_gate.fetchone()
-            if trow is not None:
-                status_val = trow[0] if not isinstance(trow, dict) else (trow.get("status") or "DRAFT")
-                if status_val != "OPEN":
-                    db.close()
-                    flash("Payments are locked until the current term is OPEN.", "warning")
-                    return redirect(url_for("payments"))
+            cy_check, ct_check = _current_term(db)
         except Exception:
-            pass
-
-        # Detect correct balance column
-        cursor.execute("SHOW COLUMNS FROM students LIKE 'balance'")
-        has_balance = bool(cursor.fetchone())
-        column = "balance" if has_balance else "fee_balance"
-
-        cursor.execute(f"SELECT {column}, credit FROM students WHERE id = %s AND school_id=%s", (student_id, session.get("school_id")))
-        student = cursor.fetchone()
-
-        # Fetch student's contact info for notifications (email-first)
-        cursor.execute("SHOW COLUMNS FROM students LIKE 'phone'")
-        _has_phone_col = bool(cursor.fetchone())
-        # Detect email column preference: 'email' then 'parent_email'
+            cy_check, ct_check = None, None
+
+        # Resolve balance/contact columns from the cached schema, then read the
+        # student's balance, credit and contact details in one query. FOR UPDATE
+        # holds the row until the payment transaction commits, so concurrent
+        # payments for the same student serialize instead of losing an update.
+        student_cols = student_columns(cursor)
+        column = "balance" if "balance" in student_cols else "fee_balance"
+        # Email column preference: 'email' then 'parent_email'
         _email_col = None
-        cursor.execute("SHOW COLUMNS FROM students LIKE 'email'")
-        if bool(cursor.fetchone()):
+        if "email" in student_cols:
             _email_col = 'email'
-        else:
-            cursor.execute("SHOW COLUMNS FROM students LIKE 'parent_email'")
-            if bool(cursor.fetchone()):
-                _email_col = 'parent_email'
-
-        student_name = None
-        student_phone = None
-        student_email = None
-        # Retrieve core name and available contact columns
-        select_cols = ["name", "class_name"]
-        if _has_phone_col:
-            select_cols.append("phone")
-        if _email_col:
-            select_cols.append(_email_col)
-        cols_sql = ", ".join(select_cols)
-        cursor.execute(f"SELECT {cols_sql} FROM students WHERE id = %s AND school_id=%s", (student_id, session.get("school_id")))
-        row = cursor.fetchone() or {}
+        elif "parent_email" in student_cols:
+            _email_col = 'parent_email'
+
+        cursor.execute(
+            "SELECT * FROM students WHERE id = %s AND school_id=%s FOR UPDATE",
+            (student_id, school_id),
+        )
+        student = cursor.fetchone()
+        row = student or {}
         student_name = row.get("name")
-        if _has_phone_col:
-            student_phone = row.get("phone")
-        if _email_col:
-            student_email = row.get(_email_col)
+        student_phone = row.get("phone")
+        student_email = row.get(_email_col) if _email_col else None
 
         if not student:
             db.close()
@@ -2604,7 +3097,7 @@ def payments():
         if reference:
             cursor.execute(
                 "SELECT COUNT(*) AS cnt FROM payments WHERE LOWER(reference) = LOWER(%s) AND school_id=%s",
-                (reference, session.get("school_id")),
+                (reference, school_id),
             )
             ref_exists = (cursor.fetchone() or {}).get("cnt", 0)
             if ref_exists:
@@ -2612,128 +3105,145 @@ def payments():
                 flash("Reference already exists. Use a unique REF.", "warning")
                 return redirect(url_for("payments", student_id=student_id))
 
-        # Ensure term/year columns exist and compute defaults
-        try:
-            ensure_payments_term_columns(db)
-        except Exception:
-            pass
+        # Compute term/year defaults (term columns are ensured at bootstrap)
         if not (form_year and form_term in (1, 2, 3)):
             try:
-                cy, ct = get_or_seed_current_term(db)
+                cy, ct = _current_term(db)
             except Exception:
                 cy, ct = payment_date.year, None
         else:
             cy, ct = form_year, form_term
 
-        cursor.execute(
-            """
-            INSERT INTO payments (student_id, amount, method, term, year, reference, date, school_id)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """,
-            (student_id, amount, method, ct, cy, reference or None, payment_date, session.get("school_id")),
-        )
-        payment_id = cursor.lastrowid
-
-        cursor.execute(
-            f"UPDATE students SET {column} = %s, credit = %s WHERE id = %s AND school_id=%s",
-            (new_balance, new_credit, student_id, session.get("school_id")),
-        )
-        db.commit()
-        # Ledger only
-        try:
-            ensure_ledger_table(db)
-            add_entry(
-                db,
-                school_id=int(session.get("school_id")),
-                student_id=int(student_id),
-                entry_type='credit',
-                amount=float(amount),
-                ref=reference or None,
-                description=f"Payment via {method}",
-                link_type='payment',
-                link_id=int(payment_id),
-            )
-        except Exception:
-            pass
+        # Payment, balance update, optional carry-forward, ledger rows and the
+        # overpay credit operation are written in one transaction / one commit.
+        carried_payment_id = None
         try:
-            log_event(
-                "record_payment",
-                target=f"payment:{payment_id}",
-                detail=f"Paid KES {amount:,.2f} for student {student_name or student.get('name')}",
+            # Inserts nothing when the current term exists and is not OPEN, so the
+            # gate and the write happen atomically in one statement.
+            cursor.execute(
+                """
+                INSERT INTO payments (student_id, amount, method, term, year, reference, date, school_id)
+                SELECT %s, %s, %s, %s, %s, %s, %s, %s FROM DUAL
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM academic_terms
+                    WHERE year=%s AND term=%s AND school_id=%s AND COALESCE(status, 'DRAFT') <> 'OPEN'
+                )
+                """,
+                (
+                    student_id, amount, method, ct, cy, reference or None, payment_date, school_id,
+                    cy_check, ct_check, school_id,
+                ),
             )
-        except Exception:
-            pass
+            if cursor.rowcount == 0:
+                db.rollback()
+                db.close()
+                flash("Payments are locked until the current term is OPEN.", "warning")
+                return redirect(url_for("payments"))
+            payment_id = cursor.lastrowid
 
-        # Optionally carry any overpay to next term by creating a forward payment entry
-        carried_payment_id = None
-        if carry_overpay and overpaid_total > 0 and ct in (1, 2, 3):
+            cursor.execute(
+                f"UPDATE students SET {column} = %s, credit = %s WHERE id = %s AND school_id=%s",
+                (new_balance, new_credit, student_id, school_id),
+            )
+            # Ledger only
             try:
-                # work out next (year, term)
-                next_term = 1 if ct == 3 else (ct + 1)
-                next_year = (cy + 1) if ct == 3 else cy
-                carry_ref = (reference or f"PMT-{payment_id}") + "-CF"
-                cursor.execute(
-                    """
-                    INSERT INTO payments (student_id, amount, method, term, year, reference, date, school_id)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    """,
-                    (student_id, overpaid_total, "Carry Forward", next_term, next_year, carry_ref, payment_date, session.get("school_id")),
+                add_entry(
+                    db,
+                    school_id=int(school_id),
+                    student_id=int(student_id),
+                    entry_type='credit',
+                    amount=float(amount),
+                    ref=reference or None,
+                    description=f"Payment via {method}",
+                    link_type='payment',
+                    link_id=int(payment_id),
+                    commit=False,
                 )
-                carried_payment_id = cursor.lastrowid
-                db.commit()
-                # Ledger entry for carry-forward credit
-                try:
-                    ensure_ledger_table(db)
-                    add_entry(
-                        db,
-                        school_id=int(session.get("school_id")),
-                        student_id=int(student_id),
-                        entry_type='credit',
-                        amount=float(overpaid_total),
-                        ref=carry_ref,
-                        description=f"Carry forward from {cy} T{ct}",
-                        link_type='payment',
-                        link_id=int(carried_payment_id),
-                    )
-                except Exception:
-                    pass
             except Exception:
-                # If carry write fails, fall back to adding to credit to avoid loss
+                pass
+
+            # Optionally carry any overpay to next term by creating a forward payment entry
+            if carry_overpay and overpaid_total > 0 and ct in (1, 2, 3):
                 try:
+                    # work out next (year, term)
+                    next_term = 1 if ct == 3 else (ct + 1)
+                    next_year = (cy + 1) if ct == 3 else cy
+                    carry_ref = (reference or f"PMT-{payment_id}") + "-CF"
                     cursor.execute(
-                        "UPDATE students SET credit = credit + %s WHERE id = %s AND school_id=%s",
-                        (overpaid_total, student_id, session.get("school_id")),
+                        """
+                        INSERT INTO payments (student_id, amount, method, term, year, reference, date, school_id)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                        """,
+                        (student_id, overpaid_total, "Carry Forward", next_term, next_year, carry_ref, payment_date, school_id),
                     )
-                    db.commit()
+                    carried_payment_id = cursor.lastrowid
+                    # Ledger entry for carry-forward credit
+                    try:
+                        add_entry(
+                            db,
+                            school_id=int(school_id),
+                            student_id=int(student_id),
+                            entry_type='credit',
+                            amount=float(overpaid_total),
+                            ref=carry_ref,
+                            description=f"Carry forward from {cy} T{ct}",
+                            link_type='payment',
+                            link_id=int(carried_payment_id),
+                            commit=False,
+                        )
+                    except Exception:
+                        pass
                 except Exception:
-                    pass
+                    # If carry write fails, fall back to adding to credit to avoid loss
+                    try:
+                        cursor.execute(
+                            "UPDATE students SET credit = credit + %s WHERE id = %s AND school_id=%s",
+                            (overpaid_total, student_id, school_id),
+                        )
+                    except Exception:
+                        pass
 
-        # If there was an overpay, record it in credit operations for student detail visibility
+            # If there was an overpay, record it in credit operations for student detail visibility
+            try:
+                if overpaid_total > 0:
+                    cursor.execute(
+                        "INSERT INTO credit_operations (ts, actor, student_id, op_type, amount, reference, method, meta, school_id) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)",
+                        (
+                            datetime.utcnow(),
+                            session.get("username"),
+                            int(student_id),
+                            "overpay",
+                            overpaid_total,
+                            reference or None,
+                            method,
+                            json.dumps({
+                                "payment_id": int(payment_id),
+                                "carried": bool(carry_overpay),
+                                "carried_payment_id": int(carried_payment_id) if carried_payment_id else None
+                            }),
+                            school_id,
+                        ),
+                    )
+            except Exception:
+                # Do not block normal flow if logging fails
+                pass
+            db.commit()
+        except Exception as e:
+            try:
+                db.rollback()
+            except Exception:
+                pass
+            db.close()
+            flash(f"Error recording payment: {e}", "error")
+            return redirect(url_for("payments", student_id=student_id))
+        bump_dashboard_version(school_id)
         try:
-            if overpaid_total > 0:
-                ensure_credit_ops_table(db)
-                cur2 = db.cursor()
-                cur2.execute(
-                    "INSERT INTO credit_operations (ts, actor, student_id, op_type, amount, reference, method, meta, school_id) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)",
-                    (
-                        datetime.utcnow(),
-                        session.get("username"),
-                        int(student_id),
-                        "overpay",
-                        overpaid_total,
-                        reference or None,
-                        method,
-                        json.dumps({
-                            "payment_id": int(payment_id),
-                            "carried": bool(carry_overpay),
-                            "carried_payment_id": int(carried_payment_id) if carried_payment_id else None
-                        }),
-                        session.get("school_id"),
-                    ),
-                )
-                db.commit()
+            log_event(
+                "record_payment",
+                target=f"payment:{payment_id}",
+                detail=f"Paid KES {amount:,.2f} for student {student_name or student.get('name')}",
+            )
         except Exception:
-            # Do not block normal flow if logging fails
             pass
         # audit removed
 
@@ -2745,7 +3255,6 @@ def payments():
         )
         pretty_ref = reference or "N/A"
         email_subject = f"Payment receipt for {student_name} - KES {amount:,.2f}"
-        email_sent = False
         if student_email:
             # Build receipt link for verification and quick access
             try:
@@ -2754,7 +3263,7 @@ def payments():
                 receipt_url = ""
             # Render an email-friendly HTML receipt
             try:
-                email_html = render_template(
+                email_html = render_hot_template(
                     "email_receipt.html",
                     brand=brand,
                     student_name=student_name,
@@ -2772,51 +3281,28 @@ def payments():
             except Exception:
                 # Graceful fallback to a plain text summary
                 email_html = None
+            email_body = (
+                f"{brand}: Payment received.\n"
+                f"Hi {student_name}, thank you for your payment of KES {amount:,.2f} via {method} (Ref: {pretty_ref}).\n"
+                f"Your new balance is KES {new_balance:,.2f}. Credit on account: KES {new_credit:,.2f}.\n"
+                + (f"View receipt: {receipt_url}" if receipt_url else "")
+            )
+            sender = (
+                app.config.get('MAIL_SENDER')
+                or app.config.get('MAIL_DEFAULT_SENDER')
+                or (get_setting('SCHOOL_EMAIL') or None)
+                or app.config.get('MAIL_USERNAME')
+                or None
+            )
+            # Delivery happens in the background; failures are logged by the job
             try:
-                # Ensure a clean, user-friendly subject line (ASCII-only for safety)
-                email_subject = f"Payment receipt for {student_name} - KES {amount:,.2f}"
-                if email_html:
-                    email_sent = gmail_send_email_html(student_email, email_subject, email_html)
-                else:
-                    email_body = (
-                        f"{brand}: Payment received.\n"
-                        f"Hi {student_name}, thank you for your payment of KES {amount:,.2f} via {method} (Ref: {pretty_ref}).\n"
-                        f"Your new balance is KES {new_balance:,.2f}. Credit on account: KES {new_credit:,.2f}.\n"
-                        + (f"View receipt: {receipt_url}" if receipt_url else "")
-                    )
-                    email_sent = gmail_send_email(student_email, email_subject, email_body)
+                queued = _queue_receipt_email(student_email, email_subject, email_html, email_body, sender)
             except Exception:
-                email_sent = False
-            if not email_sent:
-                # Fallback to Flask-Mail (SMTP) only if configured
-                try:
-                    smtp_server = (app.config.get('MAIL_SERVER') or '').strip()
-                    smtp_user = (app.config.get('MAIL_USERNAME') or '').strip()
-                    smtp_pass = (app.config.get('MAIL_PASSWORD') or '').strip()
-                    if smtp_server and smtp_user and smtp_pass:
-                        from flask_mail import Message
-                        from extensions import mail
-                        sender = (
-                            app.config.get('MAIL_SENDER')
-                            or app.config.get('MAIL_DEFAULT_SENDER')
-                            or (get_setting('SCHOOL_EMAIL') or None)
-                            or app.config.get('MAIL_USERNAME')
-                            or None
-                        )
-                        if email_html:
-                            m = Message(subject=email_subject, sender=sender, recipients=[student_email], html=email_html)
-                        else:
-                            m = Message(subject=email_subject, sender=sender, recipients=[student_email], body=email_body)
-                        mail.send(m)
-                        email_sent = True
-                    else:
-                        email_sent = False
-                except Exception:
-                    email_sent = False
+                queued = False
+            if not queued:
+                flash("Payment recorded, but no email service is configured to send the receipt.", "warning")
         if not student_email:
             flash("Payment recorded. Add an email to send receipts.", "info")
-        elif not email_sent:
-            flash("Payment recorded, but sending email receipt failed.", "warning")
         db.close()
 
         flash(f"Payment of KES {amount:,.2f} recorded! Remaining balance: KES {new_balance:,.2f}, Credit: KES {new_credit:,.2f}", "success")
@@ -2825,40 +3311,59 @@ def payments():
     # âœ… NEW: read preselected student from query param
     selected_student_id = request.args.get("student_id", type=int)
 
+    # Keyset page of the listing: only the columns the table renders, newest
+    # first, continuing below ``after_id`` (served by the school_id index, which
+    # carries the primary key). One extra row tells whether an older page exists.
+    after_id = request.args.get("after_id", type=int)
     cursor.execute(
-        """
-        SELECT p.*, s.name AS student_name, s.class_name
+        f"""
+        SELECT p.id, p.amount, p.method, p.reference, p.date, p.term, p.year,
+               s.name AS student_name, s.class_name
         FROM payments p
         JOIN students s ON p.student_id = s.id
-        WHERE p.school_id=%s
-        ORDER BY p.date DESC
+        WHERE p.school_id=%s{" AND p.id < %s" if after_id else ""}
+        ORDER BY p.id DESC
+        LIMIT %s
         """,
-        (session.get("school_id"),),
+        (school_id, *((after_id,) if after_id else ()), _PAYMENTS_PAGE_SIZE + 1),
     )
     payments = cursor.fetchall()
-    
-    cursor.execute("SELECT id, name FROM students WHERE school_id=%s ORDER BY name ASC", (session.get("school_id"),))
+    next_after_id = None
+    if len(payments) > _PAYMENTS_PAGE_SIZE:
+        payments = payments[:_PAYMENTS_PAGE_SIZE]
+        next_after_id = payments[-1]["id"]
+
+    cursor.execute("SELECT id, name FROM students WHERE school_id=%s ORDER BY name ASC", (school_id,))
     students = cursor.fetchall()
     db.close()
 
-    return render_template("payments.html", payments=payments, students=students, selected_student_id=selected_student_id)
+    return render_template(
+        "payments.html",
+        payments=payments,
+        students=students,
+        selected_student_id=selected_student_id,
+        after_id=after_id,
+        next_after_id=next_after_id,
+    )
 
 
 @app.route("/payments/<int:payment_id>/delete", methods=["POST"])
 def delete_payment(payment_id: int):
+    school_id = session.get("school_id")
     db = get_db_connection()
     cursor = db.cursor(dictionary=True)
     cursor.execute(
         "SELECT p.id, p.student_id, p.amount, p.method, s.name AS student_name FROM payments p JOIN students s ON s.id=p.student_id WHERE p.id=%s AND p.school_id=%s",
-        (payment_id, session.get("school_id")),
+        (payment_id, school_id),
     )
     record = cursor.fetchone()
     if not record:
         db.close()
         flash("Payment not found or already deleted.", "warning")
         return redirect(url_for("payments"))
-    cursor.execute("DELETE FROM payments WHERE id=%s AND school_id=%s", (payment_id, session.get("school_id")))
+    cursor.execute("DELETE FROM payments WHERE id=%s AND school_id=%s", (payment_id, school_id))
     db.commit()
+    bump_dashboard_version(school_id)
     try:
         log_event(
             "delete_payment",
@@ -2873,46 +3378,50 @@ def delete_payment(payment_id: int):
 
 
 # ---------- PAYMENT RECEIPT (Printable) ----------
+# Receipts show the live balance, so browsers keep them but must revalidate
+# (a cheap 304 via the ETag) rather than reuse a copy that may be outdated.
+_RECEIPT_CACHE_CONTROL = "private, no-cache"
+
+
 @app.route("/payments/<int:payment_id>/receipt")
 def payment_receipt(payment_id: int):
     """Render a compact, one-page printable receipt for a payment."""
     db = get_db_connection()
-    cursor = db.cursor(dictionary=True)
-
-    # Fetch payment with student info
-    cursor.execute(
-        """
-        SELECT p.*, s.name AS student_name, s.class_name, s.admission_no, s.id AS sid
-        FROM payments p
-        JOIN students s ON s.id = p.student_id
-        WHERE p.id = %s AND p.school_id=%s
-        """,
-        (payment_id, session.get("school_id")),
-    )
-    payment = cursor.fetchone()
-    if not payment:
-        db.close()
-        flash("Payment not found.", "error")
-        return redirect(url_for("payments"))
-
-    # Determine current balance/credit (for display only)
     try:
-        cursor.execute("SHOW COLUMNS FROM students LIKE 'balance'")
-        has_balance = bool(cursor.fetchone())
-        column = "balance" if has_balance else "fee_balance"
+        cursor = db.cursor(dictionary=True)
 
+        # Fetch payment with student info
         cursor.execute(
-            f"SELECT {column} AS balance, credit FROM students WHERE id = %s AND school_id=%s",
-            (payment.get("sid"), session.get("school_id")),
+            """
+            SELECT p.*, s.name AS student_name, s.class_name, s.admission_no, s.id AS sid
+            FROM payments p
+            JOIN students s ON s.id = p.student_id
+            WHERE p.id = %s AND p.school_id=%s
+            """,
+            (payment_id, session.get("school_id")),
         )
-        sc = cursor.fetchone() or {}
-        current_balance = float((sc.get("balance") or 0))
-        current_credit = float((sc.get("credit") or 0))
-    except Exception:
-        current_balance = None
-        current_credit = None
+        payment = cursor.fetchone()
+        if not payment:
+            flash("Payment not found.", "error")
+            return redirect(url_for("payments"))
 
-    db.close()
+        # Determine current balance/credit (for display only)
+        try:
+            column = balance_column(cursor)
+
+            cursor.execute(
+                f"SELECT {column} AS balance, credit FROM students WHERE id = %s AND school_id=%s",
+                (payment.get("sid"), session.get("school_id")),
+            )
+            sc = cursor.fetchone() or {}
+            current_balance = float((sc.get("balance") or 0))
+            current_credit = float((sc.get("credit") or 0))
+        except Exception:
+            current_balance = None
+            current_credit = None
+
+    finally:
+        db.close()
 
     # Prefer school-specific branding for receipt header
     brand = (
@@ -3016,7 +3525,7 @@ def payment_receipt(payment_id: int):
         except Exception:
             erp_receipt_number = f"SLP{payment_id}"
 
-    return render_template(
+    resp = make_response(render_hot_template(
         "receipt.html",
         brand=brand,
         payment=payment,
@@ -3033,73 +3542,125 @@ def payment_receipt(payment_id: int):
         slip_paid_to=brand,
         slip_school_name=school_name_value,
         school_logo_url=school_logo_url,
-    )
+    ))
+    # Content ETag: a reload of an unchanged receipt is answered with 304
+    resp.add_etag()
+    resp.headers["Cache-Control"] = _RECEIPT_CACHE_CONTROL
+    return resp.make_conditional(request)
 
 
 # ---------- PAYMENT RECEIPT (PDF Download) ----------
-@app.route("/payments/<int:payment_id>/receipt.pdf")
-def payment_receipt_pdf(payment_id: int):
-    """Generate a PDF receipt for a payment with school details."""
-    db = get_db_connection()
-    cursor = db.cursor(dictionary=True)
+# Decoded header logos keyed by (path, mtime): the JPEG is parsed once per file
+# change instead of on every receipt. A replaced file gets a new mtime/key.
+_LOGO_READERS: dict = {}
 
-    cursor.execute(
-        """
-        SELECT p.id, p.student_id AS sid, s.name AS student_name, s.class_name, p.amount, p.method,
-               p.reference, p.date, p.term, p.year
-        FROM payments p
-        JOIN students s ON s.id = p.student_id
-        WHERE p.id = %s AND p.school_id=%s
-        """,
-        (payment_id, session.get("school_id")),
-    )
-    payment = cursor.fetchone()
-    if not payment:
-        db.close()
-        flash("Payment not found.", "error")
-        return redirect(url_for("payments"))
 
-    cursor.execute("SHOW COLUMNS FROM students LIKE 'balance'")
-    has_balance = bool(cursor.fetchone())
-    bal_col = "balance" if has_balance else "fee_balance"
-    cursor.execute(
-        f"SELECT COALESCE({bal_col}, 0) AS bal, COALESCE(credit, 0) AS credit FROM students WHERE id=%s AND school_id=%s",
-        (payment.get("sid"), session.get("school_id")),
+def _logo_reader(path: str):
+    """Return a cached ReportLab ImageReader for ``path``, or None if missing."""
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    key = (path, mtime)
+    reader = _LOGO_READERS.get(key)
+    if reader is None:
+        reader = ImageReader(path)
+        for stale in [k for k in _LOGO_READERS if k[0] == path]:
+            _LOGO_READERS.pop(stale, None)
+        _LOGO_READERS[key] = reader
+    return reader
+
+
+# Rendered receipt PDFs keyed by everything printed on them, so a re-download
+# (or a second click) is served without rebuilding the canvas, QR and logo.
+# Any change to the payment, balance, credit or school header is a new key.
+_RECEIPT_PDF_CACHE_TTL = 300.0
+_RECEIPT_PDF_CACHE_MAX = 256
+_RECEIPT_PDF_CACHE: dict = {}
+
+
+def _receipt_pdf_key(payment: dict, srow: dict, school: tuple, school_id) -> tuple:
+    return (
+        school_id,
+        tuple(sorted((k, str(v)) for k, v in payment.items())),
+        str(srow.get("bal")),
+        str(srow.get("credit")),
+        school,
     )
-    srow = cursor.fetchone() or {"bal": 0.0, "credit": 0.0}
-    db.close()
 
-    school_name = (
-        get_setting("SCHOOL_NAME")
-        or get_setting("APP_NAME")
-        or app.config.get("APP_NAME")
-        or app.config.get("BRAND_NAME")
-        or get_setting("BRAND_NAME")
-        or "School"
-    )
-    school_address = get_setting("SCHOOL_ADDRESS") or ""
-    school_phone = get_setting("SCHOOL_PHONE") or ""
-    school_email = get_setting("SCHOOL_EMAIL") or ""
-    school_website = get_setting("SCHOOL_WEBSITE") or ""
 
-    from io import BytesIO
-    from reportlab.lib.pagesizes import A5
-    from reportlab.lib.units import mm
-    from reportlab.lib import colors
-    from reportlab.pdfgen import canvas
-
-    # Styled, modern PDF layout to mirror HTML receipt
-    buf = BytesIO()
-    c = canvas.Canvas(buf, pagesize=A5)
+def _receipt_pdf_bytes(payment: dict, srow: dict, school: tuple, school_id) -> bytes:
+    """Return the receipt PDF for ``payment``, rendering it only on a cache miss."""
+    key = _receipt_pdf_key(payment, srow, school, school_id)
+    now = time.monotonic()
+    hit = _RECEIPT_PDF_CACHE.get(key)
+    if hit and now - hit[0] < _RECEIPT_PDF_CACHE_TTL:
+        return hit[1]
+    pdf_bytes = _render_receipt_pdf(payment, srow, school, school_id)
+    if len(_RECEIPT_PDF_CACHE) >= _RECEIPT_PDF_CACHE_MAX:
+        for k in [k for k, v in _RECEIPT_PDF_CACHE.items() if now - v[0] >= _RECEIPT_PDF_CACHE_TTL]:
+            _RECEIPT_PDF_CACHE.pop(k, None)
+        while len(_RECEIPT_PDF_CACHE) >= _RECEIPT_PDF_CACHE_MAX:
+            _RECEIPT_PDF_CACHE.pop(next(iter(_RECEIPT_PDF_CACHE)), None)
+    _RECEIPT_PDF_CACHE[key] = (now, pdf_bytes)
+    return pdf_bytes
+
+
+# Receipt colours, parsed from hex once per process rather than per PDF
+# (draw_kv alone used to parse "#64748b" for every row).
+_RECEIPT_PALETTE = {
+    "indigo": colors.HexColor("#4338ca"),
+    "cyan": colors.HexColor("#06b6d4"),
+    "light_bg": colors.HexColor("#eef2ff"),
+    "border": colors.HexColor("#e2e8f0"),
+    "muted": colors.HexColor("#64748b"),
+    "ink": colors.HexColor("#0f172a"),
+}
+
+
+# Encoded receipt QR drawings keyed by (signed payload text, size). The payload
+# is deterministic per receipt, so reloads/retries skip the QR encoding. The
+# drawings are only read when rendered, so sharing them across requests is safe.
+_RECEIPT_QR_CACHE_MAX = 4096
+_RECEIPT_QR_CACHE: dict = {}
+
+
+def _receipt_qr_drawing(qr_text: str, size: float):
+    key = (qr_text, size)
+    d = _RECEIPT_QR_CACHE.get(key)
+    if d is not None:
+        return d
+    qr_widget = rl_qr.QrCodeWidget(qr_text)
+    b = qr_widget.getBounds()
+    w = b[2] - b[0]
+    h = b[3] - b[1]
+    # The scale goes on the Drawing: QrCodeWidget rejects a ``transform`` attribute
+    d = Drawing(size, size, transform=[size / w, 0, 0, size / h, 0, 0])
+    d.add(qr_widget)
+    if len(_RECEIPT_QR_CACHE) >= _RECEIPT_QR_CACHE_MAX:
+        _RECEIPT_QR_CACHE.clear()
+    _RECEIPT_QR_CACHE[key] = d
+    return d
+
+
+def _render_receipt_pdf(payment: dict, srow: dict, school: tuple, school_id) -> bytes:
+    """Draw the A5 receipt. Needs no request context, only the rows and header."""
+    school_name, school_address, school_phone, school_email, school_website = school
+
+    # Styled, modern PDF layout to mirror HTML receipt. The canvas is never
+    # saved to a file: getpdfdata() below hands back the document bytes directly.
+    c = rl_canvas.Canvas(f"receipt_{payment.get('id')}.pdf", pagesize=A5)
     width, height = A5
     x_margin = 14 * mm
     content_gap = 6 * mm
 
     # Brand colors (match HTML theme)
-    brand_indigo = colors.HexColor("#4338ca")
-    brand_cyan = colors.HexColor("#06b6d4")
-    light_bg = colors.HexColor("#eef2ff")
-    soft_border = colors.HexColor("#e2e8f0")
+    palette = _RECEIPT_PALETTE
+    brand_indigo = palette["indigo"]
+    brand_cyan = palette["cyan"]
+    light_bg = palette["light_bg"]
+    soft_border = palette["border"]
+    muted = palette["muted"]
 
     # Header bar
     header_h = 28 * mm
@@ -3116,8 +3677,9 @@ def payment_receipt_pdf(payment_id: int):
         static_folder = app.static_folder or os.path.join(app.root_path, "static")
         logo_rel = app.config.get("LOGO_PRIMARY", "css/lovato_logo.jpg")
         logo_path = os.path.join(static_folder, logo_rel.replace("\\", "/"))
-        if os.path.exists(logo_path):
-            c.drawImage(logo_path, logo_x, logo_y, width=logo_w, height=logo_h, preserveAspectRatio=True, mask='auto')
+        logo = _logo_reader(logo_path)
+        if logo is not None:
+            c.drawImage(logo, logo_x, logo_y, width=logo_w, height=logo_h, preserveAspectRatio=True, mask='auto')
             text_x = logo_x + logo_w + 6
         else:
             text_x = x_margin
@@ -3154,9 +3716,9 @@ def payment_receipt_pdf(payment_id: int):
     c.setStrokeColor(soft_border)
     c.roundRect(x_margin, card_y, width - 2 * x_margin, card_h, 3 * mm, fill=1, stroke=0)
     c.setFont("Helvetica", 9)
-    c.setFillColor(colors.HexColor("#64748b"))
+    c.setFillColor(muted)
     c.drawCentredString(width / 2, card_y + card_h - 5 * mm, "Amount Paid")
-    c.setFillColor(colors.HexColor("#0f172a"))
+    c.setFillColor(palette["ink"])
     c.setFont("Helvetica-Bold", 16)
     c.drawCentredString(width / 2, card_y + 4.8 * mm, f"KES {float(payment.get('amount') or 0):,.2f}")
     y = card_y - content_gap
@@ -3172,7 +3734,7 @@ def payment_receipt_pdf(payment_id: int):
     def draw_kv(label: str, value: str):
         nonlocal y
         c.setFont("Helvetica", 9)
-        c.setFillColor(colors.HexColor("#64748b"))
+        c.setFillColor(muted)
         c.drawString(x_margin, y, label)
         c.setFillColor(colors.black)
         c.setFont("Helvetica-Bold", 10)
@@ -3205,15 +3767,12 @@ def payment_receipt_pdf(payment_id: int):
     draw_kv("Credit on Account", f"KES {float(srow['credit'] or 0):,.2f}")
 
     # Footer
-    c.setFillColor(colors.HexColor("#64748b"))
+    c.setFillColor(muted)
     c.setFont("Helvetica", 9)
     c.drawCentredString(width / 2, max(y, 22 * mm), "Thank you for your payment.")
 
     # Add QR code for authenticity (signed details)
     try:
-        from reportlab.graphics.barcode import qr as rl_qr
-        from reportlab.graphics.shapes import Drawing
-        from reportlab.graphics import renderPDF
         # Prepare signed JSON payload similar to HTML receipt
         pdate = payment.get("date")
         if hasattr(pdate, "strftime"):
@@ -3233,316 +3792,367 @@ def payment_receipt_pdf(payment_id: int):
             "ref": payment.get("reference") or "",
             "term": payment.get("term") or "",
             "year": payment.get("year") or "",
-            "school_id": session.get("school_id"),
+            "school_id": school_id,
         }
         canon = json.dumps(qr_payload, sort_keys=True, separators=(",", ":")).encode("utf-8")
         sig = hmac.new(app.secret_key.encode("utf-8"), canon, hashlib.sha256).hexdigest()[:20]
         qr_payload["sig"] = sig
         qr_text = json.dumps(qr_payload, separators=(",", ":"))
 
-        qr_widget = rl_qr.QrCodeWidget(qr_text)
-        b = qr_widget.getBounds()
         size = 36 * mm
-        w = b[2] - b[0]
-        h = b[3] - b[1]
-        d = Drawing(size, size)
-        qr_widget.transform = [size / w, 0, 0, size / h, 0, 0]
-        d.add(qr_widget)
-        renderPDF.draw(d, c, width - x_margin - size, 10 * mm)
+        d = _receipt_qr_drawing(qr_text, size)
+        rl_renderPDF.draw(d, c, width - x_margin - size, 10 * mm)
         c.setFont("Helvetica", 7.5)
-        c.setFillColor(colors.HexColor("#64748b"))
+        c.setFillColor(muted)
         c.drawRightString(width - x_margin, 9 * mm, "Scan for signed receipt data")
     except Exception:
         pass
 
-    c.showPage()
-    c.save()
-    pdf_bytes = buf.getvalue()
-    buf.close()
+    c.showPage()
+    return c.getpdfdata()
+
+
+@app.route("/payments/<int:payment_id>/receipt.pdf")
+def payment_receipt_pdf(payment_id: int):
+    """Generate a PDF receipt for a payment with school details."""
+    db = get_db_connection()
+    try:
+        cursor = db.cursor(dictionary=True)
+
+        cursor.execute(
+            """
+            SELECT p.id, p.student_id AS sid, s.name AS student_name, s.class_name, p.amount, p.method,
+                   p.reference, p.date, p.term, p.year
+            FROM payments p
+            JOIN students s ON s.id = p.student_id
+            WHERE p.id = %s AND p.school_id=%s
+            """,
+            (payment_id, session.get("school_id")),
+        )
+        payment = cursor.fetchone()
+        if not payment:
+            flash("Payment not found.", "error")
+            return redirect(url_for("payments"))
+
+        bal_col = balance_column(cursor)
+        cursor.execute(
+            f"SELECT COALESCE({bal_col}, 0) AS bal, COALESCE(credit, 0) AS credit FROM students WHERE id=%s AND school_id=%s",
+            (payment.get("sid"), session.get("school_id")),
+        )
+        srow = cursor.fetchone() or {"bal": 0.0, "credit": 0.0}
+    finally:
+        db.close()
+
+    school_name = (
+        get_setting("SCHOOL_NAME")
+        or get_setting("APP_NAME")
+        or app.config.get("APP_NAME")
+        or app.config.get("BRAND_NAME")
+        or get_setting("BRAND_NAME")
+        or "School"
+    )
+    school_address = get_setting("SCHOOL_ADDRESS") or ""
+    school_phone = get_setting("SCHOOL_PHONE") or ""
+    school_email = get_setting("SCHOOL_EMAIL") or ""
+    school_website = get_setting("SCHOOL_WEBSITE") or ""
+
+    school = (school_name, school_address, school_phone, school_email, school_website)
+    # The ETag covers everything printed on the receipt, so a matching
+    # If-None-Match is answered before any PDF work.
+    key = _receipt_pdf_key(payment, srow, school, session.get("school_id"))
+    etag = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:24]
+    if request.if_none_match.contains_weak(etag):
+        resp = Response(status=304)
+    else:
+        pdf_bytes = _receipt_pdf_bytes(payment, srow, school, session.get("school_id"))
+        resp = Response(
+            pdf_bytes,
+            mimetype="application/pdf",
+            headers={
+                "Content-Disposition": f"attachment; filename=receipt_{payment_id}.pdf",
+                "Content-Length": str(len(pdf_bytes)),
+            },
+        )
+    resp.set_etag(etag, weak=True)
+    resp.headers["Cache-Control"] = _RECEIPT_CACHE_CONTROL
+    return resp
+
+
+@app.route("/collections")
+def collections_overview():
+    from flask import redirect, url_for
+    return redirect(url_for('dashboard'))
+
+
+# ---------- ANALYTICS DATA (LIVE) ----------
+# Whether a cursor class still takes execute(..., multi=True); mysql-connector
+# 9.2 dropped the keyword and runs multi-statement strings directly, exposing
+# the extra result sets through nextset(). Detected once per cursor class.
+_CURSOR_MULTI_KWARG: dict = {}
+
+
+def _multi_result_sets(cur, sql, params):
+    """Execute a multi-statement string and return the rows of each result set."""
+    cls = type(cur)
+    multi_kwarg = _CURSOR_MULTI_KWARG.get(cls)
+    if multi_kwarg is None:
+        try:
+            multi_kwarg = "multi" in inspect.signature(cls.execute).parameters
+        except (TypeError, ValueError):
+            multi_kwarg = False
+        _CURSOR_MULTI_KWARG[cls] = multi_kwarg
+    if multi_kwarg:
+        return [res.fetchall() for res in cur.execute(sql, params, multi=True) if res.with_rows]
+    cur.execute(sql, params)
+    results = []
+    while True:
+        if cur.description is not None:
+            results.append(cur.fetchall())
+        if not cur.nextset():
+            break
+    return results
+
+
+def _fetch_batch(db, queries):
+    """Run several SELECTs in one round trip and return each statement's rows.
+
+    ``queries`` is a list of ``(sql, params, optional)``. The statements are sent
+    as a single multi-statement query; if that fails (or the connector does not
+    support it) they are re-run one by one, where a failing optional query
+    yields ``[]`` and a failing required one raises.
+
+    Server-side prepared statements are deliberately not used here: a batch
+    cannot be prepared as one statement, and pooled connections are reset on
+    release (``pool_reset_session``), which deallocates prepared handles - so
+    every call would pay a PREPARE round trip per statement on top of the
+    execute, costing more than the parse it saves.
+    """
+    try:
+        cur = db.cursor(dictionary=True)
+        sql = ";\n".join(q[0].strip().rstrip(";") for q in queries)
+        params = tuple(p for q in queries for p in q[1])
+        results = _multi_result_sets(cur, sql, params)
+        if len(results) == len(queries):
+            return results
+    except Exception:
+        pass
+    try:
+        db.consume_results()
+    except Exception:
+        pass
+    cur = db.cursor(dictionary=True)
+    out = []
+    for sql, params, optional in queries:
+        try:
+            cur.execute(sql, params)
+            out.append(cur.fetchall() or [])
+        except Exception:
+            if not optional:
+                raise
+            out.append([])
+    return out
+
 
-    return Response(
-        pdf_bytes,
-        mimetype="application/pdf",
-        headers={
-            "Content-Disposition": f"attachment; filename=receipt_{payment_id}.pdf",
-        },
-    )
+def ojsonify(obj, status: int = 200) -> Response:
+    """``jsonify`` for large payloads: orjson when installed, compact stdlib json otherwise.
+
+    ``default=str`` covers Decimal/date values straight from MySQL rows.
+    """
+    if orjson is not None:
+        body = orjson.dumps(obj, default=str)
+    else:
+        body = json.dumps(obj, default=str, separators=(",", ":"))
+    return Response(body, status=status, mimetype="application/json")
 
 
-@app.route("/collections")
-def collections_overview():
-    from flask import redirect, url_for
-    return redirect(url_for('dashboard'))
+def _analytics_response(payload: dict):
+    resp = ojsonify(payload)
+    resp.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
+    resp.headers["Pragma"] = "no-cache"
+    resp.headers["Expires"] = "0"
+    return resp
 
 
-# ---------- ANALYTICS DATA (LIVE) ----------
 @app.route("/api/analytics_data")
 def analytics_data():
     """Live analytics payload (charts + KPIs)."""
 
     db = get_db_connection()
-    cursor = db.cursor(dictionary=True)
-
-    # Resolve current academic context
     try:
-        cy, ct = get_or_seed_current_term(db)
-    except Exception:
-        cy, ct = None, None
+        cursor = db.cursor(dictionary=True)
 
-    # Timeframe filtering (generalized analytics): ignore client timeframe
-    # Always compute across all time for aggregate datasets.
-    tf = 'all'
-    days = None
+        # Resolve current academic context
+        try:
+            cy, ct = _current_term(db)
+        except Exception:
+            cy, ct = None, None
 
-    # Monthly totals (by first day label for readability)
-    if days is not None:
-        cursor.execute(
-            f"""
-            SELECT DATE_FORMAT(MIN(date), '%b %Y') AS month, SUM(amount) AS total
-            FROM payments
-            WHERE method <> 'Credit Transfer' AND school_id=%s AND date >= (CURRENT_DATE - INTERVAL {days-1} DAY)
-            GROUP BY YEAR(date), MONTH(date)
-            ORDER BY YEAR(date), MONTH(date)
-            """,
-            (session.get("school_id"),),
-        )
-    else:
+        # Timeframe filtering (generalized analytics): ignore client timeframe;
+        # aggregates cover the current term, or all time when no term is set.
+        sid = session.get("school_id")
+        # Recently built payload for this school/term; payment and student writes
+        # bump the dashboard version, so they are reflected on the next poll.
+        cache_key = ("analytics", sid, cy, ct, _DASHBOARD_VERSIONS.get(sid, 0)) if sid else None
+        cached = _dashboard_cache_get(cache_key)
+        if cached is not None:
+            return _analytics_response(cached)
+        balance_col = balance_column(cursor)
+        # Reminders: count students above a pending threshold (default KES 5,000)
+        try:
+            import os as _os
+            rem_threshold = int((_os.environ.get("REMINDER_MIN_BAL") or "5000").strip())
+        except Exception:
+            rem_threshold = 5000
+        # Current-term filter for the term-scoped aggregates (all time otherwise)
         if cy and ct in (1, 2, 3):
-            cursor.execute(
-                """
-                SELECT DATE_FORMAT(MIN(date), '%b %Y') AS month, SUM(amount) AS total
-                FROM payments
-                WHERE method <> 'Credit Transfer' AND school_id=%s AND year=%s AND term=%s
-                GROUP BY YEAR(date), MONTH(date)
-                ORDER BY YEAR(date), MONTH(date)
-                """,
-                (session.get("school_id"), cy, ct),
-            )
+            term_sql, term_params = " AND year=%s AND term=%s", (cy, ct)
+            p_term_sql = " AND p.year=%s AND p.term=%s"
         else:
-            cursor.execute(
-                """
-                SELECT DATE_FORMAT(MIN(date), '%b %Y') AS month, SUM(amount) AS total
+            term_sql, term_params = "", ()
+            p_term_sql = ""
+        ddays = 364  # show last 12 months of daily trend by default
+
+        # All KPI/chart queries go to the server in one round trip
+        (
+            monthly_data,
+            daily_trend,
+            class_summary,
+            method_breakdown,
+            top_debtors,
+            reminder_rows,
+            meta_rows,
+            recent_payments,
+        ) = _fetch_batch(db, [
+            # Monthly totals (by first day label for readability)
+            (
+                f"""
+                SELECT DATE_FORMAT(MIN(date), '%b %Y') AS month, SUM(amount) AS total,
+                       YEAR(date) AS y, MONTH(date) AS m
                 FROM payments
-                WHERE method <> 'Credit Transfer' AND school_id=%s
+                WHERE method <> 'Credit Transfer' AND school_id=%s{term_sql}
                 GROUP BY YEAR(date), MONTH(date)
                 ORDER BY YEAR(date), MONTH(date)
                 """,
-                (session.get("school_id"),),
-            )
-    monthly_data = cursor.fetchall()
-
-    # Daily trend - timeframe or default last 30 days
-    ddays = 364  # show last 12 months of daily trend by default
-    cursor.execute(
-        f"""
-        SELECT DATE(date) AS day, SUM(amount) AS total
-        FROM payments
-        WHERE date >= (CURRENT_DATE - INTERVAL {ddays} DAY)
-          AND method <> 'Credit Transfer' AND school_id=%s
-        GROUP BY DATE(date)
-        ORDER BY DATE(date)
-        """,
-        (session.get("school_id"),),
-    )
-    daily_trend = cursor.fetchall()
-
-    # Class summary
-    if days is not None:
-        cursor.execute(
-            f"""
-            SELECT 
-                s.class_name,
-                COUNT(s.id) AS total_students,
-                COALESCE(SUM(p.amount), 0) AS total_paid,
-                COALESCE(SUM(COALESCE(s.balance, s.fee_balance)), 0) AS total_pending,
-                COALESCE(SUM(s.credit), 0) AS total_credit
-            FROM students s
-            LEFT JOIN payments p ON s.id = p.student_id AND p.method <> 'Credit Transfer' AND p.school_id=%s AND p.date >= (CURRENT_DATE - INTERVAL {days-1} DAY)
-            WHERE s.school_id=%s
-            GROUP BY s.class_name
-            ORDER BY s.class_name
-            """,
-            (session.get("school_id"), session.get("school_id")),
-        )
-    else:
-        if cy and ct in (1, 2, 3):
-            cursor.execute(
-                """
-                SELECT 
-                    s.class_name,
-                    COUNT(s.id) AS total_students,
-                    COALESCE(SUM(p.amount), 0) AS total_paid,
-                    COALESCE(SUM(COALESCE(s.balance, s.fee_balance)), 0) AS total_pending,
-                    COALESCE(SUM(s.credit), 0) AS total_credit
-                FROM students s
-                LEFT JOIN payments p ON s.id = p.student_id AND p.method <> 'Credit Transfer' AND p.school_id=%s AND p.year=%s AND p.term=%s
-                WHERE s.school_id=%s
-                GROUP BY s.class_name
-                ORDER BY s.class_name
+                (sid, *term_params),
+                False,
+            ),
+            # Daily trend
+            (
+                f"""
+                SELECT DATE(date) AS day, SUM(amount) AS total
+                FROM payments
+                WHERE date >= (CURRENT_DATE - INTERVAL {ddays} DAY)
+                  AND method <> 'Credit Transfer' AND school_id=%s
+                GROUP BY DATE(date)
+                ORDER BY DATE(date)
                 """,
-                (session.get("school_id"), cy, ct, session.get("school_id")),
-            )
-        else:
-            cursor.execute(
-                """
+                (sid,),
+                False,
+            ),
+            # Class summary
+            (
+                f"""
                 SELECT 
                     s.class_name,
                     COUNT(s.id) AS total_students,
                     COALESCE(SUM(p.amount), 0) AS total_paid,
-                    COALESCE(SUM(COALESCE(s.balance, s.fee_balance)), 0) AS total_pending,
+                    COALESCE(SUM(s.{balance_col}), 0) AS total_pending,
                     COALESCE(SUM(s.credit), 0) AS total_credit
                 FROM students s
-                LEFT JOIN payments p ON s.id = p.student_id AND p.method <> 'Credit Transfer' AND p.school_id=%s
+                LEFT JOIN payments p ON s.id = p.student_id AND p.method <> 'Credit Transfer' AND p.school_id=%s{p_term_sql}
                 WHERE s.school_id=%s
                 GROUP BY s.class_name
                 ORDER BY s.class_name
                 """,
-                (session.get("school_id"), session.get("school_id")),
-            )
-    class_summary = cursor.fetchall()
-
-    # Aggregate totals for convenience (avoid client recompute)
-    try:
-        _rows = class_summary or []
-        def _val(r, key, idx):
-            try:
-                return (r.get(key) if isinstance(r, dict) else r[idx])
-            except Exception:
-                return 0
-        totals_students = int(sum(int(_val(r, "total_students", 1) or 0) for r in _rows))
-        totals_collected = float(sum(float(_val(r, "total_paid", 2) or 0) for r in _rows))
-        totals_pending = float(sum(float(_val(r, "total_pending", 3) or 0) for r in _rows))
-        totals_credit = float(sum(float(_val(r, "total_credit", 4) or 0) for r in _rows))
-    except Exception:
-        totals_students = 0
-        totals_collected = 0.0
-        totals_pending = 0.0
-        totals_credit = 0.0
-
-    # Payment method breakdown
-    if days is not None:
-        cursor.execute(
-            f"""
-            SELECT method, COUNT(*) AS count, COALESCE(SUM(amount), 0) AS total
-            FROM payments
-            WHERE school_id=%s AND date >= (CURRENT_DATE - INTERVAL {days-1} DAY)
-            GROUP BY method
-            ORDER BY total DESC
-            """,
-            (session.get("school_id"),),
-        )
-    else:
-        if cy and ct in (1, 2, 3):
-            cursor.execute(
-                """
+                (sid, *term_params, sid),
+                False,
+            ),
+            # Payment method breakdown
+            (
+                f"""
                 SELECT method, COUNT(*) AS count, COALESCE(SUM(amount), 0) AS total
                 FROM payments
-                WHERE school_id=%s AND year=%s AND term=%s
+                WHERE school_id=%s{term_sql}
                 GROUP BY method
                 ORDER BY total DESC
                 """,
-                (session.get("school_id"), cy, ct),
-            )
-        else:
-            cursor.execute(
-                """
-                SELECT method, COUNT(*) AS count, COALESCE(SUM(amount), 0) AS total
-                FROM payments
+                (sid, *term_params),
+                False,
+            ),
+            # Top debtors (highest balances)
+            (
+                f"""
+                SELECT name, class_name, COALESCE({balance_col}, 0) AS balance
+                FROM students
                 WHERE school_id=%s
-                GROUP BY method
-                ORDER BY total DESC
+                ORDER BY COALESCE({balance_col}, 0) DESC
+                LIMIT 5
                 """,
-                (session.get("school_id"),),
-            )
-    method_breakdown = cursor.fetchall()
-
-    # Top debtors (highest balances)
-    cursor.execute("SHOW COLUMNS FROM students LIKE 'balance'")
-    has_balance = bool(cursor.fetchone())
-    balance_col = "balance" if has_balance else "fee_balance"
-
-    cursor.execute(
-        f"""
-        SELECT name, class_name, COALESCE({balance_col}, 0) AS balance
-        FROM students
-        WHERE school_id=%s
-        ORDER BY COALESCE({balance_col}, 0) DESC
-        LIMIT 5
-        """,
-        (session.get("school_id"),),
-    )
-    top_debtors = cursor.fetchall()
+                (sid,),
+                False,
+            ),
+            (
+                f"SELECT COUNT(*) AS c FROM students WHERE school_id=%s AND COALESCE({balance_col},0) > %s",
+                (sid, rem_threshold),
+                True,
+            ),
+            # Meta: active classes
+            ("SELECT COUNT(DISTINCT class_name) AS active_classes FROM students WHERE school_id=%s", (sid,), False),
+            # Recent payments snapshot (used by analytics widgets)
+            (
+                """
+                SELECT p.date, s.name, s.class_name, p.amount, p.method
+                FROM payments p
+                JOIN students s ON s.id = p.student_id
+                WHERE p.school_id=%s AND p.method <> 'Credit Transfer'
+                ORDER BY p.date DESC
+                LIMIT 10
+                """,
+                (sid,),
+                True,
+            ),
+        ])
 
-    # Reminders: count students above a pending threshold (default KES 5,000)
-    try:
-        import os as _os
-        rem_threshold = int((_os.environ.get("REMINDER_MIN_BAL") or "5000").strip())
-    except Exception:
-        rem_threshold = 5000
-    try:
-        cursor.execute(
-            f"SELECT COUNT(*) AS c FROM students WHERE school_id=%s AND COALESCE({balance_col},0) > %s",
-            (session.get("school_id"), rem_threshold),
-        )
-        reminders_count = int((cursor.fetchone() or {}).get("c", 0))
-    except Exception:
-        reminders_count = 0
+        # Aggregate totals for convenience (avoid client recompute)
+        try:
+            _rows = class_summary or []
+            def _val(r, key, idx):
+                try:
+                    return (r.get(key) if isinstance(r, dict) else r[idx])
+                except Exception:
+                    return 0
+            totals_students = int(sum(int(_val(r, "total_students", 1) or 0) for r in _rows))
+            totals_collected = float(sum(float(_val(r, "total_paid", 2) or 0) for r in _rows))
+            totals_pending = float(sum(float(_val(r, "total_pending", 3) or 0) for r in _rows))
+            totals_credit = float(sum(float(_val(r, "total_credit", 4) or 0) for r in _rows))
+        except Exception:
+            totals_students = 0
+            totals_collected = 0.0
+            totals_pending = 0.0
+            totals_credit = 0.0
 
-    # Month-over-month change
-    if cy and ct in (1, 2, 3):
-        cursor.execute(
-            """
-            SELECT 
-                SUM(CASE WHEN YEAR(date) = YEAR(CURRENT_DATE) AND MONTH(date) = MONTH(CURRENT_DATE) THEN amount ELSE 0 END) AS current_month_total,
-                SUM(CASE WHEN DATE_FORMAT(date, '%Y-%m') = DATE_FORMAT(DATE_SUB(CURRENT_DATE, INTERVAL 1 MONTH), '%Y-%m') THEN amount ELSE 0 END) AS prev_month_total
-            FROM payments
-            WHERE method <> 'Credit Transfer' AND school_id=%s AND year=%s AND term=%s
-            """,
-            (session.get("school_id"), cy, ct),
-        )
-    else:
-        cursor.execute(
-            """
-            SELECT 
-                SUM(CASE WHEN YEAR(date) = YEAR(CURRENT_DATE) AND MONTH(date) = MONTH(CURRENT_DATE) THEN amount ELSE 0 END) AS current_month_total,
-                SUM(CASE WHEN DATE_FORMAT(date, '%Y-%m') = DATE_FORMAT(DATE_SUB(CURRENT_DATE, INTERVAL 1 MONTH), '%Y-%m') THEN amount ELSE 0 END) AS prev_month_total
-            FROM payments
-            WHERE method <> 'Credit Transfer' AND school_id=%s
-            """,
-            (session.get("school_id"),),
+        try:
+            reminders_count = int((reminder_rows[0] if reminder_rows else {}).get("c", 0))
+        except Exception:
+            reminders_count = 0
+
+        # Month-over-month change, read off the monthly totals (same filters)
+        by_month = {(int(r["y"]), int(r["m"])): float(r.get("total") or 0) for r in (monthly_data or []) if r.get("y")}
+        now = time.localtime()
+        prev_key = (now.tm_year - 1, 12) if now.tm_mon == 1 else (now.tm_year, now.tm_mon - 1)
+        current_month_total = by_month.get((now.tm_year, now.tm_mon), 0.0)
+        prev_month_total = by_month.get(prev_key, 0.0)
+        percent_change = (
+            round(((current_month_total - prev_month_total) / prev_month_total) * 100, 1)
+            if prev_month_total > 0
+            else (100.0 if current_month_total > 0 else 0.0)
         )
-    mom_row = cursor.fetchone() or {"current_month_total": 0, "prev_month_total": 0}
-    current_month_total = float(mom_row.get("current_month_total") or 0)
-    prev_month_total = float(mom_row.get("prev_month_total") or 0)
-    percent_change = (
-        round(((current_month_total - prev_month_total) / prev_month_total) * 100, 1)
-        if prev_month_total > 0
-        else (100.0 if current_month_total > 0 else 0.0)
-    )
 
-    # Meta: active classes
-    cursor.execute("SELECT COUNT(DISTINCT class_name) AS active_classes FROM students WHERE school_id=%s", (session.get("school_id"),))
-    active_classes = (cursor.fetchone() or {}).get("active_classes", 0)
-
-    # Recent payments snapshot (used by analytics widgets)
-    recent_payments = []
-    try:
-        cursor.execute(
-            """
-            SELECT p.date, s.name, s.class_name, p.amount, p.method
-            FROM payments p
-            JOIN students s ON s.id = p.student_id
-            WHERE p.school_id=%s AND p.method <> 'Credit Transfer'
-            ORDER BY p.date DESC
-            LIMIT 10
-            """,
-            (session.get("school_id"),),
-        )
-        recent_payments = cursor.fetchall() or []
-    except Exception:
-        recent_payments = []
+        active_classes = (meta_rows[0] if meta_rows else {}).get("active_classes", 0)
+        recent_payments = recent_payments or []
 
-    db.close()
+    finally:
+        db.close()
 
     # Normalize rows to JSON‑safe primitives (avoid Decimal/date serialization issues)
     try:
@@ -3628,7 +4238,8 @@ def analytics_data():
     try:
         school_id = session.get("school_id")
         if cy and ct in (1, 2, 3) and school_id:
-            cur2 = get_db_connection().cursor(dictionary=True)
+            cur2_db = get_db_connection(autocommit=True)
+            cur2 = cur2_db.cursor(dictionary=True)
             try:
                 cur2.execute("SELECT id, class_name FROM students WHERE school_id=%s", (school_id,))
                 stu = cur2.fetchall() or []
@@ -3676,6 +4287,7 @@ def analytics_data():
             finally:
                 try:
                     cur2.close()
+                    cur2_db.close()
                 except Exception:
                     pass
     except Exception:
@@ -3703,7 +4315,7 @@ def analytics_data():
         exp_cls_rows = []
 
     # Return the standard, lightweight analytics payload (real-time)
-    resp = jsonify(
+    payload = (
         {
             "monthly_data": [
                 {"month": (r.get("month") if isinstance(r, dict) else r[0]), "total": float((r.get("total") if isinstance(r, dict) else r[1]) or 0)}
@@ -3769,11 +4381,8 @@ def analytics_data():
             },
         }
     )
-    resp.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
-    resp.headers["Pragma"] = "no-cache"
-    resp.headers["Expires"] = "0"
-    db.close()
-    return resp
+    _dashboard_cache_set(cache_key, payload)
+    return _analytics_response(payload)
 
     # Due-date aging using invoices (requires invoices feature)
     due_aging = {
@@ -3794,7 +4403,8 @@ def analytics_data():
     try:
         sid2 = session.get("school_id")
         if sid2 and cy and ct in (1, 2, 3):
-            curx = get_db_connection().cursor(dictionary=True)
+            curx_db = get_db_connection(autocommit=True)
+            curx = curx_db.cursor(dictionary=True)
             try:
                 # Invoices for current term and school
                 curx.execute(
@@ -3895,6 +4505,7 @@ def analytics_data():
             finally:
                 try:
                     curx.close()
+                    curx_db.close()
                 except Exception:
                     pass
     except Exception:
@@ -3909,16 +4520,11 @@ def analytics_data():
     try:
         sid = session.get("school_id")
         if sid:
-            cur3 = get_db_connection().cursor(dictionary=True)
+            cur3_db = get_db_connection(autocommit=True)
+            cur3 = cur3_db.cursor(dictionary=True)
             try:
                 # Aging by last payment date
-                bal_col = "balance"
-                try:
-                    cur3.execute("SHOW COLUMNS FROM students LIKE 'balance'")
-                    if not cur3.fetchone():
-                        bal_col = "fee_balance"
-                except Exception:
-                    bal_col = "fee_balance"
+                bal_col = balance_column(cur3)
                 cur3.execute(
                     f"""
                     SELECT s.id, COALESCE({bal_col},0) AS bal,
@@ -3997,6 +4603,7 @@ def analytics_data():
             finally:
                 try:
                     cur3.close()
+                    cur3_db.close()
                 except Exception:
                     pass
     except Exception:
@@ -4039,6 +4646,26 @@ def analytics_data():
 
 
 # ---------- DOCUMENTATION ----------
+# Resolved featured video per school: (name, url). Changed only by docs_feature
+# and docs_media_delete, which drop the school's entry.
+_FEATURED_VIDEO_CACHE: dict = {}
+
+
+def _featured_video(media_root: str):
+    sid = session.get("school_id")
+    hit = _FEATURED_VIDEO_CACHE.get(sid)
+    if hit is not None:
+        return hit
+    featured_name = (get_setting("FEATURED_VIDEO_NAME") or "").strip()
+    featured_url = None
+    if featured_name:
+        candidate = os.path.join(media_root, featured_name)
+        if os.path.exists(candidate):
+            featured_url = url_for("static", filename=f"media/{featured_name}")
+    _FEATURED_VIDEO_CACHE[sid] = (featured_name, featured_url)
+    return featured_name, featured_url
+
+
 @app.route("/docs")
 def docs():
     """Media hub for documentation with featured video support."""
@@ -4050,16 +4677,41 @@ def docs():
         pass
 
     # Resolve featured video from settings
-    featured_name = (get_setting("FEATURED_VIDEO_NAME") or "").strip()
-    featured_url = None
-    if featured_name:
-        candidate = os.path.join(media_root, featured_name)
-        if os.path.exists(candidate):
-            featured_url = url_for("static", filename=f"media/{featured_name}")
+    featured_name, featured_url = _featured_video(media_root)
 
     return render_template("docs.html", featured_url=featured_url, featured_name=featured_name)
 
 
+_MEDIA_VIDEO_EXTS = frozenset({".mp4", ".webm", ".mov"})
+_MEDIA_ALLOWED_EXTS = _MEDIA_VIDEO_EXTS | {".png", ".jpg", ".jpeg", ".gif"}
+# Library listings keyed by (media_root, script_root); reused while the
+# directory's mtime is unchanged (uploads, deletes and renames all bump it).
+_MEDIA_LISTING_CACHE: dict = {}
+
+
+def _list_media(media_root: str) -> list:
+    key = (media_root, request.script_root)
+    dir_mtime = os.stat(media_root).st_mtime_ns
+    hit = _MEDIA_LISTING_CACHE.get(key)
+    if hit and hit[0] == dir_mtime:
+        return hit[1]
+    items = []
+    with os.scandir(media_root) as entries:
+        for entry in entries:
+            name = entry.name
+            ext = os.path.splitext(name)[1].lower()
+            if ext not in _MEDIA_ALLOWED_EXTS:
+                continue
+            items.append({
+                "name": name,
+                "type": "video" if ext in _MEDIA_VIDEO_EXTS else "image",
+                "url": url_for("static", filename=f"media/{name}"),
+            })
+    items.sort(key=lambda item: item["name"])
+    _MEDIA_LISTING_CACHE[key] = (dir_mtime, items)
+    return items
+
+
 @app.route("/docs/media")
 def docs_media():
     """List media files under static/media for the library grid."""
@@ -4068,22 +4720,22 @@ def docs_media():
         os.makedirs(media_root, exist_ok=True)
     except Exception:
         pass
-    items = []
-    allowed = {".mp4", ".webm", ".mov", ".png", ".jpg", ".jpeg", ".gif"}
     try:
-        for name in sorted(os.listdir(media_root)):
-            ext = os.path.splitext(name)[1].lower()
-            if ext not in allowed:
-                continue
-            mtype = "video" if ext in {".mp4", ".webm", ".mov"} else "image"
-            items.append({
-                "name": name,
-                "type": mtype,
-                "url": url_for("static", filename=f"media/{name}"),
-            })
-    except Exception:
-        items = []
-    return jsonify({"ok": True, "media": items})
+        etag = str(os.stat(media_root).st_mtime_ns)
+    except OSError:
+        etag = None
+    if etag and request.if_none_match.contains_weak(etag):
+        resp = Response(status=304)
+    else:
+        try:
+            items = _list_media(media_root)
+        except Exception:
+            items = []
+        resp = ojsonify({"ok": True, "media": items})
+    if etag:
+        resp.set_etag(etag, weak=True)
+        resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
 
 
 @app.route("/docs/upload", methods=["POST"])
@@ -4097,7 +4749,6 @@ def docs_upload():
     files = request.files.getlist("files") if request.files else []
     if not files:
         return jsonify({"ok": False, "error": "No files"}), 400
-    allowed = {".mp4", ".webm", ".mov", ".png", ".jpg", ".jpeg", ".gif"}
     saved = []
     for f in files:
         try:
@@ -4105,13 +4756,15 @@ def docs_upload():
             if not name:
                 continue
             ext = os.path.splitext(name)[1].lower()
-            if ext not in allowed:
+            if ext not in _MEDIA_ALLOWED_EXTS:
                 continue
             path = os.path.join(media_root, name)
             f.save(path)
             saved.append(name)
         except Exception:
             continue
+    if saved:
+        _FEATURED_VIDEO_CACHE.clear()
     return jsonify({"ok": True, "saved": saved})
 
 
@@ -4126,6 +4779,7 @@ def docs_media_delete(name: str):
     try:
         if os.path.isfile(path):
             os.remove(path)
+            _FEATURED_VIDEO_CACHE.clear()
         return jsonify({"ok": True})
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
@@ -4147,6 +4801,7 @@ def docs_feature():
         return jsonify({"ok": False, "error": "File not found"}), 404
     try:
         set_school_setting("FEATURED_VIDEO_NAME", name)
+        _FEATURED_VIDEO_CACHE.pop(session.get("school_id"), None)
         return jsonify({"ok": True})
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
@@ -4300,9 +4955,7 @@ def analytics_dashboard():
     cursor = db.cursor(dictionary=True)
 
     # Determine balance column
-    cursor.execute("SHOW COLUMNS FROM students LIKE 'balance'")
-    has_balance = bool(cursor.fetchone())
-    bal_col = "balance" if has_balance else "fee_balance"
+    bal_col = balance_column(cursor)
 
     # Totals for KPIs (all-time)
     cursor.execute("SELECT COUNT(*) AS total FROM students WHERE school_id=%s", (session.get("school_id"),))
@@ -4346,12 +4999,12 @@ def analytics_dashboard():
 
     # Class summary (all time)
     cursor.execute(
-        """
+        f"""
         SELECT 
             s.class_name,
             COUNT(s.id) AS total_students,
             COALESCE(SUM(p.amount), 0) AS total_paid,
-            COALESCE(SUM(COALESCE(s.balance, s.fee_balance)), 0) AS total_pending,
+            COALESCE(SUM(s.{bal_col}), 0) AS total_pending,
             COALESCE(SUM(s.credit), 0) AS total_credit
         FROM students s
         LEFT JOIN payments p ON s.id = p.student_id AND p.method <> 'Credit Transfer' AND p.school_id=%s
@@ -4680,7 +5333,7 @@ def export_fees_full():
         cy, ct = y_val, t_val
     else:
         try:
-            cy, ct = get_or_seed_current_term(db)
+            cy, ct = _current_term(db)
         except Exception:
             cy, ct = None, None
 
@@ -4894,9 +5547,7 @@ def export_school_profile_docx():
         cur.execute("SELECT COALESCE(SUM(amount),0) AS total FROM payments WHERE method <> 'Credit Transfer' AND school_id=%s", (sid,))
     total_collected = (cur.fetchone() or {}).get('total', 0)
 
-    cur.execute("SHOW COLUMNS FROM students LIKE 'balance'")
-    has_balance = bool(cur.fetchone())
-    column = 'balance' if has_balance else 'fee_balance'
+    column = balance_column(cur)
     cur.execute(f"SELECT COALESCE(SUM({column}),0) AS total FROM students WHERE school_id=%s", (sid,))
     total_balance = (cur.fetchone() or {}).get('total', 0)
     cur.execute("SELECT COALESCE(SUM(credit),0) AS total FROM students WHERE school_id=%s", (sid,))
@@ -5081,7 +5732,11 @@ def export_school_profile_docx():
         if y_val and t_val:
             y_sel, t_sel = int(y_val), int(t_val)
         else:
-            y_sel, t_sel = get_or_seed_current_term(get_db_connection())
+            term_db = get_db_connection()
+            try:
+                y_sel, t_sel = get_or_seed_current_term(term_db)
+            finally:
+                term_db.close()
     except Exception:
         y_sel, t_sel = None, None
     expected_term_total = float(exp_map.get((int(y_sel or 0), int(t_sel or 0)), 0.0)) if (y_sel and t_sel) else 0.0
@@ -5109,8 +5764,10 @@ def export_school_profile_docx():
     # Compute expected and capped-paid per class for selected/current term
     expected_by_class = {}
     paid_capped_by_class = {}
+    cur2_db = None
     try:
-        cur2 = get_db_connection().cursor(dictionary=True)
+        cur2_db = get_db_connection(autocommit=True)
+        cur2 = cur2_db.cursor(dictionary=True)
         cur2.execute("SELECT id, class_name FROM students WHERE school_id=%s", (sid,))
         stu = cur2.fetchall() or []
         id2class = {r['id']: (r.get('class_name') or '') for r in stu}
@@ -5146,6 +5803,12 @@ def export_school_profile_docx():
     except Exception:
         expected_by_class = {}
         paid_capped_by_class = {}
+    finally:
+        if cur2_db is not None:
+            try:
+                cur2_db.close()
+            except Exception:
+                pass
 
     for row in class_rows:
         cls = row.get('class') or ''
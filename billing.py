@@ -3,23 +3,34 @@
 
 from __future__ import annotations
 
+import io
 import os
+import time
+import atexit
+import gzip
+import re
 import hmac
+import secrets
 import base64
 import uuid
 import hashlib
+import queue
 import smtplib
+import threading
+from functools import lru_cache
 from email.message import EmailMessage
 from datetime import datetime, timedelta
 from typing import Optional, Tuple, Dict, Any
 
 from flask import (
     Blueprint,
+    Response,
     request,
     jsonify,
     current_app,
+    g,
+    has_app_context,
     url_for,
-    render_template_string,
 )
 from werkzeug.utils import secure_filename
 
@@ -44,6 +55,9 @@ except Exception:  # pragma: no cover
 
 billing_bp = Blueprint("billing", __name__, url_prefix="/billing")
 
+# Naive UTC, matching the DateTime columns below; bound once for the handlers.
+_utcnow = datetime.utcnow
+
 
 # -----------------------------
 # Config / Constants
@@ -64,8 +78,16 @@ def _require_secret() -> str:
     return secret
 
 
+# Environment-derived settings are read once per process; restart to pick up
+# changes. _school_email is not cached here because it is per school and
+# utils.settings already serves it from its own snapshot cache.
+@lru_cache(maxsize=1)
+def _env_base_url() -> str:
+    return (os.getenv("BASE_URL") or "").strip().rstrip("/")
+
+
 def _base_url() -> str:
-    env_base = (os.getenv("BASE_URL") or "").strip().rstrip("/")
+    env_base = _env_base_url()
     if env_base:
         return env_base
     try:
@@ -74,6 +96,7 @@ def _base_url() -> str:
         return "http://localhost:5000"
 
 
+@lru_cache(maxsize=1)
 def _admin_email() -> str:
     return os.getenv("ADMIN_EMAIL", "").strip()
 
@@ -89,7 +112,9 @@ def _school_email() -> str:
     return _admin_email()
 
 
+@lru_cache(maxsize=1)
 def _smtp_config() -> Dict[str, Any]:
+    # Shared between callers; treat as read-only.
     return {
         "host": os.getenv("SMTP_HOST", "").strip(),
         "port": int(os.getenv("SMTP_PORT", "587")),
@@ -100,6 +125,7 @@ def _smtp_config() -> Dict[str, Any]:
     }
 
 
+@lru_cache(maxsize=1)
 def _inbound_secret() -> str:
     return os.getenv("EMAIL_INBOUND_SECRET", "").strip()
 
@@ -125,7 +151,7 @@ class LicenseRequest(db.Model):
     amount = db.Column(db.Numeric(10, 2), nullable=False)
     message = db.Column(db.Text, nullable=True)
     status = db.Column(db.String(20), nullable=False, default="PENDING")  # PENDING/VERIFIED/REJECTED/ACTIVATED
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=_utcnow)
     verify_token = db.Column(db.String(36), unique=True, index=True)
     verify_expires = db.Column(db.DateTime, nullable=False)
     admin_note = db.Column(db.Text, nullable=True)
@@ -139,21 +165,28 @@ class LicenseKey(db.Model):
     request_id = db.Column(db.String(36), db.ForeignKey("license_requests.id"), nullable=False, index=True)
     user_email = db.Column(db.String(255), nullable=False, index=True)
     license_key = db.Column(db.String(255), nullable=False, unique=True, index=True)
-    issued_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    issued_at = db.Column(db.DateTime, default=_utcnow, nullable=False)
     expires_at = db.Column(db.DateTime, nullable=True)  # NULL == lifetime
-    signature = db.Column(db.String(64), nullable=False)  # hex signature
+    # Full hex HMAC, kept for audit only: verification recomputes it from the
+    # row's issued_at/expires_at and checks the prefix embedded in the key.
+    signature = db.Column(db.String(64), nullable=False)
     active = db.Column(db.Boolean, default=False, nullable=False)
 
 
-def _issue_license_for_request(req: "LicenseRequest", admin_name: str, admin_note: Optional[str], expires_at: Optional[datetime]) -> "LicenseKey":
-    """Issue a license for a request, email the user (not activated yet). Returns LicenseKey."""
+def _issue_license_for_request(
+    req: "LicenseRequest", admin_name: str, admin_note: Optional[str], expires_at: Optional[datetime], activate: bool = False
+) -> "LicenseKey":
+    """Issue a license for a request, email the user (not activated yet). Returns LicenseKey.
+
+    With ``activate=True`` the license is also activated in the same commit.
+    """
     secret = _require_secret()
     license_key, signature, payload = generate_license_key(req.user_email, expires_at, secret)
     lic = LicenseKey(
         request_id=req.id,
         user_email=req.user_email,
         license_key=license_key,
-        issued_at=datetime.utcnow(),
+        issued_at=_utcnow(),
         expires_at=expires_at,
         signature=signature,
         active=False,
@@ -164,63 +197,90 @@ def _issue_license_for_request(req: "LicenseRequest", admin_name: str, admin_not
     req.admin_note = admin_note
     req.admin_verified_by = admin_name
     req.verify_token = None
-    req.verify_expires = datetime.utcnow() - timedelta(seconds=1)
+    req.verify_expires = _utcnow() - timedelta(seconds=1)
+    if activate:
+        _mark_license_active(req.user_email, lic, req)
+    # Read before the commit expires req, so the emails need no reload.
+    user_name, user_email = req.user_name, req.user_email
     db.session.commit()
 
-    base = _base_url()
     subject_user = "Your SmartEduPay Premium License"
     expires_label = "Lifetime" if not expires_at else expires_at.strftime("%Y-%m-%d")
-    body_user = f"""
-    <p>Thank you {req.user_name},</p>
-    <p>Your payment was verified. Here are your license details:</p>
-    <p><strong>License Key:</strong> <code>{license_key}</code><br/>
-    <strong>Expires:</strong> {expires_label}</p>
-    <p>To activate:</p>
-    <ol>
-      <li>Go to <a href="{base}/admin/billing">{base}/admin/billing</a> and paste the key, or</li>
-      <li>Open <a href="{base}/activate">{base}/activate</a> and follow the steps below.</li>
-    </ol>
-    <p>Keep this key private.</p>
-    """
-    _send_email(req.user_email, subject_user, body_user)
+    body_user = _render_page(
+        LICENSE_ISSUED_EMAIL,
+        user_name=user_name,
+        license_key=license_key,
+        expires=expires_label,
+        base_url=_base_url(),
+    )
+    _queue_email(user_email, subject_user, body_user)
 
     # Also notify the school email with the license details
     try:
         school_email = _school_email()
         if school_email:
-            _send_email(
+            _queue_email(
                 school_email,
-                f"[SmartEduPay] License issued for {req.user_email}",
-                f"<p>Issued license for {req.user_email}.<br><strong>Key:</strong> {license_key}<br><strong>Expires:</strong> {expires_label}</p>",
+                f"[SmartEduPay] License issued for {user_email}",
+                _render_page(
+                    LICENSE_NOTICE_EMAIL, user_email=user_email, license_key=license_key, expires=expires_label
+                ),
             )
     except Exception:
         pass
     return lic
 
 
-def _activate_license_for_user(email: str, lic: "LicenseKey") -> None:
-    """Mark license active and set user's premium flag if model exists."""
-    lic.active = True
-    try:
-        from models import User  # type: ignore
-    except Exception:
+_USER_MODEL: Any = None
+_USER_MODEL_RESOLVED = False
+
+
+def _user_model():
+    """The app's User model, or None; resolved once, not at import."""
+    global _USER_MODEL, _USER_MODEL_RESOLVED
+    if not _USER_MODEL_RESOLVED:
+        # Only models.py can define User: app is a single module, so an
+        # ``app.models`` fallback would just re-import app.py under __main__.
         try:
-            from app.models import User  # type: ignore
+            from models import User  # type: ignore
         except Exception:
             User = None  # type: ignore
+        _USER_MODEL = User
+        _USER_MODEL_RESOLVED = True
+    return _USER_MODEL
+
+
+# Resolve when the blueprint is registered, after the app's modules have been
+# imported, so the first activation does not pay for the import attempts.
+billing_bp.record_once(lambda state: _user_model())
+
 
+def _activate_license_for_user(email: str, lic: "LicenseKey", req: Optional["LicenseRequest"] = None) -> None:
+    """Mark license active and set user's premium flag if model exists."""
+    _mark_license_active(email, lic, req)
+    db.session.commit()
+
+
+def _mark_license_active(email: str, lic: "LicenseKey", req: Optional["LicenseRequest"] = None) -> None:
+    """Session changes for activation; the caller commits."""
+    lic.active = True
+    User = _user_model()
     if User is not None:
         user_obj = User.query.filter_by(email=email).first()
         if user_obj is not None and hasattr(user_obj, "is_premium"):
             setattr(user_obj, "is_premium", True)
     # Also mark original request as ACTIVATED if present
     try:
-        req = LicenseRequest.query.filter_by(id=lic.request_id).first()
-        if req:
+        if req is not None:
             req.status = "ACTIVATED"
+        else:
+            # Only the status changes, so update it in place rather than
+            # loading the request row first.
+            LicenseRequest.query.filter_by(id=lic.request_id).update(
+                {"status": "ACTIVATED"}, synchronize_session=False
+            )
     except Exception:
         pass
-    db.session.commit()
 
 
 # -----------------------------
@@ -228,29 +288,74 @@ def _activate_license_for_user(email: str, lic: "LicenseKey") -> None:
 # -----------------------------
 
 
+_B36 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+# Every two-digit base36 string, so each loop step peels off 36**2 at once.
+_B36_PAIRS = tuple(a + b for a in _B36 for b in _B36)
+
+
 def _to_base36(n: int) -> str:
-    chars = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
-    if n == 0:
-        return "0"
-    digits = []
     x = abs(n)
-    while x:
-        x, rem = divmod(x, 36)
-        digits.append(chars[rem])
-    return "".join(reversed(digits))
+    if x < 36:
+        return _B36[x]
+    pairs = _B36_PAIRS
+    out = ""
+    while x >= 1296:
+        x, rem = divmod(x, 1296)
+        out = pairs[rem] + out
+    return (pairs[x] if x >= 36 else _B36[x]) + out
 
 
 def _email_hash_segment(email: str) -> str:
-    h = hashlib.sha1((email or "").lower().encode("utf-8")).hexdigest()
+    return _email_hash_segment_lower((email or "").lower())
+
+
+@lru_cache(maxsize=4096)
+def _email_hash_segment_lower(email: str) -> str:
+    # Keyed on the lowercased email so "A@x" and "a@x" share one entry.
+    h = hashlib.sha1(email.encode("utf-8")).hexdigest()
     return _to_base36(int(h[:12], 16)).upper()[:6]
 
 
+# Nonce bytes are drawn from a 4 KB urandom buffer instead of one getrandom()
+# syscall per key. The buffer is dropped in forked children so two workers
+# never hand out the same bytes.
+_RAND_POOL = bytearray()
+_RAND_LOCK = threading.Lock()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_RAND_POOL.clear)
+
+
+def _rand_bytes(n: int) -> bytes:
+    with _RAND_LOCK:
+        if len(_RAND_POOL) < n:
+            _RAND_POOL.extend(os.urandom(4096))
+        out = bytes(_RAND_POOL[:n])
+        del _RAND_POOL[:n]
+    return out
+
+
 def _rand_nonce_seg() -> str:
-    r = int.from_bytes(os.urandom(5), "big")  # 40 bits
+    r = int.from_bytes(_rand_bytes(5), "big")  # 40 bits
     s = _to_base36(r).upper()
     return s.zfill(8)[-8:]
 
 
+# Keyed HMAC-SHA256 state for the current secret; copying it skips re-running
+# the ipad/opad key schedule on every license operation.
+_HMAC_TEMPLATE: Optional[Tuple[str, "hmac.HMAC"]] = None
+
+
+def _license_hmac(secret: str, payload: str) -> "hmac.HMAC":
+    global _HMAC_TEMPLATE
+    cached = _HMAC_TEMPLATE
+    if cached is None or cached[0] != secret:
+        cached = (secret, hmac.new(secret.encode("utf-8"), b"", hashlib.sha256))
+        _HMAC_TEMPLATE = cached
+    h = cached[1].copy()
+    h.update(payload.encode("utf-8"))
+    return h
+
+
 def _expiry_segment(expires_at: Optional[datetime]) -> str:
     if not expires_at:
         return "LIFE"
@@ -263,20 +368,44 @@ def generate_license_key(user_email: str, expires_at: Optional[datetime], secret
     Payload: f"{user_email}|{issued_at_iso}|{expires_or_LIFETIME}|{nonce}"
     Key: "{rand8}-{hash6}-{EXPSEG}-{sig16}"
     """
-    issued_at = datetime.utcnow()
+    issued_at = _utcnow()
     nonce = _rand_nonce_seg()
     exp_str = "LIFETIME" if not expires_at else expires_at.isoformat()
     payload = f"{user_email.lower()}|{issued_at.isoformat()}|{exp_str}|{nonce}"
-    sig = hmac.new(secret.encode("utf-8"), payload.encode("utf-8"), hashlib.sha256).hexdigest()
+    sig = _license_hmac(secret, payload).hexdigest()
     key = f"{nonce}-{_email_hash_segment(user_email)}-{_expiry_segment(expires_at)}-{sig[:16].upper()}"
     return key, sig, payload
 
 
+# Successful verifications, keyed on every input. The result is a pure function
+# of those inputs, so a hit is always correct; the TTL only bounds memory for
+# repeated "activate" clicks and client retries.
+_VERIFY_CACHE_TTL = 300.0
+_VERIFY_CACHE_MAX = 1024
+_VERIFY_CACHE: dict = {}
+
+
 def verify_license_key(license_key: str, secret: str, issued_at: datetime, expires_at: Optional[datetime], user_email: str) -> Dict[str, Any]:
     """
     Verify signature using DB-known issued_at and expires_at.
     Returns dict with parsed fields on success; raises ValueError on failure.
     """
+    key = (license_key, secret, issued_at, expires_at, (user_email or "").lower())
+    now = time.monotonic()
+    hit = _VERIFY_CACHE.get(key)
+    if hit and now - hit[0] < _VERIFY_CACHE_TTL:
+        return dict(hit[1])
+    result = _verify_license_key(license_key, secret, issued_at, expires_at, user_email)
+    if len(_VERIFY_CACHE) >= _VERIFY_CACHE_MAX:
+        for k in [k for k, v in _VERIFY_CACHE.items() if now - v[0] >= _VERIFY_CACHE_TTL]:
+            _VERIFY_CACHE.pop(k, None)
+        while len(_VERIFY_CACHE) >= _VERIFY_CACHE_MAX:
+            _VERIFY_CACHE.pop(next(iter(_VERIFY_CACHE)), None)
+    _VERIFY_CACHE[key] = (now, result)
+    return dict(result)
+
+
+def _verify_license_key(license_key: str, secret: str, issued_at: datetime, expires_at: Optional[datetime], user_email: str) -> Dict[str, Any]:
     if not license_key or "-" not in license_key:
         raise ValueError("Malformed license key.")
     parts = license_key.strip().split("-")
@@ -285,10 +414,17 @@ def verify_license_key(license_key: str, secret: str, issued_at: datetime, expir
     nonce, hash6, expseg, sig16 = parts
     exp_str = "LIFETIME" if not expires_at else expires_at.isoformat()
     payload = f"{user_email.lower()}|{issued_at.isoformat()}|{exp_str}|{nonce}"
-    sig = hmac.new(secret.encode("utf-8"), payload.encode("utf-8"), hashlib.sha256).hexdigest()
-    if sig[:16].upper() != sig16.upper():
+    digest = _license_hmac(secret, payload).digest()
+    # The key carries the first 8 digest bytes as hex. Compare the raw bytes
+    # in constant time so a forged key cannot learn the prefix incrementally.
+    try:
+        given = bytes.fromhex(sig16) if len(sig16) == 16 else b""
+    except ValueError:
+        given = b""
+    if not hmac.compare_digest(digest[:8], given):
         raise ValueError("Invalid license signature.")
-    if _email_hash_segment(user_email).upper() != hash6.upper():
+    sig = digest.hex()
+    if _email_hash_segment(user_email) != hash6.upper():
         raise ValueError("License key does not match email.")
     return {"nonce": nonce, "email_hash": hash6, "expires_segment": expseg, "signature_prefix": sig16, "payload": payload, "signature": sig}
 
@@ -298,6 +434,51 @@ def verify_license_key(license_key: str, secret: str, issued_at: datetime, expir
 # -----------------------------
 
 
+def _smtp_open(cfg: Dict[str, Any]) -> smtplib.SMTP:
+    server = smtplib.SMTP(cfg["host"], cfg["port"])
+    try:
+        if cfg["use_tls"]:
+            server.starttls()
+        if cfg["user"] and cfg["pass"]:
+            server.login(cfg["user"], cfg["pass"])
+    except Exception:
+        server.close()
+        raise
+    return server
+
+
+def _smtp_connection(cfg: Dict[str, Any]) -> Tuple[smtplib.SMTP, bool]:
+    """Return ``(server, reused)``: the request's open SMTP session, or a new one.
+
+    Several notifications go out per request (admin alert, user + school license
+    mails), so the connected/STARTTLS/authenticated session is kept on ``g`` and
+    closed at request teardown instead of repeating the handshake per message.
+    """
+    key = (cfg["host"], cfg["port"], cfg["user"], cfg["use_tls"])
+    if has_app_context():
+        cached = g.get("_billing_smtp")
+        if cached and cached[0] == key:
+            return cached[1], True
+        _close_smtp()
+    server = _smtp_open(cfg)
+    if has_app_context():
+        g._billing_smtp = (key, server)
+    return server, False
+
+
+@billing_bp.teardown_app_request
+def _close_smtp(exc=None) -> None:
+    cached = g.pop("_billing_smtp", None) if has_app_context() else None
+    if cached:
+        try:
+            cached[1].quit()
+        except Exception:
+            try:
+                cached[1].close()
+            except Exception:
+                pass
+
+
 def _send_email(to_email: str, subject: str, html_body: str, inline_image: Optional[bytes] = None) -> None:
     cfg = _smtp_config()
     if not (cfg["host"] and cfg["from"] and to_email):
@@ -313,37 +494,98 @@ def _send_email(to_email: str, subject: str, html_body: str, inline_image: Optio
         img_cid = "preview@inline"
         msg.get_payload()[1].add_related(inline_image, maintype="image", subtype="png", cid=f"<{img_cid}>")
     try:
-        with smtplib.SMTP(cfg["host"], cfg["port"]) as server:
-            if cfg["use_tls"]:
-                server.starttls()
-            if cfg["user"] and cfg["pass"]:
-                server.login(cfg["user"], cfg["pass"])
+        server, reused = _smtp_connection(cfg)
+        try:
+            server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            if not reused:
+                raise
+            # The kept session timed out server-side; reconnect once
+            _close_smtp()
+            server, _ = _smtp_connection(cfg)
             server.send_message(msg)
+        if not has_app_context():
+            server.quit()
         _log("Email sent:", subject, "->", to_email)
     except Exception as e:  # pragma: no cover
         _log("Failed sending email:", e)
 
 
+# Notifications are sent by a background thread so request handlers return as
+# soon as their DB work is committed. The worker sends everything queued on a
+# single SMTP session and keeps it open for a short idle window, so the two or
+# three notifications one action produces share a TLS handshake and login.
+_EMAIL_QUEUE: "queue.Queue[tuple]" = queue.Queue()
+_EMAIL_IDLE_CLOSE_S = 2.0
+_EMAIL_WORKER_LOCK = threading.Lock()
+_EMAIL_WORKER: Optional[threading.Thread] = None
+
+
+def _email_worker() -> None:
+    while True:
+        app, *item = _EMAIL_QUEUE.get()
+        with app.app_context():
+            try:
+                while True:
+                    try:
+                        _send_email(*item)
+                    finally:
+                        _EMAIL_QUEUE.task_done()
+                    try:
+                        _app, *item = _EMAIL_QUEUE.get(timeout=_EMAIL_IDLE_CLOSE_S)
+                    except queue.Empty:
+                        break
+            except Exception as e:  # pragma: no cover
+                _log("Email worker error:", e)
+            finally:
+                _close_smtp()
+
+
+def _flush_email_queue(timeout: float = 10.0) -> None:
+    """Give queued notifications a bounded chance to go out before exit."""
+    worker = _EMAIL_WORKER
+    if worker is None or not worker.is_alive():
+        return
+    deadline = time.monotonic() + timeout
+    while _EMAIL_QUEUE.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+# The worker is a daemon thread; without this, mail queued just before a
+# worker restart or shutdown would be dropped.
+atexit.register(_flush_email_queue)
+
+
+def _queue_email(to_email: str, subject: str, html_body: str, inline_image: Optional[bytes] = None) -> None:
+    """Queue a notification for the background sender (sends inline without an app context)."""
+    global _EMAIL_WORKER
+    if not has_app_context():
+        _send_email(to_email, subject, html_body, inline_image)
+        return
+    with _EMAIL_WORKER_LOCK:
+        if _EMAIL_WORKER is None or not _EMAIL_WORKER.is_alive():
+            _EMAIL_WORKER = threading.Thread(target=_email_worker, name="billing-mail", daemon=True)
+            _EMAIL_WORKER.start()
+    _EMAIL_QUEUE.put((current_app._get_current_object(), to_email, subject, html_body, inline_image))
+
+
+# Reply separators ("On ... wrote:", or a From:/Sent:/Subject: header line)
+# and quoted lines, matched in one pass each instead of a per-line loop.
+_REPLY_CUT_RE = re.compile(r"^(?:on .*wrote:$|from:|sent:|subject:)", re.IGNORECASE | re.MULTILINE)
+_QUOTED_LINE_RE = re.compile(r"^>.*\n?", re.MULTILINE)
+
+
 def _strip_quoted_reply(text: str) -> str:
     """Return the top portion of an email reply, ignoring quoted history.
     Removes lines starting with '>' and content after common reply separators.
     """
     if not text:
         return ""
-    lines = []
-    for raw in text.splitlines():
-        line = raw.strip("\r\n")
-        # Stop at common separators
-        lower = line.lower()
-        if lower.startswith("on ") and lower.endswith("wrote:"):
-            break
-        if lower.startswith("from:") or lower.startswith("sent:") or lower.startswith("subject:"):
-            # likely header section in reply
-            break
-        if line.startswith(">"):
-            continue
-        lines.append(line)
-    return "\n".join(lines).strip()
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    m = _REPLY_CUT_RE.search(text)
+    if m:
+        text = text[: m.start()]
+    return _QUOTED_LINE_RE.sub("", text).strip()
 
 
 def _parse_simple_yes_no(text: str) -> Optional[str]:
@@ -429,7 +671,7 @@ ADMIN_VERIFY_PAGE = """
         <div class="col">
           <h3>Receipt Preview</h3>
           {% if is_image and preview_b64 %}
-            <img alt="Receipt Preview" src="data:image/png;base64,{{ preview_b64 }}" />
+            <img alt="Receipt Preview" src="data:{{ preview_mime or 'image/png' }};base64,{{ preview_b64 }}" />
           {% else %}
             <p class="muted">Preview not available. This file is likely a PDF. Use the public link above to view.</p>
           {% endif %}
@@ -505,62 +747,192 @@ ACTIVATION_RESULT_PAGE = """
 </html>
 """
 
+# Notification bodies. Rendered through _render_page, so they are compiled once
+# and user-supplied values (names, messages, admin notes) are HTML-escaped.
+NEW_REQUEST_EMAIL = """
+<h3>New Premium Request</h3>
+<p><strong>Name:</strong> {{ name }}<br>
+<strong>Email:</strong> {{ email }}<br>
+<strong>Amount:</strong> {{ amount }}<br>
+<strong>Message:</strong> {{ message or '-' }}<br>
+<strong>Uploaded:</strong> {{ created_at }}</p>
+<p>Receipt file: {{ stored_file }}</p>
+<p><a href="{{ verify_link }}">Verify request</a>: {{ verify_link }}</p>
+<hr/>
+<p><strong>Quick Reply:</strong> You can simply reply to this email with <strong>YES</strong> to approve and auto-activate the license (the key will be emailed to the school email), or <strong>NO</strong> to reject. Keep the subject unchanged so the system can match this request. Token: REQ:{{ token }}</p>
+"""
+
+LICENSE_ISSUED_EMAIL = """
+<p>Thank you {{ user_name }},</p>
+<p>Your payment was verified. Here are your license details:</p>
+<p><strong>License Key:</strong> <code>{{ license_key }}</code><br/>
+<strong>Expires:</strong> {{ expires }}</p>
+<p>To activate:</p>
+<ol>
+  <li>Go to <a href="{{ base_url }}/admin/billing">{{ base_url }}/admin/billing</a> and paste the key, or</li>
+  <li>Open <a href="{{ base_url }}/activate">{{ base_url }}/activate</a> and follow the steps below.</li>
+</ol>
+<p>Keep this key private.</p>
+"""
+
+LICENSE_NOTICE_EMAIL = """
+<p>Issued {{ 'and activated ' if activated }}license for {{ user_email }}.<br><strong>Key:</strong> {{ license_key }}<br><strong>Expires:</strong> {{ expires }}</p>
+"""
+
+REQUEST_REJECTED_EMAIL = """
+<p>Hello {{ user_name }},</p>
+<p>Your premium request has been reviewed and could not be verified at this time.</p>
+<p>Note: {{ note or 'No additional details provided.' }}</p>
+<p>Please reply to this email if you think this is a mistake.</p>
+"""
+
+REQUEST_REJECTED_NOTICE_EMAIL = """
+<p>Request {{ req_id }} for {{ user_email }} marked REJECTED.</p><p><a href="{{ base_url }}/admin">Admin</a></p>
+"""
+
+# render_template_string compiles its source on every call; the pages above are
+# constant, so compile each once per Jinja environment and reuse it.
+_PAGE_TEMPLATES: dict = {}
+
+
+def _render_page(source: str, **context) -> str:
+    app = current_app._get_current_object()
+    key = (id(app.jinja_env), source)
+    tmpl = _PAGE_TEMPLATES.get(key)
+    if tmpl is None:
+        tmpl = _PAGE_TEMPLATES[key] = app.jinja_env.from_string(source)
+    app.update_template_context(context)
+    return tmpl.render(context)
+
+
+def _render_activation_error(error: str) -> str:
+    # Error replies all share the cached ACTIVATION_RESULT_PAGE template.
+    return _render_page(ACTIVATION_RESULT_PAGE, success=False, error=error, base_url=_base_url())
+
 
 # -----------------------------
 # Internal utils
 # -----------------------------
 
 
+_UPLOAD_DIR_READY = False
+
+
 def _ensure_upload_dir() -> None:
+    # makedirs stats every path component; once it has succeeded the
+    # directory exists for the life of the process.
+    global _UPLOAD_DIR_READY
+    if _UPLOAD_DIR_READY:
+        return
     try:
         os.makedirs(UPLOAD_DIR, exist_ok=True)
+        _UPLOAD_DIR_READY = True
     except Exception as e:
         _log("Failed to create upload directory:", e)
         raise
 
 
-def _read_file_bytes(file_storage) -> bytes:
-    data = file_storage.read()
-    file_storage.stream.seek(0)
-    if len(data) > MAX_SIZE_BYTES:
+def _upload_size(file_storage) -> int:
+    """Size of the upload in bytes, rejecting anything over MAX_SIZE_BYTES.
+
+    Werkzeug spools uploads to a seekable stream, so the size comes from
+    seeking to the end rather than reading the body into memory.
+    """
+    stream = file_storage.stream
+    try:
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+    except Exception:
+        # Unseekable stream: fall back to a bounded read.
+        size = len(file_storage.read(MAX_SIZE_BYTES + 1))
+    stream.seek(0)
+    if size > MAX_SIZE_BYTES:
         raise ValueError("File too large (max 5MB).")
-    return data
+    return size
+
+
+def _sniff_mime(head: bytes) -> Optional[str]:
+    """Identify an allowed upload type from its leading bytes."""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    # Readers accept a little junk before the PDF header.
+    if b"%PDF-" in head:
+        return "application/pdf"
+    return None
 
 
-def _validate_upload(file_storage) -> Tuple[str, str, bytes]:
+def _validate_upload(file_storage) -> Tuple[str, str, int]:
     if not file_storage:
         raise ValueError("Missing receipt file.")
     filename = secure_filename(file_storage.filename or "")
     ext = os.path.splitext(filename)[1].lower()
     if ext not in ALLOWED_EXT:
         raise ValueError("Unsupported file type. Allowed: png, jpg, jpeg, pdf.")
-    mimetype = (file_storage.mimetype or "").lower()
-    if mimetype not in ALLOWED_MIME:
+    # Trust the file header, not the client-sent Content-Type; 512 bytes is
+    # enough to tell the allowed types apart.
+    stream = file_storage.stream
+    head = stream.read(512)
+    stream.seek(0)
+    mimetype = _sniff_mime(head)
+    if mimetype not in ALLOWED_MIME or (mimetype == "application/pdf") != (ext == ".pdf"):
         raise ValueError("Unsupported content type.")
-    data = _read_file_bytes(file_storage)
-    return filename, mimetype, data
+    size = _upload_size(file_storage)
+    return filename, mimetype, size
 
 
 def _save_receipt(file_storage) -> str:
     _ensure_upload_dir()
-    filename, mimetype, data = _validate_upload(file_storage)
+    filename, mimetype, _size = _validate_upload(file_storage)
     stored_name = f"{uuid.uuid4().hex[:12]}_{filename}"
     path = os.path.join(UPLOAD_DIR, stored_name)
-    with open(path, "wb") as f:
-        f.write(data)
-    _log("Saved receipt:", path)
+    # Streams to disk in 64 KB chunks instead of buffering the whole file.
+    file_storage.save(path, buffer_size=64 * 1024)
+    _log("Saved receipt:", path, os.stat(path).st_size, "bytes")
     return stored_name
 
 
-def _img_preview_if_image(filename: str) -> Optional[str]:
+# Longest edge of the verify-page preview; large enough to read a receipt.
+_PREVIEW_MAX_PX = 1000
+
+
+def _img_preview_if_image(filename: str) -> Optional[Tuple[str, str]]:
+    """Return (mimetype, base64) for an image receipt, or None."""
     ext = os.path.splitext(filename)[1].lower()
     if ext not in {".png", ".jpg", ".jpeg"}:
         return None
     path = os.path.join(UPLOAD_DIR, filename)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    preview = _img_preview_cached(path, mtime)
+    if preview is not None:
+        return preview
+    # No Pillow (or an unreadable image): inline the original, uncached since
+    # it can be the full upload size.
     try:
         with open(path, "rb") as f:
             b = f.read()
-        return base64.b64encode(b).decode("utf-8")
+        mime = "image/png" if ext == ".png" else "image/jpeg"
+        return mime, base64.b64encode(b).decode("utf-8")
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=64)
+def _img_preview_cached(path: str, mtime: int) -> Optional[Tuple[str, str]]:
+    # Only downscaled thumbnails are cached (a few hundred KB at most);
+    # mtime is part of the key so a replaced file is re-encoded.
+    try:
+        from PIL import Image  # type: ignore
+
+        with Image.open(path) as img:
+            img.thumbnail((_PREVIEW_MAX_PX, _PREVIEW_MAX_PX))
+            buf = io.BytesIO()
+            img.convert("RGB").save(buf, format="JPEG", quality=85)
+        return "image/jpeg", base64.b64encode(buf.getvalue()).decode("utf-8")
     except Exception:
         return None
 
@@ -588,7 +960,7 @@ def submit_request():
             return jsonify({"error": "Invalid amount"}), 400
 
         stored_file = _save_receipt(receipt)
-        token = str(uuid.uuid4())
+        token = secrets.token_urlsafe(24)  # 32 chars, fits verify_token
         req = LicenseRequest(
             user_name=name,
             user_email=email,
@@ -597,7 +969,7 @@ def submit_request():
             message=message,
             status="PENDING",
             verify_token=token,
-            verify_expires=datetime.utcnow() + timedelta(days=7),
+            verify_expires=_utcnow() + timedelta(days=7),
         )
         db.session.add(req)
         db.session.commit()
@@ -607,27 +979,21 @@ def submit_request():
         base = _base_url()
         verify_link = f"{base}{url_for('billing.verify_page', verify_token=token)}"
         subject = f"[SmartEduPay] New Premium Request from {name} ({email}) [REQ:{token}]"
-        preview_b64 = _img_preview_if_image(stored_file)
-        preview_html = (
-            f'<p><img alt="preview" src="data:image/png;base64,{preview_b64}" style="max-width:420px;border:1px solid #eee;border-radius:8px;"/></p>'
-            if preview_b64
-            else ""
+        # No inline receipt image: the verify page shows the preview, and a
+        # base64 data: URL made the mail several MB for a full-size upload.
+        body = _render_page(
+            NEW_REQUEST_EMAIL,
+            name=name,
+            email=email,
+            amount=amt_val,
+            message=message,
+            created_at=req.created_at,
+            stored_file=stored_file,
+            verify_link=verify_link,
+            token=token,
         )
-        body = f"""
-        <h3>New Premium Request</h3>
-        <p><strong>Name:</strong> {name}<br>
-        <strong>Email:</strong> {email}<br>
-        <strong>Amount:</strong> {amt_val}<br>
-        <strong>Message:</strong> {message or '-'}<br>
-        <strong>Uploaded:</strong> {req.created_at}</p>
-        {preview_html}
-        <p>Receipt file: {stored_file}</p>
-        <p><a href="{verify_link}">Verify request</a>: {verify_link}</p>
-        <hr/>
-        <p><strong>Quick Reply:</strong> You can simply reply to this email with <strong>YES</strong> to approve and auto-activate the license (the key will be emailed to the school email), or <strong>NO</strong> to reject. Keep the subject unchanged so the system can match this request. Token: REQ:{token}</p>
-        """
         if admin:
-            _send_email(admin, subject, body)
+            _queue_email(admin, subject, body)
         else:
             _log("ADMIN_EMAIL not set; skipping admin email.")
 
@@ -644,7 +1010,7 @@ def verify_page(verify_token: str):
     invalid = False
     try:
         req = LicenseRequest.query.filter_by(verify_token=verify_token).first()
-        if not req or not req.verify_expires or req.verify_expires < datetime.utcnow() or req.status not in (
+        if not req or not req.verify_expires or req.verify_expires < _utcnow() or req.status not in (
             "PENDING",
             "VERIFIED",
         ):
@@ -653,12 +1019,15 @@ def verify_page(verify_token: str):
         invalid = True
 
     preview_b64 = None
+    preview_mime = None
     is_image = False
     if not invalid and req:
-        preview_b64 = _img_preview_if_image(req.receipt_filename)
+        preview = _img_preview_if_image(req.receipt_filename)
+        if preview:
+            preview_mime, preview_b64 = preview
         is_image = bool(preview_b64)
 
-    html = render_template_string(
+    html = _render_page(
         ADMIN_VERIFY_PAGE,
         invalid=invalid,
         req=req,
@@ -666,6 +1035,7 @@ def verify_page(verify_token: str):
         storage_path=os.path.join(UPLOAD_DIR, req.receipt_filename) if req else "",
         is_image=is_image,
         preview_b64=preview_b64,
+        preview_mime=preview_mime,
         action_url=f"{base}{url_for('billing.verify_action', verify_token=verify_token)}",
     )
     return html
@@ -676,11 +1046,9 @@ def verify_action(verify_token: str):
     try:
         req = LicenseRequest.query.filter_by(verify_token=verify_token).first()
         if not req:
-            return render_template_string(
-                ACTIVATION_RESULT_PAGE, success=False, error="Invalid verification token.", base_url=_base_url()
-            )
-        if not req.verify_expires or req.verify_expires < datetime.utcnow():
-            return render_template_string(
+            return _render_activation_error("Invalid verification token.")
+        if not req.verify_expires or req.verify_expires < _utcnow():
+            return _render_page(
                 ADMIN_VERIFY_PAGE,
                 invalid=True,
                 req=None,
@@ -699,127 +1067,67 @@ def verify_action(verify_token: str):
         expires_date = request.form.get("expires_date")
 
         if not admin_name:
-            return render_template_string(
-                ACTIVATION_RESULT_PAGE, success=False, error="Admin name is required.", base_url=_base_url()
-            )
+            return _render_activation_error("Admin name is required.")
 
         if action == "reject":
             req.status = "REJECTED"
             req.admin_note = admin_note
             req.admin_verified_by = admin_name
             req.verify_token = None
-            req.verify_expires = datetime.utcnow() - timedelta(seconds=1)
+            req.verify_expires = _utcnow() - timedelta(seconds=1)
             db.session.commit()
 
             if req.user_email:
                 subject = "SmartEduPay Premium Request - Update"
-                body = f"""
-                <p>Hello {req.user_name},</p>
-                <p>Your premium request has been reviewed and could not be verified at this time.</p>
-                <p>Note: {admin_note or 'No additional details provided.'}</p>
-                <p>Please reply to this email if you think this is a mistake.</p>
-                """
-                _send_email(req.user_email, subject, body)
-
-            return render_template_string(
-                ACTIVATION_RESULT_PAGE, success=False, error="Request marked as rejected.", base_url=_base_url()
-            )
+                body = _render_page(REQUEST_REJECTED_EMAIL, user_name=req.user_name, note=admin_note)
+                _queue_email(req.user_email, subject, body)
+
+            return _render_activation_error("Request marked as rejected.")
 
         if action != "verify":
-            return render_template_string(
-                ACTIVATION_RESULT_PAGE, success=False, error="Invalid action.", base_url=_base_url()
-            )
+            return _render_activation_error("Invalid action.")
 
         # Determine expiry
         expires_at: Optional[datetime] = None
         if expiry_mode == "days":
             try:
                 days = int(expires_in_days or "365")
-                expires_at = datetime.utcnow() + timedelta(days=days)
+                expires_at = _utcnow() + timedelta(days=days)
             except Exception:
-                expires_at = datetime.utcnow() + timedelta(days=365)
+                expires_at = _utcnow() + timedelta(days=365)
         elif expiry_mode == "date":
             try:
                 expires_at = datetime.strptime((expires_date or "").strip(), "%Y-%m-%d")
             except Exception:
-                return render_template_string(
-                    ACTIVATION_RESULT_PAGE, success=False, error="Invalid expiry date.", base_url=_base_url()
-                )
+                return _render_activation_error("Invalid expiry date.")
         elif expiry_mode == "lifetime":
             expires_at = None
         else:
-            expires_at = datetime.utcnow() + timedelta(days=365)
+            expires_at = _utcnow() + timedelta(days=365)
 
-        secret = _require_secret()
-        license_key, signature, payload = generate_license_key(req.user_email, expires_at, secret)
-        lic = LicenseKey(
-            request_id=req.id,
-            user_email=req.user_email,
-            license_key=license_key,
-            issued_at=datetime.utcnow(),
-            expires_at=expires_at,
-            signature=signature,
-            active=False,
-        )
-        db.session.add(lic)
-
-        req.status = "VERIFIED"
-        req.admin_note = admin_note
-        req.admin_verified_by = admin_name
-        req.verify_token = None
-        req.verify_expires = datetime.utcnow() - timedelta(seconds=1)
-        db.session.commit()
-
-        base = _base_url()
-        subject_user = "Your SmartEduPay Premium License"
+        lic = _issue_license_for_request(req, admin_name, admin_note, expires_at)
         expires_label = "Lifetime" if not expires_at else expires_at.strftime("%Y-%m-%d")
-        body_user = f"""
-        <p>Thank you {req.user_name},</p>
-        <p>Your payment was verified. Here are your license details:</p>
-        <p><strong>License Key:</strong> <code>{license_key}</code><br/>
-        <strong>Expires:</strong> {expires_label}</p>
-        <p>To activate:</p>
-        <ol>
-      <li>Go to <a href="{base}/admin/billing">{base}/admin/billing</a> and paste the key, or</li>
-          <li>Open <a href="{base}/activate">{base}/activate</a> and follow the steps below.</li>
-        </ol>
-        <p>Keep this key private.</p>
-        """
-        _send_email(req.user_email, subject_user, body_user)
-
-        # Also email school copy of the license details
-        try:
-            school_email = _school_email()
-            if school_email:
-                _send_email(
-                    school_email,
-                    f"[SmartEduPay] License issued for {req.user_email}",
-                    f"<p>Issued license for {req.user_email}.<br><strong>Key:</strong> {license_key}<br><strong>Expires:</strong> {expires_label}</p>",
-                )
-        except Exception:
-            pass
 
-        return render_template_string(
+        return _render_page(
             ACTIVATION_RESULT_PAGE,
             success=True,
             email=req.user_email,
-            license_key=license_key,
+            license_key=lic.license_key,
             expires=expires_label,
-            base_url=base,
+            base_url=_base_url(),
         )
     except Exception as e:  # pragma: no cover
         _log("Error verifying request:", e)
-        return render_template_string(
-            ACTIVATION_RESULT_PAGE, success=False, error="Internal error processing verification.", base_url=_base_url()
-        )
+        return _render_activation_error("Internal error processing verification.")
 
 
 @billing_bp.route("/activate", methods=["POST"])
 def activate_license():
     try:
-        if request.is_json:
-            email = (request.json.get("email") or "").strip().lower()
-            license_key = (request.json.get("license_key") or "").strip()
+        data = request.get_json(silent=True) if request.is_json else None
+        if isinstance(data, dict):
+            email = (data.get("email") or "").strip().lower()
+            license_key = (data.get("license_key") or "").strip()
         else:
             email = (request.form.get("email") or "").strip().lower()
             license_key = (request.form.get("license_key") or "").strip()
@@ -831,35 +1139,20 @@ def activate_license():
         if not lic:
             return jsonify({"ok": False, "error": "License not found."}), 404
 
-        if lic.expires_at and datetime.utcnow() > lic.expires_at:
+        if lic.expires_at and _utcnow() > lic.expires_at:
             return jsonify({"ok": False, "error": "License expired."}), 400
 
+        expires_label = "Lifetime" if not lic.expires_at else lic.expires_at.strftime("%Y-%m-%d")
+        if lic.active:
+            # Repeat click or client retry: already verified and committed.
+            return jsonify({"ok": True, "email": email, "license_key": license_key, "expires": expires_label})
+
         secret = _require_secret()
         verify_license_key(lic.license_key, secret, lic.issued_at, lic.expires_at, lic.user_email)
 
-        lic.active = True
+        # expires_label is read above, before the commit expires the instance.
+        _activate_license_for_user(email, lic)
 
-        req = LicenseRequest.query.filter_by(id=lic.request_id).first()
-        if req:
-            req.status = "ACTIVATED"
-
-        # TODO: Replace with your actual user model import and field update.
-        try:
-            from models import User  # type: ignore
-        except Exception:
-            try:
-                from app.models import User  # type: ignore
-            except Exception:
-                User = None  # type: ignore
-
-        if User is not None:
-            user_obj = User.query.filter_by(email=email).first()
-            if user_obj is not None and hasattr(user_obj, "is_premium"):
-                setattr(user_obj, "is_premium", True)
-
-        db.session.commit()
-
-        expires_label = "Lifetime" if not lic.expires_at else lic.expires_at.strftime("%Y-%m-%d")
         return jsonify({"ok": True, "email": email, "license_key": license_key, "expires": expires_label})
     except Exception as e:  # pragma: no cover
         _log("Activation error:", e)
@@ -923,9 +1216,28 @@ ACTIVATION_SNIPPET_HTML = """
 """
 
 
+# The activation page is static: encode and gzip it once, and let clients
+# revalidate with the ETag instead of re-downloading it.
+_ACTIVATION_PAGE_BYTES = ACTIVATION_SNIPPET_HTML.encode("utf-8")
+_ACTIVATION_PAGE_GZ = gzip.compress(_ACTIVATION_PAGE_BYTES, 9)
+_ACTIVATION_PAGE_ETAG = hashlib.sha1(_ACTIVATION_PAGE_BYTES).hexdigest()[:16]
+
+
 @billing_bp.route("/activate-page", methods=["GET"])
 def activation_page():
-    return ACTIVATION_SNIPPET_HTML
+    use_gzip = "gzip" in request.accept_encodings
+    resp = Response(_ACTIVATION_PAGE_GZ if use_gzip else _ACTIVATION_PAGE_BYTES, mimetype="text/html")
+    if use_gzip:
+        resp.headers["Content-Encoding"] = "gzip"
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.headers["Cache-Control"] = "public, max-age=3600"
+    # Each encoding is a different representation, so it gets its own ETag.
+    resp.set_etag(_ACTIVATION_PAGE_ETAG + ("-gz" if use_gzip else ""))
+    return resp.make_conditional(request)
+
+
+# Matches url-safe tokens as well as UUIDs issued before the switch to secrets.
+_REQ_TOKEN_RE = re.compile(r"REQ:([A-Za-z0-9_\-]{8,36})")
 
 
 @billing_bp.route("/inbound-email", methods=["POST"])
@@ -934,9 +1246,14 @@ def inbound_email():
     Secure this by setting EMAIL_INBOUND_SECRET and passing it via
     header X-Email-Secret, form field 'secret', or query param ?secret=.
     Supported payloads: JSON or form-encoded from common providers (SendGrid, Mailgun).
-    Expects subject to contain token pattern 'REQ:<uuid>' included in admin emails.
+    Expects subject to contain token pattern 'REQ:<token>' included in admin emails.
     """
     try:
+        # Parse a JSON body once; malformed or non-object bodies fall back to form fields.
+        data = request.get_json(silent=True) if request.is_json else None
+        if not isinstance(data, dict):
+            data = None
+
         # Secret check
         expected = _inbound_secret()
         if expected:
@@ -944,7 +1261,7 @@ def inbound_email():
                 request.headers.get("X-Email-Secret")
                 or request.args.get("secret")
                 or (request.form.get("secret") if request.form else None)
-                or (request.json.get("secret") if request.is_json and isinstance(request.json, dict) else None)
+                or (data.get("secret") if data is not None else None)
             )
             if not provided or provided.strip() != expected:
                 return jsonify({"ok": False, "error": "Forbidden"}), 403
@@ -952,8 +1269,7 @@ def inbound_email():
         # Extract subject and body text from various providers
         subject = None
         text = None
-        if request.is_json and isinstance(request.json, dict):
-            data = request.json
+        if data is not None:
             subject = (data.get("subject") or data.get("Subject") or "").strip()
             text = (
                 data.get("text")
@@ -981,25 +1297,17 @@ def inbound_email():
                 text = ""
 
         # Find token in subject or body
-        import re
-
-        token = None
-        pat = re.compile(r"REQ:([0-9a-fA-F\-]{8,36})")
-        if subject:
-            m = pat.search(subject)
-            if m:
-                token = m.group(1)
-        if not token and text:
-            m = pat.search(text)
-            if m:
-                token = m.group(1)
+        # One scan; a token in the subject still wins because it comes first,
+        # and the newline keeps a match from spanning subject and body.
+        m = _REQ_TOKEN_RE.search(f"{subject or ''}\n{text or ''}")
+        token = m.group(1) if m else None
         if not token:
             return jsonify({"ok": False, "error": "Request token not found in subject/body."}), 400
 
         req = LicenseRequest.query.filter_by(verify_token=token).first()
         if not req:
             return jsonify({"ok": False, "error": "Request not found or already processed."}), 404
-        if not req.verify_expires or req.verify_expires < datetime.utcnow() or req.status not in ("PENDING", "VERIFIED"):
+        if not req.verify_expires or req.verify_expires < _utcnow() or req.status not in ("PENDING", "VERIFIED"):
             return jsonify({"ok": False, "error": "Verification expired or invalid status."}), 400
 
         decision = _parse_simple_yes_no(text)
@@ -1008,61 +1316,54 @@ def inbound_email():
 
         admin_email = _admin_email()
         base = _base_url()
+        # Taken before the commit below expires req, so building the
+        # notifications does not reload the row.
+        req_id, user_name, user_email = req.id, req.user_name, req.user_email
 
         if decision == "no":
             req.status = "REJECTED"
             req.admin_note = "Rejected via email reply"
             req.admin_verified_by = "Email Reply"
             req.verify_token = None
-            req.verify_expires = datetime.utcnow() - timedelta(seconds=1)
+            req.verify_expires = _utcnow() - timedelta(seconds=1)
             db.session.commit()
 
-            if req.user_email:
+            if user_email:
                 subject_user = "SmartEduPay Premium Request - Update"
-                body_user = f"""
-                <p>Hello {req.user_name},</p>
-                <p>Your premium request has been reviewed and could not be verified at this time.</p>
-                <p>Note: Rejected via email reply.</p>
-                <p>Please reply if you think this is a mistake.</p>
-                """
-                _send_email(req.user_email, subject_user, body_user)
+                body_user = _render_page(REQUEST_REJECTED_EMAIL, user_name=user_name, note="Rejected via email reply.")
+                _queue_email(user_email, subject_user, body_user)
 
             if admin_email:
-                _send_email(
+                _queue_email(
                     admin_email,
-                    f"[SmartEduPay] Processed NO for request {req.id}",
-                    f"<p>Request {req.id} for {req.user_email} marked REJECTED.</p><p><a href='{base}/admin'>Admin</a></p>",
+                    f"[SmartEduPay] Processed NO for request {req_id}",
+                    _render_page(REQUEST_REJECTED_NOTICE_EMAIL, req_id=req_id, user_email=user_email, base_url=base),
                 )
             return jsonify({"ok": True, "status": "REJECTED"})
 
         # YES path: issue license, email it, then auto-activate
         # default expiry 365 days
-        expires_at = datetime.utcnow() + timedelta(days=365)
-        lic = _issue_license_for_request(req, admin_name="Email Reply", admin_note="Approved via email reply", expires_at=expires_at)
-        _activate_license_for_user(req.user_email, lic)
+        expires_at = _utcnow() + timedelta(days=365)
+        lic = _issue_license_for_request(
+            req, admin_name="Email Reply", admin_note="Approved via email reply", expires_at=expires_at, activate=True
+        )
 
+        expires_label = "Lifetime" if not expires_at else expires_at.strftime("%Y-%m-%d")
+        notice = _render_page(
+            LICENSE_NOTICE_EMAIL, activated=True, user_email=user_email, license_key=lic.license_key, expires=expires_label
+        )
         if admin_email:
-            expires_label = "Lifetime" if not lic.expires_at else lic.expires_at.strftime("%Y-%m-%d")
-            _send_email(
-                admin_email,
-                f"[SmartEduPay] Processed YES for request {req.id}",
-                f"<p>Issued and activated license for {req.user_email}.<br><strong>Key:</strong> {lic.license_key}<br><strong>Expires:</strong> {expires_label}</p>",
-            )
+            _queue_email(admin_email, f"[SmartEduPay] Processed YES for request {req_id}", notice)
 
         # Email school with license details as well
         try:
             school_email = _school_email()
             if school_email:
-                expires_label = "Lifetime" if not lic.expires_at else lic.expires_at.strftime("%Y-%m-%d")
-                _send_email(
-                    school_email,
-                    f"[SmartEduPay] License issued for {req.user_email}",
-                    f"<p>Issued and activated license for {req.user_email}.<br><strong>Key:</strong> {lic.license_key}<br><strong>Expires:</strong> {expires_label}</p>",
-                )
+                _queue_email(school_email, f"[SmartEduPay] License issued for {user_email}", notice)
         except Exception:
             pass
 
-        return jsonify({"ok": True, "status": "ACTIVATED", "email": req.user_email, "license_key": lic.license_key})
+        return jsonify({"ok": True, "status": "ACTIVATED", "email": user_email, "license_key": lic.license_key})
     except Exception as e:  # pragma: no cover
         _log("Inbound email error:", e)
         return jsonify({"ok": False, "error": "Inbound processing failed."}), 500
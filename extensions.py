@@ -16,8 +16,9 @@ try:
     from flask_limiter import Limiter  # type: ignore
     from flask_limiter.util import get_remote_address  # type: ignore
 
-    # In-memory rate limiter (sufficient for single-instance deployments).
-    limiter = Limiter(get_remote_address, storage_uri="memory://")
+    # Storage comes from RATELIMIT_STORAGE_URI in Config: in-memory by default,
+    # which is per process; point it at Redis when running several workers.
+    limiter = Limiter(get_remote_address)
     # Allow disabling via env for any environment
     if _truthy(os.environ.get("DISABLE_RATE_LIMITING")):
         def _identity(x):
@@ -10,6 +10,14 @@ import json
 import base64
 import hashlib
 from datetime import datetime
+from functools import lru_cache
+
+# orjson is optional; both serializers emit compact, key-sorted JSON and the
+# verifier HMACs the embedded bytes as-is, so tokens stay valid either way.
+try:
+    import orjson
+except Exception:  # pragma: no cover - optional dependency not installed
+    orjson = None
 
 # Change this SECRET once and keep it private.
 # Read from environment to avoid hardcoding secrets in the repo.
@@ -25,6 +33,14 @@ if not LICENSE_SECRET:
     if not LICENSE_SECRET:
         raise SystemExit("LICENSE_SECRET is required. Set env or input interactively.")
 
+_LICENSE_SECRET_BYTES = LICENSE_SECRET.encode()
+
+
+@lru_cache(maxsize=4)
+def _hmac_template(secret: bytes):
+    # Keyed once per secret; each license copies it rather than re-keying.
+    return hmac.new(secret, b"", hashlib.sha256)
+
 
 def b64u_encode(b: bytes) -> str:
     return base64.urlsafe_b64encode(b).rstrip(b"=").decode()
@@ -47,8 +63,13 @@ def generate_license(school_uid, plan_code="PREMIUM", features=None, expires_at=
         "expires_at": expires_at,
     }
 
-    raw = json.dumps(payload, separators=(",", ":"), sort_keys=True).encode()
-    sig = hmac.new(LICENSE_SECRET.encode(), raw, hashlib.sha256).digest()
+    if orjson is not None:
+        raw = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+    else:
+        raw = json.dumps(payload, separators=(",", ":"), sort_keys=True).encode()
+    mac = _hmac_template(_LICENSE_SECRET_BYTES).copy()
+    mac.update(raw)
+    sig = mac.digest()
     token = f"{b64u_encode(raw)}.{b64u_encode(sig)}"
     return token
 
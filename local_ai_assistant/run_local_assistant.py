@@ -3,7 +3,14 @@ import sys
 from typing import List, Tuple
 
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+# The conversation KV cache holds this many full-length replies plus the prompt
+# text around them; once a turn would overflow it, history starts over.
+MAX_TURNS = 8
+PROMPT_BUDGET = 512
+# The model may continue the transcript with an invented user turn; stop there.
+TURN_MARKER = "\nUser:"
 
 
 def pick_device() -> Tuple[str, int]:
@@ -37,22 +44,145 @@ def build_arg_parser() -> argparse.ArgumentParser:
         action="store_true",
         help="Do not keep conversation history between turns.",
     )
+    p.add_argument(
+        "--no-compile",
+        action="store_true",
+        help="Skip torch.compile (faster startup, slower generation).",
+    )
+    p.add_argument(
+        "--quant",
+        choices=["none", "int8", "int4"],
+        default="none",
+        help="Weight quantization: bitsandbytes on CUDA, torchao int8 on CPU.",
+    )
     return p
 
 
-def load_model_and_tokenizer(model_id: str):
+def pick_dtype(device_str: str) -> torch.dtype:
+    """
+    Half precision on CUDA (bf16 where the GPU supports it, else fp16);
+    fp32 on CPU, where half-precision matmuls are often slower.
+    """
+    if device_str == "cuda":
+        if torch.cuda.is_bf16_supported():
+            return torch.bfloat16
+        return torch.float16
+    return torch.float32
+
+
+def load_causal_lm(model_id: str, dtype: torch.dtype, **kwargs):
+    """
+    Load with PyTorch's fused scaled-dot-product attention, which picks a flash /
+    memory-efficient kernel on CUDA and CPU instead of materialising the full
+    attention matrix. Models without SDPA support load with their default.
+    """
+    try:
+        return AutoModelForCausalLM.from_pretrained(
+            model_id, torch_dtype=dtype, low_cpu_mem_usage=True, attn_implementation="sdpa", **kwargs
+        )
+    except (ImportError, TypeError, ValueError):
+        return AutoModelForCausalLM.from_pretrained(model_id, torch_dtype=dtype, low_cpu_mem_usage=True, **kwargs)
+
+
+def build_quant_config(quant: str, dtype: torch.dtype, device_str: str):
+    """
+    bitsandbytes config for quantizing the weights at load time on CUDA. Returns
+    None when no load-time quantization applies (CPU int8 is done after loading).
+    """
+    if quant == "int4" and device_str != "cuda":
+        raise ValueError("--quant int4 needs a CUDA GPU; use --quant int8 on CPU.")
+    if quant == "none" or device_str != "cuda":
+        return None
+    from transformers import BitsAndBytesConfig
+
+    if quant == "int8":
+        return BitsAndBytesConfig(load_in_8bit=True)
+    return BitsAndBytesConfig(
+        load_in_4bit=True,
+        bnb_4bit_quant_type="nf4",
+        bnb_4bit_compute_dtype=dtype,
+        bnb_4bit_use_double_quant=True,
+    )
+
+
+def quantize_int8_cpu(model):
+    # torchao int8 weight-only: halves weight bytes vs fp16 and pairs with torch.compile
+    from torchao.quantization import quantize_
+
+    try:
+        from torchao.quantization import Int8WeightOnlyConfig
+
+        config = Int8WeightOnlyConfig()
+    except ImportError:
+        from torchao.quantization import int8_weight_only
+
+        config = int8_weight_only()
+    quantize_(model, config)
+
+
+def load_model_and_tokenizer(model_id: str, device_str: str = "cpu", quant: str = "none"):
+    dtype = pick_dtype(device_str)
+    kwargs = {}
+    quantization_config = build_quant_config(quant, dtype, device_str)
+    if quantization_config is not None:
+        # bitsandbytes places the weights itself; quantized models can't be moved with .to()
+        kwargs = {"quantization_config": quantization_config, "device_map": {"": 0}}
     # Try without remote code first; fall back to trust_remote_code=True if needed
     try:
         tokenizer = AutoTokenizer.from_pretrained(model_id, use_fast=True)
-        model = AutoModelForCausalLM.from_pretrained(model_id, torch_dtype=torch.float32, low_cpu_mem_usage=True)
+        model = load_causal_lm(model_id, dtype, **kwargs)
     except Exception:
         tokenizer = AutoTokenizer.from_pretrained(model_id, use_fast=True, trust_remote_code=True)
-        model = AutoModelForCausalLM.from_pretrained(
-            model_id, torch_dtype=torch.float32, low_cpu_mem_usage=True, trust_remote_code=True
-        )
+        model = load_causal_lm(model_id, dtype, trust_remote_code=True, **kwargs)
+    if quantization_config is None:
+        model.to(device_str)
+        if quant == "int8":
+            quantize_int8_cpu(model)
+    model.eval()
     return model, tokenizer
 
 
+def compile_model(model):
+    """
+    Compile the decoder forward pass so each generated token reuses fused kernels
+    (and CUDA graphs on GPU) instead of paying Python dispatch per layer. Only
+    `forward` is replaced: the model object stays a PreTrainedModel, which is what
+    `generate` expects. Returns False if compilation is unavailable.
+    """
+    if not hasattr(torch, "compile"):
+        return False
+    try:
+        model.forward = torch.compile(model.forward, mode="reduce-overhead", fullgraph=False)
+        return True
+    except Exception:
+        return False
+
+
+def new_kv_cache(model, max_cache_len: int, device_str: str):
+    """
+    KV cache kept across turns so earlier turns are never re-encoded. StaticCache
+    pre-allocates fixed-shape tensors, which lets the compiled forward (and its
+    CUDA graphs) be reused for every token; older transformers without it get a
+    DynamicCache, which still avoids re-encoding history.
+    """
+    try:
+        from transformers import StaticCache
+    except ImportError:
+        from transformers import DynamicCache
+        return DynamicCache()
+    try:
+        return StaticCache(
+            config=model.config,
+            max_batch_size=1,
+            max_cache_len=max_cache_len,
+            device=device_str,
+            dtype=model.dtype,
+        )
+    except TypeError:
+        # Newer releases infer batch size, device and dtype on first use
+        return StaticCache(config=model.config, max_cache_len=max_cache_len)
+
+
 def build_prompt(system_prompt: str, history: List[Tuple[str, str]], user: str) -> str:
     # Simple, model-agnostic prompt format suitable for many chat-tuned models
     lines: List[str] = []
@@ -68,23 +198,63 @@ def build_prompt(system_prompt: str, history: List[Tuple[str, str]], user: str)
 
 def main():
     args = build_arg_parser().parse_args()
-    device_str, device_index = pick_device()
+    device_str, _ = pick_device()
 
     print(f"Loading model '{args.model}' on {device_str}...", flush=True)
-    model, tokenizer = load_model_and_tokenizer(args.model)
-
-    # Use pipeline for simplicity
-    generator = pipeline(
-        task="text-generation",
-        model=model,
-        tokenizer=tokenizer,
-        device=device_index,
-    )
+    model, tokenizer = load_model_and_tokenizer(args.model, device_str, args.quant)
+    compiled = not args.no_compile and compile_model(model)
+
+    max_cache_len = args.max_new_tokens * MAX_TURNS + PROMPT_BUDGET
+    max_cache_len = min(max_cache_len, getattr(model.config, "max_position_embeddings", None) or max_cache_len)
+    cache = new_kv_cache(model, max_cache_len, device_str)
+
+    def reset_cache():
+        nonlocal cache
+        if hasattr(cache, "reset"):
+            cache.reset()
+        else:
+            cache = new_kv_cache(model, max_cache_len, device_str)
+
+    stop_kwargs = {"stop_strings": [TURN_MARKER], "tokenizer": tokenizer}
+
+    def generate(input_ids, **kwargs):
+        nonlocal stop_kwargs
+        with torch.inference_mode():
+            try:
+                return model.generate(
+                    input_ids,
+                    attention_mask=torch.ones_like(input_ids),
+                    past_key_values=cache,
+                    pad_token_id=tokenizer.eos_token_id,
+                    eos_token_id=tokenizer.eos_token_id,
+                    **stop_kwargs,
+                    **kwargs,
+                )
+            except (TypeError, ValueError):
+                # transformers before 4.39 has no stop_strings; the reply is still
+                # cut at TURN_MARKER after generation
+                if not stop_kwargs:
+                    raise
+                stop_kwargs = {}
+                reset_cache()
+                return generate(input_ids, **kwargs)
+
+    if compiled:
+        # The first call triggers compilation; pay for it before the first prompt.
+        print("Compiling model (one-time warm-up)...", flush=True)
+        try:
+            generate(tokenizer("warmup", return_tensors="pt").input_ids.to(device_str), max_new_tokens=8, do_sample=False)
+        except Exception as e:
+            # Compilation failed (e.g. no C compiler for inductor); run eagerly instead
+            print(f"torch.compile unavailable, running eagerly: {e}", flush=True)
+            del model.forward
+        reset_cache()
 
     print("\nLocal assistant ready. Type your message and press Enter.")
     print("Type 'exit' or 'quit' to leave.\n")
 
-    history: List[Tuple[str, str]] = []
+    # Token ids of the conversation so far; all but the last are already in `cache`
+    conv_ids = None
     while True:
         try:
             user_input = input("You: ").strip()
@@ -98,26 +268,55 @@ def main():
         if not user_input:
             continue
 
-        prompt = build_prompt(args.system, [] if args.no_history else history, user_input)
+        # Only the new turn is tokenised; earlier turns are already in the KV cache
+        turn_ids = None
+        if conv_ids is not None:
+            turn_ids = tokenizer(
+                f"\nUser: {user_input}\nAssistant:", return_tensors="pt", add_special_tokens=False
+            ).input_ids.to(device_str)
+            if conv_ids.shape[-1] + turn_ids.shape[-1] + args.max_new_tokens > max_cache_len:
+                print("(Conversation history is full; starting over.)")
+                conv_ids = None
+        if conv_ids is None:
+            reset_cache()
+            prompt = build_prompt(args.system, [], user_input)
+            input_ids = tokenizer(prompt, return_tensors="pt").input_ids.to(device_str)
+        else:
+            input_ids = torch.cat([conv_ids, turn_ids], dim=-1)
+
+        max_new_tokens = min(args.max_new_tokens, max_cache_len - input_ids.shape[-1])
+        if max_new_tokens <= 0:
+            print("Message too long, please shorten it.\n")
+            continue
 
-        outputs = generator(
-            prompt,
-            max_new_tokens=args.max_new_tokens,
+        output_ids = generate(
+            input_ids,
+            max_new_tokens=max_new_tokens,
             do_sample=True,
             temperature=args.temperature,
             top_p=args.top_p,
-            pad_token_id=tokenizer.eos_token_id,
-            eos_token_id=tokenizer.eos_token_id,
-            num_return_sequences=1,
         )
 
-        # Extract only the newly generated part after the last 'Assistant:'
-        full_text = outputs[0]["generated_text"]
-        assistant_reply = full_text.split("Assistant:")[-1].strip()
+        # Decode only the newly generated tokens, dropping any invented user turn
+        new_ids = output_ids[0, input_ids.shape[-1]:]
+        reply_text = tokenizer.decode(new_ids, skip_special_tokens=True)
+        cut = reply_text.find(TURN_MARKER)
+        if cut >= 0:
+            reply_text = reply_text[:cut]
+            # Keep only the tokens before the marker for the cached history
+            keep = new_ids.shape[-1]
+            while keep > 0 and len(tokenizer.decode(new_ids[:keep], skip_special_tokens=True)) > cut:
+                keep -= 1
+            output_ids = output_ids[:, : input_ids.shape[-1] + keep]
+            # The cache also holds the marker tokens; drop them (or re-encode next turn)
+            if hasattr(cache, "crop"):
+                cache.crop(output_ids.shape[-1])
+            else:
+                reset_cache()
+        assistant_reply = reply_text.strip()
         print(f"Assistant: {assistant_reply}\n")
 
-        if not args.no_history:
-            history.append((user_input, assistant_reply))
+        conv_ids = None if args.no_history else output_ids
 
 
 if __name__ == "__main__":
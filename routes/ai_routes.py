@@ -194,9 +194,9 @@ def _find_student_by_hint(db, name: str | None, admission_no: str | None) -> Dic
     sid = session.get("school_id") if session else None
     if admission_no:
         if sid:
-            cur.execute("SELECT * FROM students WHERE LOWER(admission_no)=LOWER(%s) AND school_id=%s LIMIT 1", (admission_no, sid))
+            cur.execute("SELECT * FROM students WHERE school_id=%s AND admission_no=%s LIMIT 1", (sid, admission_no))
         else:
-            cur.execute("SELECT * FROM students WHERE LOWER(admission_no)=LOWER(%s) LIMIT 1", (admission_no,))
+            cur.execute("SELECT * FROM students WHERE admission_no=%s LIMIT 1", (admission_no,))
         row = cur.fetchone()
         if row:
             return row
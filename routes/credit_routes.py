@@ -8,6 +8,7 @@ import mysql.connector
 from urllib.parse import urlparse
 
 from utils.mpesa import b2c_payment, DarajaError
+from utils.schema import clear_columns_cache
 
 # Audit trail removed
 
@@ -98,6 +99,7 @@ def ensure_students_credit_column(conn) -> None:
         if not has:
             cur.execute("ALTER TABLE students ADD COLUMN credit DECIMAL(12,2) DEFAULT 0")
             conn.commit()
+            clear_columns_cache("students")
     except Exception:
         # Non-fatal; better to proceed than crash UI
         try:
@@ -244,12 +246,12 @@ def apply_credit():
 
         new_balance = max(balance - to_apply, 0)
         new_credit = max(credit - to_apply, 0)
+        # Balance change and its credit_operations row share one commit
+        # (the table is created at app bootstrap, so no DDL mid-transaction).
         cur.execute(f"UPDATE students SET {col}=%s, credit=%s WHERE id=%s AND school_id=%s", (new_balance, new_credit, student_id, session.get("school_id")))
-        db.commit()
 
         # audit removed
 
-        ensure_credit_ops_table(db)
         cur2 = db.cursor()
         cur2.execute(
             "INSERT INTO credit_operations (ts, actor, student_id, op_type, amount, reference, method, meta, school_id) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)",
@@ -313,9 +315,7 @@ def refund_credit():
 
         new_credit = max(credit - to_refund, 0)
         cur.execute("UPDATE students SET credit=%s WHERE id=%s AND school_id=%s", (new_credit, student_id, session.get("school_id")))
-        db.commit()
 
-        ensure_credit_ops_table(db)
         cur2 = db.cursor()
         meta = {"source": "manual", "method": stored_method}
         if phone:
@@ -402,11 +402,8 @@ def transfer_credit():
         # Update both students atomically
         cur.execute("UPDATE students SET credit=%s WHERE id=%s AND school_id=%s", (new_src_credit, from_id, session.get("school_id")))
         cur.execute(f"UPDATE students SET {col}=%s, credit=%s WHERE id=%s AND school_id=%s", (new_dst_balance, new_dst_credit, to_id, session.get("school_id")))
-        db.commit()
 
-        # Record audit trails
-        ensure_credit_ops_table(db)
-        ensure_credit_transfers_table(db)
+        # Record audit trails in the same transaction
         cur2 = db.cursor()
         import uuid
         corr_id = uuid.uuid4().hex
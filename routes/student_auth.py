@@ -6,6 +6,7 @@ from urllib.parse import urlparse
 import os
 from datetime import datetime, timedelta
 from utils.security import verify_password, hash_password
+from utils.schema import clear_columns_cache
 from utils.tenant import slugify_code, get_or_create_school
 from utils.login_otp import generate_login_otp, mask_email, send_portal_login_otp
 
@@ -61,6 +62,7 @@ def ensure_student_portal_columns(conn) -> None:
         cur.execute("SHOW COLUMNS FROM students LIKE 'portal_password_hash'")
         if not cur.fetchone():
             cur.execute("ALTER TABLE students ADD COLUMN portal_password_hash VARCHAR(256) NULL AFTER phone")
+            clear_columns_cache("students")
     except Exception:
         try: conn.rollback()
         except Exception: pass
@@ -69,6 +71,7 @@ def ensure_student_portal_columns(conn) -> None:
         cur.execute("SHOW COLUMNS FROM students LIKE 'account_email'")
         if not cur.fetchone():
             cur.execute("ALTER TABLE students ADD COLUMN account_email VARCHAR(190) NULL AFTER portal_password_hash")
+            clear_columns_cache("students")
     except Exception:
         try: conn.rollback()
         except Exception: pass
@@ -9,7 +9,7 @@ from urllib.parse import urlparse
 import mysql.connector
 
 from utils.mpesa import stk_push, DarajaError
-from utils.schema import get_admission_select_and_column
+from utils.schema import get_admission_select_and_column, clear_columns_cache
 from routes.term_routes import (
     get_or_seed_current_term,
     ensure_academic_terms_table,
@@ -77,6 +77,7 @@ def ensure_student_portal_salt_column(conn) -> None:
         if not cur.fetchone():
             cur.execute("ALTER TABLE students ADD COLUMN portal_salt VARCHAR(32) NULL AFTER phone")
             conn.commit()
+            clear_columns_cache("students")
     except Exception:
         try:
             conn.rollback()
@@ -19,6 +19,7 @@ from routes.newsletter_routes import ensure_newsletters_table
 from utils.ai import ai_is_configured, chat_anything
 from utils.auto_credit import auto_apply_credit_for_school
 from utils.ledger import ensure_ledger_table, add_entry
+from utils.schema import clear_columns_cache
 from markupsafe import escape
 
 try:
@@ -166,6 +167,7 @@ def ensure_student_enrollments_table(conn) -> None:
         if not cur.fetchone():
             cur.execute("ALTER TABLE students ADD COLUMN retain_next_year TINYINT(1) NOT NULL DEFAULT 0 AFTER class_name")
             conn.commit()
+            clear_columns_cache("students")
     except Exception:
         try:
             conn.rollback()
@@ -0,0 +1,146 @@
+import io
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import app as app_module  # noqa: E402
+
+
+class FakeCursor:
+    """Minimal stand-in for the students INSERT/SELECT statements used by import_students."""
+
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+        self.rowcount = 0
+        self.lastrowid = None
+
+    def _insert(self, params):
+        name, admission_no, class_name, balance, credit, school_id = params
+        key = (school_id, (admission_no or "").lower())
+        if admission_no and self.db.unique and key in self.db.keys:
+            return None  # ON DUPLICATE KEY UPDATE id=id: 0 affected rows
+        student_id = self.db.next_id
+        # Leave gaps so ids of a multi-row INSERT are not consecutive
+        self.db.next_id += 3
+        self.db.students.append({"id": student_id, "admission_no": admission_no, "school_id": school_id})
+        if admission_no:
+            self.db.keys.add(key)
+        return student_id
+
+    def executemany(self, sql, seq):
+        ids = [self._insert(p) for p in seq]
+        new_ids = [i for i in ids if i is not None]
+        self.rowcount = len(new_ids)
+        self.lastrowid = new_ids[0] if new_ids else 0
+
+    def execute(self, sql, params=()):
+        self.rows = []
+        if sql.startswith("INSERT INTO students"):
+            self.executemany(sql, [params])
+        elif sql.startswith("INSERT IGNORE INTO student_enrollments"):
+            params = list(params)
+            for i in range(0, len(params), 6):
+                self.db.enrollments.append(tuple(params[i:i + 6]))
+        elif sql.startswith("SELECT id, admission_no FROM students"):
+            school_id, min_id, *admissions = params
+            wanted = {a.lower() for a in admissions}
+            self.db.id_lookups.append(min_id)
+            self.rows = [
+                {"id": s["id"], "admission_no": s["admission_no"]}
+                for s in self.db.students
+                if s["school_id"] == school_id and s["id"] >= min_id and (s["admission_no"] or "").lower() in wanted
+            ]
+        elif sql.startswith("SELECT LOWER(admission_no)"):
+            school_id, *admissions = params
+            wanted = {a.lower() for a in admissions}
+            self.rows = [
+                {"adm": s["admission_no"].lower()}
+                for s in self.db.students
+                if s["school_id"] == school_id and (s["admission_no"] or "").lower() in wanted
+            ]
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+
+class FakeDB:
+    def __init__(self, unique=True):
+        self.unique = unique
+        self.students = []
+        self.keys = set()
+        self.enrollments = []
+        self.id_lookups = []
+        self.next_id = 10
+
+    def seed(self, admission_no, school_id=1):
+        FakeCursor(self)._insert(("Old", admission_no, "F1", 0, 0, school_id))
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app_module, "_BOOTSTRAP_DONE", True)
+    monkeypatch.setattr(app_module, "student_columns", lambda cur: {"balance"})
+    monkeypatch.setattr(app_module, "_current_term", lambda db: (2026, 1))
+    app_module.app.testing = True
+    with app_module.app.test_client() as c:
+        with c.session_transaction() as sess:
+            sess["user_logged_in"] = True
+            sess["school_id"] = 1
+        yield c
+
+
+def _import(client, monkeypatch, db, csv_text, unique=True):
+    monkeypatch.setattr(app_module, "get_db_connection", lambda *a, **k: db)
+    monkeypatch.setattr(app_module, "_STUDENTS_ADMISSION_UNIQUE", unique)
+    data = {"file": (io.BytesIO(csv_text.encode()), "students.csv")}
+    client.post("/import_students", data=data, content_type="multipart/form-data")
+    with client.session_transaction() as sess:
+        return [m for _cat, m in sess.get("_flashes", [])]
+
+
+CSV = "name,admission_no,class_name,total_fees\nAmy,A1,F1,100\nBen,A2,F1,200\nCat,A3,F2,300\n"
+
+
+def test_import_counts_duplicates_from_affected_rows(client, monkeypatch):
+    db = FakeDB()
+    db.seed("a2")
+    messages = _import(client, monkeypatch, db, CSV)
+    assert messages == ["Imported 2 student(s). Skipped 1 duplicate(s)."]
+    assert len(db.students) == 3
+
+
+def test_import_resolves_new_ids_at_or_after_lastrowid(client, monkeypatch):
+    db = FakeDB()
+    db.seed("B9")
+    _import(client, monkeypatch, db, CSV)
+    new_ids = {s["admission_no"]: s["id"] for s in db.students if s["admission_no"] in ("A1", "A2", "A3")}
+    # The lookup is bounded by the first id generated by the batch insert
+    assert db.id_lookups == [new_ids["A1"]]
+    assert sorted((e[0], e[2], e[3]) for e in db.enrollments) == sorted(
+        [(new_ids["A1"], "F1", 100.0), (new_ids["A2"], "F1", 200.0), (new_ids["A3"], "F2", 300.0)]
+    )
+
+
+def test_import_without_unique_key_checks_existing_admissions(client, monkeypatch):
+    db = FakeDB(unique=False)
+    db.seed("A3")
+    messages = _import(client, monkeypatch, db, CSV, unique=False)
+    assert messages == ["Imported 2 student(s). Skipped 1 duplicate(s)."]
+    assert [s["admission_no"] for s in db.students].count("A3") == 1
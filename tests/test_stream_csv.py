@@ -0,0 +1,63 @@
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app import _stream_csv
+
+
+class FakeCursor:
+    """Unbuffered cursor: rows stay pending on the connection until read."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=()):
+        if self.conn.pending:
+            raise RuntimeError("Unread result found")
+        self.conn.pending = list(self.conn.rows)
+
+    def __iter__(self):
+        while self.conn.pending:
+            yield self.conn.pending.pop(0)
+
+    def fetchall(self):
+        rows, self.conn.pending = self.conn.pending, []
+        return rows
+
+    def close(self):
+        if self.conn.pending:
+            raise RuntimeError("Unread result found")
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.pending = []
+        self.closed = False
+
+    def cursor(self, buffered=True):
+        return FakeCursor(self)
+
+    def consume_results(self):
+        self.pending = []
+
+    def close(self):
+        # Pooled connections go back to the pool as-is
+        self.closed = True
+
+
+def test_aborted_stream_leaves_connection_reusable():
+    conn = FakeConnection([("Student %d" % i, "A%d" % i, "F1", 0, 0) for i in range(5000)])
+    gen = _stream_csv(conn, "SELECT ...", (1,), ["Name", "Admission No", "Class", "Balance", "Credit"])
+    first = next(gen)
+    assert first.startswith("Name,Admission No")
+    gen.close()  # client disconnected mid-export
+    assert conn.closed
+    cur = conn.cursor()
+    cur.execute("SELECT 1")
+    assert cur.fetchall()
+
+
+def test_complete_stream_yields_every_row():
+    conn = FakeConnection([("Amy", "A1", "F1", 10, 0), ("Ben", "A2", "F2", 0, 5)])
+    body = "".join(_stream_csv(conn, "SELECT ...", (1,), ["Name", "Adm", "Class", "Balance", "Credit"]))
+    assert body.splitlines() == ["Name,Adm,Class,Balance,Credit", "Amy,A1,F1,10,0", "Ben,A2,F2,0,5"]
+    assert conn.closed
@@ -58,7 +58,7 @@ def log_event(action: str, target: str | None = None, detail: str | None = None,
     if db is None:
         return
     try:
-        ensure_audit_table(db)
+        # audit_logs is created at app bootstrap; no DDL per event
         cursor = db.cursor()
         school_id = session.get("school_id")
         user_id = session.get("user_id")
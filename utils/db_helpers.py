@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime
 from mysql.connector.connection_cext import CMySQLConnection  # type: ignore
+from utils.schema import clear_columns_cache
 
 
 def ensure_approval_requests_table(db: CMySQLConnection) -> None:
@@ -143,6 +144,7 @@ def ensure_parent_portal_columns(db: CMySQLConnection) -> None:
             if cur.fetchone():
                 continue
             cur.execute(f"ALTER TABLE students ADD COLUMN {name} {definition}")
+            clear_columns_cache("students")
         except Exception:
             pass
     db.commit()
@@ -1,5 +1,6 @@
 import os
 import base64
+import threading
 from typing import Optional
 
 from email.mime.text import MIMEText
@@ -9,6 +10,21 @@ from email.mime.multipart import MIMEMultipart
 # Only send permission
 SCOPES = ["https://www.googleapis.com/auth/gmail.send"]
 
+# Loaded credentials are reused while token.json is unchanged (the OAuth route
+# rewrites it on re-authorization), and each sending thread keeps its own Gmail
+# service so its HTTP connection - and TLS session - survive between sends.
+# httplib2 connections are not thread-safe, hence one service per thread.
+_CREDS_LOCK = threading.Lock()
+_CREDS_CACHE: dict = {}
+_SERVICE_LOCAL = threading.local()
+
+
+def _token_mtime(token_file: str):
+    try:
+        return os.stat(token_file).st_mtime_ns
+    except OSError:
+        return None
+
 
 def _credentials_path() -> str:
     return os.path.abspath(os.environ.get("GMAIL_CREDENTIALS_JSON", "credentials.json"))
@@ -19,8 +35,21 @@ def _token_path() -> str:
 
 
 def _get_creds() -> Optional["Credentials"]:
-    creds = None
     token_file = _token_path()
+    with _CREDS_LOCK:
+        cached = _CREDS_CACHE.get(token_file)
+        if cached and cached[0] == _token_mtime(token_file) and cached[1].valid:
+            return cached[1]
+        creds = _load_creds(token_file)
+        if creds is not None:
+            _CREDS_CACHE[token_file] = (_token_mtime(token_file), creds)
+        else:
+            _CREDS_CACHE.pop(token_file, None)
+        return creds
+
+
+def _load_creds(token_file: str) -> Optional["Credentials"]:
+    creds = None
     cred_file = _credentials_path()
 
     # Import Google auth libs lazily to avoid hard dependency at module import
@@ -85,11 +114,16 @@ def authenticate_gmail():
         creds = _get_creds()
         if creds is None:
             return None
+        cached = getattr(_SERVICE_LOCAL, "entry", None)
+        if cached and cached[0] is creds:
+            return cached[1]
         try:
             from googleapiclient.discovery import build  # type: ignore
         except Exception:
             return None
-        return build("gmail", "v1", credentials=creds)
+        service = build("gmail", "v1", credentials=creds, cache_discovery=False)
+        _SERVICE_LOCAL.entry = (creds, service)
+        return service
     except Exception as e:
         try:
             print(f"Failed to authenticate Gmail: {e}")
@@ -36,8 +36,16 @@ def add_entry(
     description: Optional[str] = None,
     link_type: Optional[str] = None,
     link_id: Optional[int] = None,
+    commit: bool = True,
 ) -> None:
-    ensure_ledger_table(conn)
+    """Insert a ledger row.
+
+    With ``commit=False`` the row joins the caller's open transaction: the
+    table is assumed to exist (``CREATE TABLE`` would implicitly commit) and
+    the caller is responsible for committing.
+    """
+    if commit:
+        ensure_ledger_table(conn)
     cur = conn.cursor()
     cur.execute(
         """
@@ -46,5 +54,6 @@ def add_entry(
         """,
         (school_id, student_id, entry_type, amount, ref, description, link_type, link_id),
     )
-    conn.commit()
+    if commit:
+        conn.commit()
 
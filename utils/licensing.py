@@ -4,11 +4,32 @@ import base64
 import hashlib
 import os
 from datetime import datetime
+from functools import lru_cache
+
+# orjson is optional; both serializers emit compact, key-sorted JSON and the
+# verifier HMACs the embedded bytes as-is, so tokens stay valid either way.
+try:
+    import orjson
+except Exception:  # pragma: no cover - optional dependency not installed
+    orjson = None
 
 # Read secret key from environment or fallback
 LICENSE_SECRET = os.getenv("LICENSE_SECRET", "my_super_secret_license_key_2025")
 
 
+@lru_cache(maxsize=4)
+def _hmac_template(secret: bytes):
+    # Keyed once per secret; callers copy() it instead of re-deriving the
+    # HMAC key schedule for every token.
+    return hmac.new(secret, b"", hashlib.sha256)
+
+
+def _sign(raw: bytes) -> bytes:
+    mac = _hmac_template(LICENSE_SECRET.encode()).copy()
+    mac.update(raw)
+    return mac.digest()
+
+
 def _b64u_encode(b: bytes) -> str:
     return base64.urlsafe_b64encode(b).rstrip(b'=').decode()
 
@@ -34,8 +55,11 @@ def generate_key(school_uid: str, plan_code: str = "PREMIUM", features=None, exp
         "features": features,
         "expires_at": expires_at,
     }
-    raw = json.dumps(payload, separators=(",", ":"), sort_keys=True).encode()
-    sig = hmac.new(LICENSE_SECRET.encode(), raw, hashlib.sha256).digest()
+    if orjson is not None:
+        raw = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+    else:
+        raw = json.dumps(payload, separators=(",", ":"), sort_keys=True).encode()
+    sig = _sign(raw)
     return f"{_b64u_encode(raw)}.{_b64u_encode(sig)}"
 
 
@@ -44,7 +68,7 @@ def verify_key(token: str):
         raw_b64, sig_b64 = (token or "").split(".")
         raw = _b64u_decode(raw_b64)
         sig = _b64u_decode(sig_b64)
-        expect = hmac.new(LICENSE_SECRET.encode(), raw, hashlib.sha256).digest()
+        expect = _sign(raw)
         if not hmac.compare_digest(sig, expect):
             return False, {"error": "BAD_SIGNATURE"}
         payload = json.loads(raw.decode())
@@ -1,19 +1,27 @@
 from __future__ import annotations
 
+import re
 from typing import Tuple
 from flask import current_app
 
+_NON_DIGIT_RE = re.compile(r"\D+")
 
-def normalize_phone(raw: str | None) -> str | None:
+
+def normalize_phone(raw: str | None, country_code: str | None = None) -> str | None:
+    """Return ``raw`` in international form.
+
+    Pass ``country_code`` when normalizing many numbers (e.g. a CSV import) to
+    skip the per-call app config lookup.
+    """
     if not raw:
         return None
     phone = str(raw).strip()
     if phone.startswith("+"):
         return phone
-    cc = current_app.config.get("DEFAULT_COUNTRY_CODE", "+254")
+    cc = country_code or current_app.config.get("DEFAULT_COUNTRY_CODE", "+254")
     if phone.startswith("0"):
         return f"{cc}{phone[1:]}"
-    digits = "".join(ch for ch in phone if ch.isdigit())
+    digits = _NON_DIGIT_RE.sub("", phone)
     if 9 <= len(digits) <= 10:
         return f"{cc}{digits[-9:]}"
     return phone
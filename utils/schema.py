@@ -1,6 +1,12 @@
 ﻿from __future__ import annotations
 
-from typing import Tuple
+from typing import Dict, FrozenSet, Optional, Tuple
+
+# Column names per table, read once per process from information_schema. Names
+# are lower-cased (MySQL compares column names case-insensitively), so callers
+# test membership with lower-case names. Call clear_columns_cache() after DDL
+# that adds/drops columns (bootstrap and the ensure_* helpers do).
+_COLUMNS_CACHE: Dict[str, FrozenSet[str]] = {}
 
 
 def get_admission_select_and_column(cur) -> Tuple[str, str]:
@@ -29,3 +35,47 @@ def get_admission_select_and_column(cur) -> Tuple[str, str]:
         pass
     # Fallback to NULL if none exist to avoid hard failures in SELECT lists
     return ("NULL AS regNo", "admission_no")
+
+
+def table_columns(cur, table: str) -> FrozenSet[str]:
+    """Return the lower-cased column names of ``table`` in the current database.
+
+    Replaces repeated ``SHOW COLUMNS ... LIKE`` probes: the schema does not change
+    between requests, so the result is cached per process. Empty results (table
+    missing) are not cached. Works with tuple and dictionary cursors.
+    """
+    key = table.lower()
+    cached = _COLUMNS_CACHE.get(key)
+    if cached is not None:
+        return cached
+    cur.execute(
+        "SELECT COLUMN_NAME AS name FROM information_schema.columns "
+        "WHERE table_schema=DATABASE() AND table_name=%s",
+        (table,),
+    )
+    rows = cur.fetchall() or []
+    cols = frozenset(str(r["name"] if isinstance(r, dict) else r[0]).lower() for r in rows)
+    if cols:
+        _COLUMNS_CACHE[key] = cols
+    return cols
+
+
+def student_columns(cur) -> FrozenSet[str]:
+    """Cached column names of the ``students`` table."""
+    return table_columns(cur, "students")
+
+
+def clear_columns_cache(table: Optional[str] = None) -> None:
+    """Forget cached column sets (all tables, or just ``table``)."""
+    if table is None:
+        _COLUMNS_CACHE.clear()
+    else:
+        _COLUMNS_CACHE.pop(table.lower(), None)
+
+
+def balance_column(cur) -> str:
+    """Name of the students balance column: ``balance``, or legacy ``fee_balance``.
+
+    Backed by the cached column set, so no per-request ``SHOW COLUMNS`` probe.
+    """
+    return "balance" if "balance" in student_columns(cur) else "fee_balance"
@@ -1,7 +1,8 @@
 from __future__ import annotations
 
 import os
-from typing import Optional, Dict
+import time
+from typing import Optional, Dict, Tuple
 
 import mysql.connector
 from flask import current_app, session
@@ -63,16 +64,83 @@ def ensure_school_settings_table(db):
     db.commit()
 
 
-def get_setting(key: str, default: Optional[str] = None) -> Optional[str]:
+# Settings snapshots: key None holds app_settings, an int key holds that school's
+# school_settings. Each snapshot is loaded in one query and reused for the TTL;
+# writes through set_setting/set_school_setting drop the affected snapshot.
+_SETTINGS_CACHE_TTL = 60.0
+_SETTINGS_CACHE: Dict[Optional[int], Tuple[float, Dict[str, Optional[str]]]] = {}
+# Credentials are always read from the database so a password change is
+# honoured by every worker process immediately.
+_UNCACHED_KEYS = frozenset({"APP_LOGIN_PASSWORD", "ADMIN_PASSWORD"})
+
+
+def invalidate_settings_cache(school_id: Optional[int] = None) -> None:
+    """Forget cached settings for one school, or everything when ``school_id`` is None."""
+    if school_id is None:
+        _SETTINGS_CACHE.clear()
+    else:
+        _SETTINGS_CACHE.pop(school_id, None)
+
+
+def _cached_snapshot(scope: Optional[int]) -> Optional[Dict[str, Optional[str]]]:
+    hit = _SETTINGS_CACHE.get(scope)
+    if hit and hit[0] >= time.monotonic():
+        return hit[1]
+    return None
+
+
+def _load_snapshots(sid: Optional[int]) -> Tuple[Dict[str, Optional[str]], Dict[str, Optional[str]]]:
+    """Return (school settings, global settings), loading any expired snapshot."""
+    school = _cached_snapshot(sid) if sid else {}
+    glob = _cached_snapshot(None)
+    if school is not None and glob is not None:
+        return school, glob
+    db = _db()
     try:
-        db = _db()
-        try:
-            # Prefer school-specific value when a school context exists
+        if school is None:
             try:
-                sid = session.get("school_id")
+                ensure_school_settings_table(db)
+                cur = db.cursor()
+                cur.execute("SELECT `key`, `value` FROM school_settings WHERE school_id=%s", (sid,))
+                school = {str(k): (None if v is None else str(v)) for k, v in (cur.fetchall() or [])}
+                _SETTINGS_CACHE[sid] = (time.monotonic() + _SETTINGS_CACHE_TTL, school)
             except Exception:
-                sid = None
+                # fall through to global
+                school = {}
+        if glob is None:
+            ensure_app_settings_table(db)
+            cur = db.cursor()
+            cur.execute("SELECT `key`, `value` FROM app_settings")
+            glob = {str(k): (None if v is None else str(v)) for k, v in (cur.fetchall() or [])}
+            _SETTINGS_CACHE[None] = (time.monotonic() + _SETTINGS_CACHE_TTL, glob)
+    finally:
+        db.close()
+    return school, glob
+
+
+def get_setting(key: str, default: Optional[str] = None) -> Optional[str]:
+    # Prefer school-specific value when a school context exists
+    try:
+        sid = session.get("school_id")
+    except Exception:
+        sid = None
+    if key in _UNCACHED_KEYS:
+        return _read_setting(key, sid, default)
+    try:
+        school, glob = _load_snapshots(sid)
+    except Exception:
+        return default
+    value = school.get(key)
+    if value is None:
+        value = glob.get(key)
+    return default if value is None else value
+
 
+def _read_setting(key: str, sid: Optional[int], default: Optional[str] = None) -> Optional[str]:
+    """Read one setting straight from the database (no cache)."""
+    try:
+        db = _db()
+        try:
             if sid:
                 try:
                     ensure_school_settings_table(db)
@@ -111,6 +179,7 @@ def set_setting(key: str, value: Optional[str]) -> None:
             (key, value),
         )
         db.commit()
+        _SETTINGS_CACHE.pop(None, None)
     finally:
         db.close()
 
@@ -138,6 +207,7 @@ def set_school_setting(key: str, value: Optional[str], school_id: Optional[int]
             (sid, key, value),
         )
         db.commit()
+        _SETTINGS_CACHE.pop(sid, None)
     finally:
         db.close()
 
@@ -147,20 +217,10 @@ def get_settings(keys: list[str]) -> Dict[str, Optional[str]]:
     if not keys:
         return out
     try:
-        db = _db()
-        try:
-            ensure_app_settings_table(db)
-            placeholders = ",".join(["%s"] * len(keys))
-            cur = db.cursor()
-            cur.execute(f"SELECT `key`, `value` FROM app_settings WHERE `key` IN ({placeholders})", tuple(keys))
-            rows = cur.fetchall() or []
-            for k in keys:
-                out[k] = None
-            for k, v in rows:
-                out[str(k)] = None if v is None else str(v)
-            return out
-        finally:
-            db.close()
+        _school, glob = _load_snapshots(None)
+        for k in keys:
+            out[k] = glob.get(k)
+        return out
     except Exception:
         for k in keys:
             out[k] = None
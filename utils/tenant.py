@@ -6,6 +6,7 @@ from datetime import date
 
 from utils.settings import ensure_school_settings_table, set_school_setting
 from utils.security import hash_password
+from utils.schema import clear_columns_cache
 from utils.users import (
     ensure_user_tables,
     get_user_by_username,
@@ -65,6 +66,7 @@ def ensure_school_id_column(conn, table: str) -> None:
     has = bool(cur.fetchone())
     if not has:
         cur.execute(f"ALTER TABLE {table} ADD COLUMN school_id INT NULL")
+        clear_columns_cache(table)
         try:
             cur.execute(
                 f"ALTER TABLE {table} ADD CONSTRAINT fk_{table}_school_id FOREIGN KEY (school_id) REFERENCES schools(id) ON DELETE SET NULL"
@@ -368,6 +370,18 @@ def ensure_unique_indices_per_school(conn) -> None:
                 conn.commit()
         except Exception:
             pass
+        # Covers the analytics class-summary join (per student, current term)
+        # so it is resolved from the index without touching payment rows
+        try:
+            cur.execute("SHOW INDEX FROM payments WHERE Key_name='idx_pay_school_year_term_student'")
+            if not cur.fetchone():
+                cur.execute(
+                    "CREATE INDEX idx_pay_school_year_term_student "
+                    "ON payments(school_id, year, term, student_id, method, amount)"
+                )
+                conn.commit()
+        except Exception:
+            pass
     except Exception:
         try:
             conn.rollback()
@@ -379,61 +393,61 @@ def ensure_perf_indices(conn) -> None:
     ensure_unique_indices_per_school(conn)
 
 
-def ensure_fulltext_students(conn) -> None:
-    """Create an optional FULLTEXT index on students(name, admission_no).
+def has_students_admission_unique(conn) -> bool:
+    """Return True when the ``uq_students_school_admission`` key exists.
 
-    Safe to call repeatedly; silently skips if not supported or already exists.
+    ``ensure_unique_indices_per_school`` cannot create it while a school already
+    holds duplicate admission numbers; callers relying on the key to reject
+    duplicates must fall back to an explicit lookup when this is False.
     """
+    cur = None
     try:
         cur = conn.cursor()
-        # Check if a FULLTEXT index already exists on (name, admission_no)
-        try:
-            cur.execute(
-                "SHOW INDEX FROM students WHERE Index_type='FULLTEXT' AND (Column_name='name' OR Column_name='admission_no')"
-            )
-            if cur.fetchone():
-                return
-        except Exception:
-            # SHOW INDEX not supported or table missing; abort quietly
-            return
-
-        # Attempt to create a combined FULLTEXT index
-        try:
-            cur.execute("CREATE FULLTEXT INDEX ft_students_name_adm ON students(name, admission_no)")
-            conn.commit()
-        except Exception:
-            try:
-                conn.rollback()
-            except Exception:
-                pass
+        cur.execute("SHOW INDEX FROM students WHERE Key_name='uq_students_school_admission'")
+        return bool(cur.fetchall())
     except Exception:
-        # Non-fatal: environments without privileges/engine support
+        return False
+    finally:
         try:
-            conn.rollback()
+            if cur is not None:
+                cur.close()
         except Exception:
             pass
 
-    # students composite index/unique on (school_id, admission_no) if column exists
+
+def ensure_fulltext_students(conn) -> bool:
+    """Create an optional FULLTEXT index on students(name, admission_no, class_name).
+
+    Safe to call repeatedly; silently skips if not supported. Returns True when the
+    ``ft_students`` index is available for ``MATCH ... AGAINST`` searches.
+    """
+    available = False
+    cur = None
     try:
-        cur.execute("SHOW COLUMNS FROM students LIKE 'admission_no'")
-        has_adm = bool(cur.fetchone())
-        if has_adm:
-            # Try unique first; if fails (due to dupes), fall back to non-unique index
+        cur = conn.cursor()
+        try:
+            cur.execute("SHOW INDEX FROM students WHERE Key_name='ft_students'")
+            available = bool(cur.fetchall())
+        except Exception:
+            # SHOW INDEX not supported or table missing; abort quietly
+            return False
+
+        if not available:
             try:
-                cur.execute("SHOW INDEX FROM students WHERE Key_name='uq_school_admno'")
-                if not cur.fetchone():
-                    cur.execute("CREATE UNIQUE INDEX uq_school_admno ON students(school_id, admission_no)")
-                    conn.commit()
+                cur.execute("CREATE FULLTEXT INDEX ft_students ON students(name, admission_no, class_name)")
+                conn.commit()
+                available = True
             except Exception:
                 try:
-                    cur.execute("SHOW INDEX FROM students WHERE Key_name='idx_school_admno'")
-                    if not cur.fetchone():
-                        cur.execute("CREATE INDEX idx_school_admno ON students(school_id, admission_no)")
-                        conn.commit()
+                    conn.rollback()
                 except Exception:
                     pass
     except Exception:
+        # Non-fatal: environments without privileges/engine support
         try:
             conn.rollback()
         except Exception:
             pass
+        return False
+
+    return available